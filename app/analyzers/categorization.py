@@ -0,0 +1,110 @@
+from typing import Dict, Optional, Tuple
+import json
+import os
+
+from .domain_reputation import CATEGORY_ACTIONS
+from .mitre_analyzer import MITRE_SCORE_WEIGHTS
+
+# Nedre grense per kategori, høyest først; tolkes som prosent eller antall etter basis
+DEFAULT_THRESHOLDS = ((20, 'KRITISK'), (10, 'HØY'), (3, 'MEDIUM'), (0, 'LAV'))
+POLICY_BASES = ('percent', 'count')
+DEFAULT_POLICY_VERSION = '1'
+
+
+def parse_risk_score(risk_score) -> Optional[Tuple[int, int]]:
+    """(positive, totalt) fra VirusTotal-scoren 'p/t', None hvis den mangler eller er ugyldig"""
+    positives, separator, total = str(risk_score or '').partition('/')
+    if not separator:
+        return None
+    try:
+        return int(positives), int(total)
+    except ValueError:
+        return None
+
+
+class CategorizationPolicy:
+    """
+    Versjonert policy for hvordan VirusTotal-resultater blir til risikokategori,
+    tiltak og ATT&CK-score. En versjon endres aldri etter at den er tatt i bruk;
+    nye grenser får ny versjon, og lagrede analyser kan omkategoriseres til den
+    (se recategorize.py) uten nye VirusTotal-oppslag.
+    """
+
+    def __init__(self, version: str, basis: str = 'percent', thresholds=DEFAULT_THRESHOLDS,
+                 actions: Dict[str, str] = None, mitre_weights: Dict[str, float] = None, description: str = ''):
+        if basis not in POLICY_BASES:
+            raise ValueError(f"Ukjent basis '{basis}' - bruk {' eller '.join(POLICY_BASES)}")
+        self.version = str(version)
+        self.basis = basis
+        self.thresholds = tuple(sorted(((float(minimum), category) for minimum, category in thresholds),
+                                       reverse=True))
+        self.actions = dict(CATEGORY_ACTIONS, **(actions or {}))
+        self.mitre_weights = dict(mitre_weights or MITRE_SCORE_WEIGHTS)
+        self.description = description
+
+    def category_for(self, positives: int, total: int) -> str:
+        value = positives if self.basis == 'count' else ((positives / total) * 100 if total > 0 else 0)
+        for minimum, category in self.thresholds:
+            if value >= minimum:
+                return category
+        return self.thresholds[-1][1]
+
+    def categorize(self, result: Dict):
+        """
+        Setter risikokategori, anbefalt handling og policyversjon fra VirusTotal-resultatet.
+        Også FEIL og UKJENT får policyversjonen, så alle VirusTotal-verdikter kan telles per versjon.
+        """
+        result['policy_version'] = self.version
+        if result['status'] != 'completed':
+            result['risk_category'] = 'FEIL'
+            result['action_required'] = f'Analyse feilet - {result.get("error_message", "ukjent feil")}'
+            return
+        score = parse_risk_score(result.get('risk_score'))
+        if score is None:
+            result['risk_category'] = 'UKJENT'
+            result['action_required'] = 'Kunne ikke bestemme risiko - manuell vurdering nødvendig'
+            return
+        category = self.category_for(*score)
+        result['risk_category'] = category
+        result['action_required'] = self.actions[category]
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': self.version,
+            'basis': self.basis,
+            'thresholds': [[minimum, category] for minimum, category in self.thresholds],
+            'actions': self.actions,
+            'mitre_weights': self.mitre_weights,
+            'description': self.description
+        }
+
+
+BUILTIN_POLICIES = {
+    '1': CategorizationPolicy('1', 'percent', description='Andel av skannerne som slo ut (opprinnelig logikk)'),
+    '2': CategorizationPolicy('2', 'count', description='Antall deteksjoner, som i tabellen i README')
+}
+
+
+def load_policies(path: str = None) -> Dict[str, CategorizationPolicy]:
+    """
+    Innebygde policyer pluss de i JSON-filen path ({versjon: {basis, thresholds,
+    actions, mitre_weights, description}}). Innebygde versjoner kan ikke overstyres.
+    """
+    policies = dict(BUILTIN_POLICIES)
+    if not path or not os.path.exists(path):
+        return policies
+    try:
+        with open(path, encoding='utf-8') as f:
+            definitions = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Kunne ikke lese kategoriseringspolicyer fra {path}: {str(e)}")
+        return policies
+    for version, definition in definitions.items():
+        if version in BUILTIN_POLICIES:
+            print(f"Policy {version} er innebygd og kan ikke overstyres - hoppet over")
+            continue
+        try:
+            policies[version] = CategorizationPolicy(version, **definition)
+        except (TypeError, ValueError) as e:
+            print(f"Ugyldig kategoriseringspolicy {version}: {str(e)}")
+    return policies
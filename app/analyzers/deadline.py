@@ -0,0 +1,37 @@
+from typing import Optional
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Analysen rakk ikke å bli ferdig innen fristen; den fullføres i bakgrunnen"""
+
+
+class Deadline:
+    """
+    Tidsfrist for en analyse, målt med monotonic. Sendes ned gjennom VirusTotal-kall,
+    venting på skanning og ATT&CK-analysen slik at ingen steg venter forbi fristen.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def cap(self, timeout: Optional[float]) -> float:
+        """Korteste av timeout og gjenstående tid"""
+        remaining = self.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def check(self, step: str = 'analysen'):
+        if self.expired():
+            raise DeadlineExceeded(f"Tidsfristen på {self.seconds:g}s gikk ut under {step}")
+
+
+def cap_timeout(deadline: Optional[Deadline], timeout: Optional[float]) -> Optional[float]:
+    """timeout begrenset av fristen, eller uendret uten frist"""
+    return timeout if deadline is None else deadline.cap(timeout)
@@ -0,0 +1,203 @@
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+import ipaddress
+
+# Suffikser der registrert domene består av tre etiketter (eTLD+1).
+# Inkluderer også vanlige gratis-hosting-domener, slik at hver leietaker
+# får sitt eget omdømme i stedet for å dele ett for hele plattformen.
+MULTI_LABEL_SUFFIXES = {
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'me.uk', 'net.uk',
+    'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au',
+    'co.nz', 'org.nz', 'co.jp', 'ne.jp', 'or.jp', 'co.kr', 'co.in',
+    'com.br', 'com.cn', 'com.mx', 'com.tr', 'com.ar', 'com.sg', 'com.hk',
+    'co.za', 'co.il', 'com.ua', 'com.pl', 'priv.no',
+    'github.io', 'gitlab.io', 'blogspot.com', 'herokuapp.com', 'netlify.app',
+    'vercel.app', 'pages.dev', 'workers.dev', 'web.app', 'firebaseapp.com',
+    'appspot.com', 'azurewebsites.net', 'cloudfront.net', 'ngrok.io',
+    '000webhostapp.com', 'weebly.com', 'wixsite.com', 'glitch.me', 'repl.co'
+}
+
+# Kategorier som regnes som faktiske verdikter fra VirusTotal
+VERDICT_CATEGORIES = ('KRITISK', 'HØY', 'MEDIUM', 'LAV')
+
+# Tiltak per kategori, samme tekster som SOCAnalyzer bruker
+CATEGORY_ACTIONS = {
+    'LAV': 'Ingen umiddelbar handling nødvendig',
+    'MEDIUM': 'Undersøk nærmere - mulig falsk positiv',
+    'HØY': 'Umiddelbar handling påkrevd!',
+    'KRITISK': 'KRITISK: Umiddelbar isolasjon og handling påkrevd!'
+}
+
+
+def normalize_host(url: str) -> str:
+    """Henter ut vertsnavnet fra en URL, med eller uten skjema"""
+    url = (url or '').strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'http://' + url
+    try:
+        host = urlparse(url).hostname or ''
+    except ValueError:
+        return ''
+    host = host.rstrip('.').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+
+def registered_domain(url: str) -> str:
+    """Returnerer registrert domene (eTLD+1) for en URL, eller IP-adressen"""
+    host = normalize_host(url)
+    if not host:
+        return ''
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+
+    labels = host.split('.')
+    if len(labels) <= 2:
+        return host
+    if '.'.join(labels[-2:]) in MULTI_LABEL_SUFFIXES:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+def parse_risk_score(risk_score) -> Optional[Tuple[int, int]]:
+    """Parser 'positive/totalt' fra risk_score, None hvis ugyldig"""
+    try:
+        positives, total = map(int, str(risk_score).split('/'))
+        return positives, total
+    except (TypeError, ValueError):
+        return None
+
+
+def empty_aggregate(domain: str) -> Dict:
+    return {
+        'domain': domain,
+        'total_analyses': 0,
+        'positives_sum': 0,
+        'total_scans_sum': 0,
+        'max_positives': 0,
+        'category_counts': {},
+        'technique_counts': {},
+        'first_seen': None,
+        'last_seen': None
+    }
+
+
+def accumulate(aggregate: Dict, risk_category: str, risk_score, techniques, timestamp=None) -> bool:
+    """
+    Legger én analyse inn i domeneaggregatet.
+    Returnerer False hvis analysen ikke er et verdikt og derfor ble hoppet over.
+    """
+    if risk_category not in VERDICT_CATEGORIES:
+        return False
+
+    scores = parse_risk_score(risk_score)
+    positives, total = scores if scores else (0, 0)
+
+    aggregate['total_analyses'] += 1
+    aggregate['positives_sum'] += positives
+    aggregate['total_scans_sum'] += total
+    aggregate['max_positives'] = max(aggregate['max_positives'], positives)
+
+    # Nye dict-objekter slik at JSON-kolonnene registreres som endret
+    category_counts = dict(aggregate.get('category_counts') or {})
+    category_counts[risk_category] = category_counts.get(risk_category, 0) + 1
+    aggregate['category_counts'] = category_counts
+
+    technique_counts = dict(aggregate.get('technique_counts') or {})
+    for technique in techniques or []:
+        technique_counts[technique] = technique_counts.get(technique, 0) + 1
+    aggregate['technique_counts'] = technique_counts
+
+    if timestamp is not None:
+        if aggregate['first_seen'] is None or timestamp < aggregate['first_seen']:
+            aggregate['first_seen'] = timestamp
+        if aggregate['last_seen'] is None or timestamp > aggregate['last_seen']:
+            aggregate['last_seen'] = timestamp
+    return True
+
+
+class DomainReputationPolicy:
+    """
+    Avgjør om en URL kan besvares eller forhåndsscores fra domenets omdømme
+    uten å bruke VirusTotal-kvote.
+    """
+
+    def __init__(self, lookup: Callable[[str], Optional[Dict]], min_analyses: int = 5,
+                 min_agreement: float = 0.9, answer_categories=('KRITISK', 'HØY', 'LAV')):
+        self.lookup = lookup
+        self.min_analyses = min_analyses
+        self.min_agreement = min_agreement
+        self.answer_categories = tuple(answer_categories)
+
+    def evaluate(self, url: str) -> Optional[Dict]:
+        """
+        Returnerer None for ukjente domener, ellers et verdikt med
+        decision 'answer' (sterkt etablert) eller 'prescore' (tvetydig).
+        """
+        domain = registered_domain(url)
+        if not domain:
+            return None
+
+        try:
+            aggregate = self.lookup(domain)
+        except Exception as e:
+            print(f"Feil ved oppslag av domeneomdømme for {domain}: {str(e)}")
+            return None
+
+        if not aggregate or not aggregate.get('total_analyses'):
+            return None
+
+        total = aggregate['total_analyses']
+        category_counts = aggregate.get('category_counts') or {}
+        dominant_category, dominant_count = max(category_counts.items(), key=lambda x: x[1])
+        agreement = dominant_count / total
+
+        decision = 'prescore'
+        if (total >= self.min_analyses and agreement >= self.min_agreement
+                and dominant_category in self.answer_categories):
+            decision = 'answer'
+
+        technique_counts = aggregate.get('technique_counts') or {}
+        return {
+            'domain': domain,
+            'decision': decision,
+            'dominant_category': dominant_category,
+            'agreement': round(agreement, 3),
+            'analyses': total,
+            'avg_positives': aggregate['positives_sum'] / total,
+            'avg_total_scans': aggregate['total_scans_sum'] / total,
+            'max_positives': aggregate['max_positives'],
+            'common_techniques': [
+                tech for tech, count in technique_counts.items()
+                if count / total >= 0.5
+            ]
+        }
+
+    def build_result(self, url: str, verdict: Dict) -> Dict:
+        """Bygger et analyseresultat fra et etablert domeneverdikt"""
+        url = url.strip()
+        if not url.startswith(('http://', 'https://')):
+            url = 'http://' + url
+
+        positives = int(round(verdict['avg_positives']))
+        total = int(round(verdict['avg_total_scans']))
+        return {
+            'url': url,
+            'status': 'completed',
+            'source': 'domain_reputation',
+            'positives': positives,
+            'total_scans': total,
+            'scan_date': '',
+            'risk_score': f"{positives}/{total}",
+            'permalink': '',
+            'risk_category': verdict['dominant_category'],
+            'action_required': (
+                f"{CATEGORY_ACTIONS[verdict['dominant_category']]} "
+                f"(basert på domeneomdømme for {verdict['domain']})"
+            )
+        }
+
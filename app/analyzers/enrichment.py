@@ -0,0 +1,471 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import ipaddress
+import json
+import logging
+import socket
+import threading
+import time
+
+import requests
+
+from .domain_reputation import normalize_host, registered_domain
+from .structured_log import get_logger, log_event
+
+logger = get_logger('enrichment')
+
+# Verdier hver kjøring starter med; stegene bygger videre på dem og på hverandres utdata
+BASE_INPUTS = ('url', 'host', 'domain')
+STAGE_TIMEOUT = 2.0
+CACHE_TTL = 3600.0
+CACHE_ENTRIES = 10000
+
+
+class EnrichmentStage:
+    """
+    Et berikelsessteg: leser inputs (grunnverdiene eller utdata fra andre steg) og
+    returnerer en dict med outputs. Steg uten avhengigheter seg imellom kjøres
+    samtidig. Et steg som feiler, går ut på tid eller mangler en input gir ingen
+    utdata, og steg som trenger utdataene hoppes over.
+    """
+    name = ''
+    inputs: Tuple[str, ...] = ('url',)
+    outputs: Tuple[str, ...] = ()
+
+    def __init__(self, timeout: float = STAGE_TIMEOUT, cache_ttl: float = CACHE_TTL):
+        self.timeout = timeout
+        # 0 slår av cachen for steget
+        self.cache_ttl = cache_ttl
+
+    def run(self, values: Dict) -> Dict:
+        raise NotImplementedError
+
+
+def _present(value) -> bool:
+    """Tomme svar (ingen IP-adresser, ukjent dato) gir ingenting å bygge videre på"""
+    return value is not None and value != '' and value != [] and value != {}
+
+
+def _ip(value: str) -> Optional[str]:
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return None
+
+
+class DnsStage(EnrichmentStage):
+    """
+    A/AAAA-oppslag av vertsnavnet. Med resolver_url brukes et DNS-over-HTTPS JSON-API
+    (Cloudflare/Google-formatet), ellers systemets resolver. Systemresolveren kan ikke
+    avbrytes, så tidsfristen gjelder bare hvor lenge analysen venter på den.
+    """
+    name = 'dns'
+    inputs = ('host',)
+    outputs = ('ip_addresses',)
+
+    def __init__(self, resolver_url: str = None, **options):
+        super().__init__(**options)
+        self.resolver_url = resolver_url
+
+    def run(self, values: Dict) -> Dict:
+        host = values['host']
+        if _ip(host):
+            return {'ip_addresses': [_ip(host)]}
+        if self.resolver_url:
+            return {'ip_addresses': self._resolve_doh(host)}
+        try:
+            infos = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+        except socket.gaierror:
+            # Finnes ikke (NXDOMAIN) er også et svar
+            return {'ip_addresses': []}
+        return {'ip_addresses': sorted({info[4][0] for info in infos})}
+
+    def _resolve_doh(self, host: str) -> List[str]:
+        addresses = set()
+        for record_type in ('A', 'AAAA'):
+            response = requests.get(
+                self.resolver_url, params={'name': host, 'type': record_type},
+                headers={'Accept': 'application/dns-json'}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            for answer in response.json().get('Answer') or []:
+                if answer.get('type') in (1, 28) and _ip(answer.get('data', '')):
+                    addresses.add(_ip(answer['data']))
+        return sorted(addresses)
+
+
+class RdapAgeStage(EnrichmentStage):
+    """Registreringsdato og alder i dager for domenet via RDAP (etterfølgeren til WHOIS)"""
+    name = 'whois'
+    inputs = ('domain',)
+    outputs = ('domain_created', 'domain_age_days')
+
+    def __init__(self, base_url: str = 'https://rdap.org/', **options):
+        options.setdefault('cache_ttl', 86400.0)
+        super().__init__(**options)
+        self.base_url = base_url.rstrip('/') + '/'
+
+    def run(self, values: Dict) -> Dict:
+        domain = values['domain']
+        if not domain or _ip(domain):
+            return {}
+        response = requests.get(f'{self.base_url}domain/{domain}', timeout=self.timeout)
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        for event in response.json().get('events') or []:
+            if event.get('eventAction') == 'registration' and event.get('eventDate'):
+                created = datetime.fromisoformat(event['eventDate'].replace('Z', '+00:00'))
+                if created.tzinfo is None:
+                    created = created.replace(tzinfo=timezone.utc)
+                return {
+                    'domain_created': created.strftime("%Y-%m-%d"),
+                    'domain_age_days': (datetime.now(timezone.utc) - created).days
+                }
+        return {}
+
+
+class PassiveDnsStage(EnrichmentStage):
+    """
+    Historiske DNS-svar for vertsnavnet fra en passiv DNS-tjeneste i CIRCL-formatet
+    (én JSON-post per linje med rrname, rrtype, rdata, time_first og time_last).
+    """
+    name = 'passive_dns'
+    inputs = ('host',)
+    outputs = ('passive_dns', 'historic_ips')
+
+    def __init__(self, base_url: str, token: str = None, limit: int = 100, **options):
+        super().__init__(**options)
+        self.base_url = base_url.rstrip('/') + '/'
+        self.token = token
+        self.limit = limit
+
+    def run(self, values: Dict) -> Dict:
+        host = values['host']
+        if not host or _ip(host):
+            return {}
+        headers = {'Authorization': self.token} if self.token else {}
+        response = requests.get(f'{self.base_url}{host}', headers=headers, timeout=self.timeout)
+        if response.status_code == 404:
+            return {'passive_dns': [], 'historic_ips': []}
+        response.raise_for_status()
+        records = []
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('rrtype') in ('A', 'AAAA', 'CNAME'):
+                records.append({key: record.get(key) for key in ('rrtype', 'rdata', 'time_first', 'time_last')})
+        records = records[:self.limit]
+        return {
+            'passive_dns': records,
+            'historic_ips': sorted({_ip(record['rdata']) for record in records
+                                    if record['rrtype'] != 'CNAME' and _ip(record['rdata'] or '')})
+        }
+
+
+class StageCache:
+    """LRU-cache med levetid for utdata fra ett steg, nøklet på stegets inputs"""
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _cache_key(stage: EnrichmentStage, values: Dict):
+    return json.dumps([values.get(name) for name in stage.inputs], sort_keys=True, default=str)
+
+
+class EnrichmentRun:
+    """
+    Én URL gjennom DAG-en. Et steg sendes til trådpoolen så snart alle inputene
+    finnes, fra tråden som fullførte det siste steget det ventet på, så ingen tråd
+    koordinerer. wait() samler utdataene og gir opp steg som går over tidsfristen.
+    """
+
+    def __init__(self, pipeline: 'EnrichmentPipeline', url: str):
+        self.pipeline = pipeline
+        host = normalize_host(url)
+        self.values = {'url': url, 'host': host, 'domain': registered_domain(host) if host else ''}
+        # stegnavn -> {'status', 'ms', 'cached'}; status: running, ok, error, timeout, skipped
+        self.stages = {}
+        self.started = time.perf_counter()
+        # Når siste steg ble ferdig; wait() kan kalles senere (etter VirusTotal-svaret)
+        self.finished = self.started
+        self._deadlines = {}
+        self._condition = threading.Condition()
+
+    def start(self) -> 'EnrichmentRun':
+        with self._condition:
+            ready = self._ready_stages()
+        for stage in ready:
+            self._launch(stage)
+        return self
+
+    def _ready_stages(self) -> List[EnrichmentStage]:
+        """Steg som kan startes nå; steg med en input som aldri kommer markeres som hoppet over"""
+        ready = []
+        changed = True
+        while changed:
+            changed = False
+            for stage in self.pipeline.stages:
+                if stage.name in self.stages:
+                    continue
+                missing = [name for name in stage.inputs if not _present(self.values.get(name))]
+                if not missing:
+                    self.stages[stage.name] = {'status': 'running', 'ms': None, 'cached': False}
+                    ready.append(stage)
+                elif all(self._settled(name) for name in missing):
+                    self.stages[stage.name] = {'status': 'skipped', 'ms': None, 'cached': False}
+                    self.pipeline.metrics.record(stage.name, 'skipped')
+                    changed = True
+        return ready
+
+    def _settled(self, name: str) -> bool:
+        """True når verdien name ikke kan komme senere (produsenten er ferdig uten den)"""
+        producer = self.pipeline.producers.get(name)
+        return producer is None or self.stages.get(producer, {}).get('status') not in (None, 'running')
+
+    def _launch(self, stage: EnrichmentStage):
+        key = _cache_key(stage, self.values) if stage.cache_ttl else None
+        cached = self.pipeline.caches[stage.name].get(key) if key else None
+        if cached is not None:
+            self._finish(stage, 'ok', cached, 0.0, cached=True)
+            return
+        with self._condition:
+            self._deadlines[stage.name] = time.monotonic() + stage.timeout
+            # wait() må ta med den nye fristen
+            self._condition.notify_all()
+        inputs = {name: self.values.get(name) for name in stage.inputs}
+        self.pipeline.executor.submit(self._execute, stage, inputs, key)
+
+    def _execute(self, stage: EnrichmentStage, inputs: Dict, key):
+        started = time.perf_counter()
+        try:
+            output = stage.run(inputs) or {}
+            output = {name: output[name] for name in stage.outputs if name in output}
+            status = 'ok'
+        except (requests.Timeout, TimeoutError):
+            # Stegets egen I/O-frist gikk ut før wait() rakk å gi opp
+            output, status = {}, 'timeout'
+            log_event(logger, logging.INFO, 'enrichment.timeout', {'stage': stage.name, 'url': self.values['url']})
+        except Exception as e:
+            output, status = {}, 'error'
+            log_event(logger, logging.INFO, 'enrichment.error', {'stage': stage.name, 'url': self.values['url'],
+                                                                'error': str(e)})
+        elapsed = time.perf_counter() - started
+        if status == 'ok' and key:
+            self.pipeline.caches[stage.name].put(key, output, stage.cache_ttl)
+        self._finish(stage, status, output, elapsed)
+
+    def _finish(self, stage: EnrichmentStage, status: str, output: Dict, elapsed: float, cached: bool = False):
+        with self._condition:
+            entry = self.stages[stage.name]
+            if entry['status'] != 'running':
+                # Gikk ut på tid; svaret er fortsatt lagret i cachen til neste URL
+                return
+            entry.update(status=status, ms=round(elapsed * 1000, 1), cached=cached)
+            self._deadlines.pop(stage.name, None)
+            self.finished = time.perf_counter()
+            self.values.update(output)
+            ready = self._ready_stages()
+            self._condition.notify_all()
+        self.pipeline.metrics.record(stage.name, status, elapsed, cached)
+        for next_stage in ready:
+            self._launch(next_stage)
+
+    def _expire(self, now: float) -> List[str]:
+        """Gir opp steg som har passert fristen; gir navnene"""
+        expired = [name for name, expires in self._deadlines.items() if expires <= now]
+        for name in expired:
+            del self._deadlines[name]
+            self.stages[name]['status'] = 'timeout'
+            self.finished = time.perf_counter()
+            self.pipeline.metrics.record(name, 'timeout')
+            log_event(logger, logging.INFO, 'enrichment.timeout', {'stage': name, 'url': self.values['url']})
+        return expired
+
+    def wait(self, deadline=None) -> Dict:
+        """
+        Venter til alle steg er ferdige, har gått ut på tid eller er hoppet over, høyst
+        til analysens deadline. Gir utdataene og en oversikt over stegene ('enrichment').
+        """
+        while True:
+            with self._condition:
+                if all(entry['status'] != 'running' for entry in self.stages.values()):
+                    break
+                now = time.monotonic()
+                if deadline is not None and deadline.expired():
+                    for name in list(self._deadlines):
+                        self._deadlines[name] = now
+                if not self._expire(now):
+                    timeout = min(self._deadlines.values(), default=now + STAGE_TIMEOUT) - now
+                    if deadline is not None:
+                        timeout = deadline.cap(timeout)
+                    self._condition.wait(max(timeout, 0.001))
+                    continue
+                # Etter et tidsavbrudd sjekkes ferdig-betingelsen på nytt i stedet for å vente;
+                # steget som gikk ut på tid vekker ingen når det til slutt svarer
+                ready = self._ready_stages()
+            for stage in ready:
+                self._launch(stage)
+
+        elapsed = self.finished - self.started
+        stage_ms = sum(entry['ms'] or 0 for entry in self.stages.values())
+        self.pipeline.metrics.record_run(elapsed, stage_ms / 1000)
+        outputs = {name: value for name, value in self.values.items() if name not in BASE_INPUTS}
+        outputs['enrichment'] = {
+            'stages': {name: dict(entry) for name, entry in self.stages.items()},
+            'elapsed_ms': round(elapsed * 1000, 1),
+            # Summen av stegene, dvs. tiden en seriell kjøring ville brukt
+            'stage_ms_sum': round(stage_ms, 1)
+        }
+        return outputs
+
+
+class EnrichmentMetrics:
+    """Tellere per steg og for hele kjøringer, for /enrichment"""
+
+    def __init__(self, names: Iterable[str]):
+        self._lock = threading.Lock()
+        self.stages = {
+            name: {'runs': 0, 'ok': 0, 'error': 0, 'timeout': 0, 'skipped': 0, 'cache_hits': 0,
+                   'total_ms': 0.0, 'max_ms': 0.0}
+            for name in names
+        }
+        self.runs = 0
+        self.elapsed_ms = 0.0
+        self.stage_ms = 0.0
+
+    def record(self, name: str, status: str, elapsed: float = 0.0, cached: bool = False):
+        with self._lock:
+            stage = self.stages[name]
+            stage[status] += 1
+            if status == 'skipped':
+                return
+            stage['runs'] += 1
+            if cached:
+                stage['cache_hits'] += 1
+            elif status != 'timeout':
+                stage['total_ms'] += elapsed * 1000
+                stage['max_ms'] = max(stage['max_ms'], elapsed * 1000)
+
+    def record_run(self, elapsed: float, stage_seconds: float):
+        with self._lock:
+            self.runs += 1
+            self.elapsed_ms += elapsed * 1000
+            self.stage_ms += stage_seconds * 1000
+
+    def status(self) -> Dict:
+        with self._lock:
+            stages = {}
+            for name, stage in self.stages.items():
+                measured = stage['runs'] - stage['cache_hits'] - stage['timeout']
+                stages[name] = dict(stage, total_ms=round(stage['total_ms'], 1), max_ms=round(stage['max_ms'], 1),
+                                    avg_ms=round(stage['total_ms'] / measured, 1) if measured else None)
+            return {
+                'runs': self.runs,
+                'avg_elapsed_ms': round(self.elapsed_ms / self.runs, 1) if self.runs else None,
+                'avg_stage_ms_sum': round(self.stage_ms / self.runs, 1) if self.runs else None,
+                'stages': stages
+            }
+
+
+class EnrichmentPipeline:
+    """
+    Berikelse av URLer (DNS, domenealder, passiv DNS, ...) som en DAG av steg.
+    Hvert steg oppgir inputs og outputs; uavhengige steg kjøres samtidig, så tiden
+    per URL blir den kritiske stien og ikke summen av stegene. Utdataene legges i
+    analyseresultatet og brukes av MitreAttackAnalyzer._identify_techniques.
+    """
+
+    def __init__(self, stages: List[EnrichmentStage], workers: int = 16, cache_entries: int = CACHE_ENTRIES):
+        self.stages = list(stages)
+        self.producers = self._validate(self.stages)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enrichment')
+        self.caches = {stage.name: StageCache(cache_entries) for stage in self.stages}
+        self.metrics = EnrichmentMetrics(stage.name for stage in self.stages)
+
+    @staticmethod
+    def _validate(stages: List[EnrichmentStage]) -> Dict[str, str]:
+        """utdata -> steget som produserer den; feiler ved ukjente inputs, duplikater og sykler"""
+        producers = {}
+        for stage in stages:
+            if not stage.name or stage.name in {other.name for other in stages if other is not stage}:
+                raise ValueError(f"Berikelsessteg må ha et unikt navn: '{stage.name}'")
+            for output in stage.outputs:
+                if output in BASE_INPUTS or output in producers:
+                    raise ValueError(f"Utdata '{output}' produseres av flere steg")
+                producers[output] = stage.name
+        for stage in stages:
+            unknown = [name for name in stage.inputs if name not in BASE_INPUTS and name not in producers]
+            if unknown:
+                raise ValueError(f"Steg '{stage.name}' trenger {', '.join(unknown)}, som ingen steg produserer")
+
+        depends_on = {stage.name: {producers[name] for name in stage.inputs if name in producers} for stage in stages}
+        resolved = set()
+        while len(resolved) < len(stages):
+            progress = [name for name, deps in depends_on.items() if name not in resolved and deps <= resolved]
+            if not progress:
+                cycle = sorted(set(depends_on) - resolved)
+                raise ValueError(f"Berikelsesstegene har en syklus: {', '.join(cycle)}")
+            resolved.update(progress)
+        return producers
+
+    def start(self, url: str) -> EnrichmentRun:
+        """Starter berikelsen av url i bakgrunnen; hent resultatet med wait()"""
+        return EnrichmentRun(self, url).start()
+
+    def enrich(self, url: str, deadline=None) -> Dict:
+        return self.start(url).wait(deadline)
+
+    def status(self) -> Dict:
+        return dict(self.metrics.status(), stage_order=[
+            {'name': stage.name, 'inputs': list(stage.inputs), 'outputs': list(stage.outputs),
+             'timeout': stage.timeout, 'cache_ttl': stage.cache_ttl}
+            for stage in self.stages
+        ])
+
+
+STAGE_TYPES = {'dns': DnsStage, 'whois': RdapAgeStage, 'passive_dns': PassiveDnsStage}
+
+
+def build_pipeline(spec: str, options: Dict[str, Dict] = None, workers: int = 16) -> Optional[EnrichmentPipeline]:
+    """
+    Pipeline fra 'dns:1.5,whois:3,passive_dns' (steg, valgfritt med tidsfrist i
+    sekunder) og options {stegnavn: konstruktørargumenter}. None når ingen steg er valgt.
+    """
+    stages = []
+    for part in (spec or '').split(','):
+        name, _, timeout = part.strip().partition(':')
+        if not name:
+            continue
+        if name not in STAGE_TYPES:
+            raise ValueError(f"Ukjent berikelsessteg '{name}' - bruk {', '.join(STAGE_TYPES)}")
+        stage_options = dict((options or {}).get(name) or {})
+        if timeout:
+            stage_options['timeout'] = float(timeout)
+        stages.append(STAGE_TYPES[name](**stage_options))
+    return EnrichmentPipeline(stages, workers=workers) if stages else None
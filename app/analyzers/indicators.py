@@ -0,0 +1,163 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+import ipaddress
+import re
+
+from .domain_reputation import normalize_host, registered_domain
+from .single_flight import flight_key
+
+# Typer som indekseres; atferdsmønstre (risikonivå, tiltak) er verdikter, ikke indikatorer
+INDICATOR_TYPES = ('url', 'host', 'domain', 'ip', 'file')
+# Analyse-IDer per postingblokk; nye IDer legges til i siste blokk
+POSTING_BLOCK_SIZE = 1024
+HASH_PATTERN = re.compile(r'^(?:[0-9a-f]{32}|[0-9a-f]{40}|[0-9a-f]{64})$')
+
+
+def _ip(value: str) -> Optional[str]:
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return None
+
+
+def extract_indicators(analysis_result: Dict) -> Dict[str, List[Dict]]:
+    """Trekker ut nettverks-, vert- og atferdsindikatorer fra et analyseresultat"""
+    indicators = {
+        'network_indicators': [],
+        'host_indicators': [],
+        'behavioral_patterns': []
+    }
+
+    try:
+        # Nettverksindikatorer: URLen, vertsnavnet, registrert domene og IP-adresser
+        if analysis_result.get('url'):
+            url = analysis_result['url']
+            indicators['network_indicators'].append({'type': 'url', 'value': url})
+            host = normalize_host(url)
+            if host and _ip(host):
+                indicators['network_indicators'].append({'type': 'ip', 'value': host})
+            elif host:
+                indicators['network_indicators'].append({'type': 'host', 'value': host})
+                indicators['network_indicators'].append({'type': 'domain', 'value': registered_domain(url)})
+
+        # Nåværende adresser og (fra passiv DNS) adresser vertsnavnet har pekt på tidligere
+        for field in ('ip_addresses', 'historic_ips'):
+            indicators['network_indicators'].extend([
+                {'type': 'ip', 'value': ip}
+                for ip in analysis_result.get(field) or []
+            ])
+
+        # Host-indikatorer
+        if 'downloaded_files' in analysis_result:
+            indicators['host_indicators'].extend([
+                {'type': 'file', 'value': file_info}
+                for file_info in analysis_result['downloaded_files']
+            ])
+
+        # Atferdsmønstre
+        if 'risk_category' in analysis_result:
+            indicators['behavioral_patterns'].append({
+                'type': 'risk_level',
+                'value': analysis_result['risk_category']
+            })
+
+        if 'action_required' in analysis_result:
+            indicators['behavioral_patterns'].append({
+                'type': 'recommended_action',
+                'value': analysis_result['action_required']
+            })
+
+    except Exception as e:
+        print(f"Feil ved uttrekking av indikatorer: {str(e)}")
+
+    return indicators
+
+
+def normalize_indicator(kind: str, value) -> Optional[str]:
+    """Normalisert verdi for indeksen, eller None hvis verdien ikke kan indekseres"""
+    if kind == 'file' and isinstance(value, dict):
+        value = value.get('sha256') or value.get('sha1') or value.get('md5') or value.get('name')
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    if kind == 'url':
+        return flight_key(value)
+    if kind == 'host':
+        return normalize_host(value) or None
+    if kind == 'domain':
+        return registered_domain(value) or None
+    if kind == 'ip':
+        return _ip(value)
+    if kind == 'file':
+        return value.lower()
+    return None
+
+
+def indicator_keys(analysis_result: Dict) -> List[str]:
+    """Indeksnøkler ('type:verdi') for nettverks- og vertindikatorene i et resultat"""
+    indicators = extract_indicators(analysis_result)
+    keys = []
+    for indicator in indicators['network_indicators'] + indicators['host_indicators']:
+        value = normalize_indicator(indicator['type'], indicator['value'])
+        if value:
+            key = f"{indicator['type']}:{value}"
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+
+def query_keys(query: str, kind: str = None) -> List[str]:
+    """
+    Indeksnøkler et oppslag kan treffe. Uten type gjettes den: IP-adresse, filhash,
+    ellers URL, vertsnavn og registrert domene.
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+    if kind:
+        value = normalize_indicator(kind, query)
+        return [f'{kind}:{value}'] if value else []
+    if _ip(query):
+        return [f'ip:{_ip(query)}']
+    if HASH_PATTERN.match(query.lower()):
+        return [f'file:{query.lower()}']
+    return indicator_keys({'url': query})
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def encode_postings(ids: List[int]) -> bytes:
+    """Stigende analyse-IDer som varint-kodede differanser (første ID absolutt)"""
+    out = bytearray()
+    previous = 0
+    for analysis_id in ids:
+        out += encode_varint(analysis_id - previous)
+        previous = analysis_id
+    return bytes(out)
+
+
+def decode_postings(data: bytes) -> Iterator[int]:
+    current, shift, value = 0, 0, 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        current += value
+        yield current
+        shift, value = 0, 0
+
+
+def split_blocks(ids: List[int]) -> Iterator[Tuple[int, List[int]]]:
+    """(blokknummer, IDer) for en sortert postingliste"""
+    for block, start in enumerate(range(0, len(ids), POSTING_BLOCK_SIZE)):
+        yield block, ids[start:start + POSTING_BLOCK_SIZE]
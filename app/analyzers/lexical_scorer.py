@@ -0,0 +1,126 @@
+from typing import Dict
+from collections import Counter
+from urllib.parse import urlparse, unquote
+import ipaddress
+import math
+
+from .mitre_analyzer import URL_TECHNIQUE_PATTERNS, TECHNIQUE_BASE_SEVERITY
+from .domain_reputation import registered_domain
+
+# Toppnivådomener som er overrepresentert i phishing- og malware-kampanjer
+SUSPICIOUS_TLDS = {
+    'xyz', 'top', 'club', 'online', 'site', 'click', 'link', 'info', 'buzz', 'icu', 'work',
+    'rest', 'fit', 'gq', 'ml', 'cf', 'tk', 'ga', 'live', 'shop', 'support', 'zip', 'mov',
+    'country', 'kim', 'loan', 'win', 'bid', 'review', 'ru', 'su', 'cn'
+}
+
+# Merkenavn som ofte misbrukes i vertsnavn som ikke tilhører merket
+BRAND_KEYWORDS = {
+    'paypal', 'microsoft', 'office365', 'outlook', 'apple', 'icloud', 'google', 'amazon',
+    'netflix', 'facebook', 'instagram', 'dnb', 'nordea', 'vipps', 'bankid', 'posten', 'altinn'
+}
+
+# Ord som ofte finnes i legitimasjonsinnsamling og falske oppdateringer
+LURE_KEYWORDS = ('secure', 'verify', 'account', 'update', 'confirm', 'wallet', 'invoice', 'password')
+
+RISKY_EXTENSIONS = ('.exe', '.scr', '.js', '.vbs', '.hta', '.apk', '.msi', '.bat', '.ps1', '.jar', '.iso')
+
+
+def shannon_entropy(value: str) -> float:
+    """Shannon-entropi i bits per tegn"""
+    if not value:
+        return 0.0
+    counts = Counter(value)
+    length = len(value)
+    return -sum((count / length) * math.log2(count / length) for count in counts.values())
+
+
+class LexicalScorer:
+    """
+    Lokal, avhengighetsfri forhåndsscore (0-100) for en URL basert på
+    URL-mønstrene fra MitreAttackAnalyzer og enkle leksikalske trekk.
+    Brukes til å prioritere VirusTotal-kvote før noen kall gjøres.
+    """
+
+    def score(self, url: str) -> Dict:
+        raw = (url or '').strip()
+        if not raw.startswith(('http://', 'https://')):
+            raw = 'http://' + raw
+        lowered = unquote(raw).lower()
+
+        try:
+            parsed = urlparse(lowered)
+            host = parsed.hostname or ''
+        except ValueError:
+            return {'score': 50, 'features': {'unparseable': True}}
+
+        features = {}
+        score = 0.0
+
+        # Samme URL-mønstre som MITRE-analysen, vektet med teknikkens alvorlighetsgrad
+        techniques = set()
+        for patterns, pattern_techniques in URL_TECHNIQUE_PATTERNS:
+            if any(pattern in lowered for pattern in patterns):
+                techniques.update(pattern_techniques)
+        if techniques:
+            features['techniques'] = sorted(techniques)
+            score += max(TECHNIQUE_BASE_SEVERITY.get(t, 50) for t in techniques) * 0.35
+
+        try:
+            ipaddress.ip_address(host)
+            features['ip_host'] = True
+            score += 20
+        except ValueError:
+            pass
+
+        tld = host.rsplit('.', 1)[-1] if '.' in host else ''
+        if tld in SUSPICIOUS_TLDS:
+            features['suspicious_tld'] = tld
+            score += 12
+
+        domain = registered_domain(lowered)
+        domain_label = domain.split('.')[0] if domain else ''
+        entropy = shannon_entropy(domain_label)
+        features['host_entropy'] = round(entropy, 2)
+        if entropy > 3.5 and len(domain_label) >= 10:
+            score += 10
+
+        brands = [brand for brand in BRAND_KEYWORDS if brand in host and not domain.startswith(brand + '.')]
+        if brands:
+            features['brand_in_host'] = brands
+            score += 18
+
+        lures = [word for word in LURE_KEYWORDS if word in lowered]
+        if lures:
+            features['lure_words'] = lures
+            score += min(12, 4 * len(lures))
+
+        if parsed.path.endswith(RISKY_EXTENSIONS):
+            features['risky_extension'] = True
+            score += 15
+
+        if len(lowered) > 100:
+            features['long_url'] = len(lowered)
+            score += 5 if len(lowered) <= 200 else 10
+
+        if host.count('.') >= 4:
+            features['many_subdomains'] = host.count('.')
+            score += 6
+        if host.count('-') >= 3:
+            features['many_hyphens'] = host.count('-')
+            score += 6
+        if 'xn--' in host:
+            features['punycode'] = True
+            score += 10
+        if '@' in parsed.netloc:
+            features['userinfo'] = True
+            score += 15
+        try:
+            port = parsed.port
+        except ValueError:
+            port = None
+        if port and port not in (80, 443):
+            features['nonstandard_port'] = port
+            score += 6
+
+        return {'score': int(min(100, round(score))), 'features': features}
@@ -1,106 +1,274 @@
 from typing import Dict, List
+from concurrent.futures import Future, wait
+import os
 import requests
 import json
+import logging
+import threading
+import time
 from datetime import datetime
 
+from .technique_store import TechniqueStore, techniques_version
+from .deadline import cap_timeout
+from .structured_log import get_logger, log_event
+
+logger = get_logger('mitre')
+
+# URL-mønstre og teknikkene de indikerer (brukes også av LexicalScorer)
+URL_TECHNIQUE_PATTERNS = [
+    (('download', 'exe', 'bin', 'dll'), [
+        'T1105',  # Ingress Tool Transfer
+        'T1129'   # Shared Modules
+    ]),
+    (('phish', 'login', 'signin'), [
+        'T1566',  # Phishing
+        'T1204.001'  # User Execution: Malicious Link
+    ]),
+    # Crypto mining indikatorer
+    (('crypto', 'miner'), [
+        'T1496',      # Resource Hijacking
+        'T1071.001'   # Web Protocols
+    ])
+]
+
+# Vekter for delscorene i _calculate_risk_score (kan overstyres av en kategoriseringspolicy)
+MITRE_SCORE_WEIGHTS = {
+    'technique_severity': 0.4,  # Alvorlighetsgrad er viktigst
+    'technique_coverage': 0.3,  # Dekningsgrad er nest viktigst
+    'detection_coverage': 0.2,  # Oppdagelsesmuligheter
+    'mitigation_status': 0.1    # Mottiltak minst vektet
+}
+
+# Teknikk-spesifikke vekter
+TECHNIQUE_BASE_SEVERITY = {
+    'T1190': 85,  # Exploit Public-Facing Application
+    'T1133': 75,  # External Remote Services
+    'T1566': 80,  # Phishing
+    'T1105': 70,  # Ingress Tool Transfer
+    'T1496': 65,  # Resource Hijacking
+    'T1071.001': 55,  # Web Protocols
+    'T1102': 50,  # Web Service
+    'T1129': 60,  # Shared Modules
+    'T1587': 75,  # Develop Capabilities
+    'T1588': 70,  # Obtain Capabilities
+    'T1204.001': 75,  # User Execution: Malicious Link
+    'T1583.001': 65,  # Acquire Infrastructure: Domains
+    'T1568.001': 60   # Dynamic Resolution: Fast Flux DNS
+}
+
+# Berikelse (analyzers.enrichment): domener yngre enn dette regnes som nyregistrerte,
+# og så mange ulike IP-adresser for ett vertsnavn tyder på fast flux
+NEW_DOMAIN_DAYS = 30
+FAST_FLUX_IPS = 10
+
 class MitreAttackAnalyzer:
-    def __init__(self):
+    def __init__(self, offline: bool = None, store_path: str = None, background: bool = False,
+                 ready_timeout: float = None):
         # Oppdatert base URL til MITRE's faktiske API
         self.base_url = "https://raw.githubusercontent.com/mitre/cti/master/"
         self.enterprise_data = None
         self.techniques_cache = {}
         self.tactics_cache = {}
-        self._initialize_mitre_data()
+        # 'mitre' når ATT&CK-data er lastet ned, 'fallback' ellers
+        self.data_source = None
+        
+        # Fullføres når ATT&CK-data er lastet; analyser venter høyst ready_timeout sekunder
+        self.ready = Future()
+        if ready_timeout is None:
+            ready_timeout = float(os.environ.get('MITRE_READY_TIMEOUT', 5))
+        self.ready_timeout = ready_timeout
+        self.load_seconds = None
+        self.load_error = None
+        # Satt når en analyse har gått videre uten ATT&CK-data; advarselen logges én gang per tilstand
+        self._not_ready_warned = False
+        
+        # Offline-modus (f.eks. benchmarks) hopper over nedlasting og bruker fallback data
+        if offline is None:
+            offline = os.environ.get('MITRE_OFFLINE', '').lower() in ('1', 'true', 'yes')
+        if background:
+            threading.Thread(
+                target=self._load_in_background, args=(offline, store_path),
+                name='mitre-loader', daemon=True
+            ).start()
+        else:
+            self._load(offline, store_path)
+            self.ready.set_result(True)
+    
+    def _load(self, offline: bool, store_path: str = None):
+        if store_path:
+            self._initialize_from_store(store_path, offline)
+        elif offline:
+            self._initialize_fallback_data()
+        else:
+            self._initialize_mitre_data()
+    
+    def _load_in_background(self, offline: bool, store_path: str):
+        """
+        Laster dataen i en egen instans og bytter inn cachen når den er komplett,
+        slik at analyser aldri ser halvveis lastede teknikker
+        """
+        start = time.time()
+        try:
+            loaded = MitreAttackAnalyzer(offline=offline, store_path=store_path)
+            self.techniques_cache = loaded.techniques_cache
+            self.data_source = loaded.data_source
+        except Exception as e:
+            log_event(logger, logging.ERROR, 'mitre.load_failed', {'error': str(e)},
+                      f"Feil ved lasting av ATT&CK-data: {str(e)}")
+            self.load_error = str(e)
+            self._initialize_fallback_data()
+        finally:
+            self.load_seconds = round(time.time() - start, 2)
+            self.ready.set_result(self.load_error is None)
+            if self._not_ready_warned:
+                log_event(logger, logging.INFO, 'mitre.ready', {'load_seconds': self.load_seconds},
+                          "ATT&CK-data er lastet - analyser er ikke lenger degradert")
+    
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Venter til ATT&CK-data er lastet, høyst timeout sekunder"""
+        wait([self.ready], timeout=timeout)
+        return self.ready.done()
+    
+    def techniques_version(self) -> str:
+        """Versjon av teknikkdataen, endres bare når dataen endres"""
+        cache = self.techniques_cache
+        if getattr(self, '_version_for', None) is not cache:
+            version = cache.version() if isinstance(cache, TechniqueStore) else techniques_version(cache)
+            self._version, self._version_for = version, cache
+        return self._version
+    
+    def technique_dictionary(self) -> Dict[str, Dict]:
+        """Navn, beskrivelse og taktikker per teknikk, slik frontend viser dem"""
+        return {
+            technique_id: {
+                'name': data.get('name', ''),
+                'description': data.get('description', ''),
+                'tactics': data.get('tactics', [])
+            }
+            for technique_id, data in self.techniques_cache.items()
+        }
+    
+    def load_state(self) -> Dict:
+        """Lastestatus for /healthz"""
+        if not self.ready.done():
+            state = 'loading'
+        else:
+            state = 'ready' if self.load_error is None else 'failed'
+        return {
+            'state': state,
+            'source': self.data_source,
+            'techniques': len(self.techniques_cache) if self.ready.done() else 0,
+            'load_seconds': self.load_seconds,
+            'error': self.load_error
+        }
+    
+    def _initialize_from_store(self, store_path: str, offline: bool):
+        """
+        Bruker et delt ATT&CK-lager på disk. Første prosess laster ned og bygger
+        lageret under fillås, de andre leser samme fil i stedet for egne kopier.
+        """
+        store = TechniqueStore(store_path)
+        with store.build_lock():
+            if store.needs_build(allow_download=not offline):
+                if offline:
+                    self._initialize_fallback_data()
+                else:
+                    self._initialize_mitre_data()
+                store.build(self.techniques_cache, self.data_source)
+            else:
+                self.data_source = store.meta().get('source')
+        self.techniques_cache = store
         
     def _initialize_mitre_data(self):
         """Henter og initialiserer MITRE data"""
+        url = f"{self.base_url}enterprise-attack/enterprise-attack.json"
         try:
-            print("\n=== MITRE Data Initialisering ===")
-            
             # Test internett-tilkobling først
             try:
                 requests.get("https://www.google.com", timeout=5)
-                print("✓ Internett-tilkobling OK")
             except requests.exceptions.RequestException:
-                print("✗ Kunne ikke koble til internett")
+                log_event(logger, logging.WARNING, 'mitre.offline', message="Kunne ikke koble til internett")
                 raise
             
-            # Sjekk GitHub-tilgang
-            url = f"{self.base_url}enterprise-attack/enterprise-attack.json"
-            print(f"\nForsøker å hente MITRE data fra:")
-            print(f"URL: {url}")
-            
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                 'Accept': 'application/json'
             }
             
             response = requests.get(url, headers=headers, timeout=10)
-            print(f"\nAPI Respons:")
-            print(f"Status kode: {response.status_code}")
-            print(f"Content-Type: {response.headers.get('content-type', 'ikke spesifisert')}")
-            print(f"Respons størrelse: {len(response.content)} bytes")
+            log_event(logger, logging.INFO, 'mitre.response', {
+                'url': url,
+                'status_code': response.status_code,
+                'content_type': response.headers.get('content-type'),
+                'bytes': len(response.content)
+            }, "Hentet MITRE data")
             
             if response.status_code == 200:
                 try:
                     attack_data = response.json()
                     object_count = len(attack_data.get('objects', []))
-                    print(f"\n✓ JSON data mottatt")
-                    print(f"Antall objekter funnet: {object_count}")
                     
                     if object_count == 0:
                         raise ValueError("Ingen objekter funnet i MITRE data")
                     
                     # Prosesser objekter fra STIX data
-                    technique_count = 0
-                    for obj in attack_data.get('objects', []):
-                        if obj.get('type') == 'attack-pattern':
-                            try:
-                                technique_id = obj.get('external_references', [{}])[0].get('external_id')
-                                if technique_id:
-                                    self.techniques_cache[technique_id] = {
-                                        'name': obj.get('name', ''),
-                                        'description': obj.get('description', ''),
-                                        'tactics': [phase['phase_name'] for phase in obj.get('kill_chain_phases', [])],
-                                        'severity': self._calculate_technique_severity(obj),
-                                        'platforms': obj.get('x_mitre_platforms', []),
-                                        'detection': obj.get('x_mitre_detection', ''),
-                                        'data_sources': obj.get('x_mitre_data_sources', [])
-                                    }
-                                    technique_count += 1
-                            except Exception as e:
-                                print(f"Feil ved prosessering av teknikk: {str(e)}")
+                    technique_count = self._load_stix_objects(attack_data)
+                    self.data_source = 'mitre'
                     
-                    print(f"Ferdig med prosessering. Cachet {technique_count} teknikker")
+                    log_event(logger, logging.INFO, 'mitre.loaded',
+                              {'objects': object_count, 'techniques': technique_count},
+                              f"Ferdig med prosessering. Cachet {technique_count} teknikker")
                     
                 except json.JSONDecodeError as e:
-                    print(f"\n✗ JSON parsing feil:")
-                    print(f"Feil: {str(e)}")
-                    print(f"Første 200 tegn av responsen:")
-                    print(response.text[:200])
+                    log_event(logger, logging.ERROR, 'mitre.invalid_json',
+                              {'error': str(e), 'body': response.text[:200]}, "JSON parsing feil")
                     raise
                     
             else:
-                print(f"\n✗ Feil ved henting av data:")
-                print(f"Status: {response.status_code}")
-                print(f"Respons: {response.text[:200]}")
+                log_event(logger, logging.ERROR, 'mitre.http_error',
+                          {'status_code': response.status_code, 'body': response.text[:200]},
+                          "Feil ved henting av data")
                 
         except requests.exceptions.Timeout:
-            print("\n✗ Forespørselen tok for lang tid")
+            log_event(logger, logging.ERROR, 'mitre.fetch_failed', {'url': url, 'error': 'timeout'},
+                      "Forespørselen tok for lang tid")
         except requests.exceptions.SSLError as e:
-            print(f"\n✗ SSL/TLS feil: {str(e)}")
+            log_event(logger, logging.ERROR, 'mitre.fetch_failed', {'url': url, 'error': str(e)}, "SSL/TLS feil")
         except requests.exceptions.ProxyError as e:
-            print(f"\n✗ Proxy-feil: {str(e)}")
+            log_event(logger, logging.ERROR, 'mitre.fetch_failed', {'url': url, 'error': str(e)}, "Proxy-feil")
         except requests.exceptions.ConnectionError as e:
-            print(f"\n✗ Tilkoblingsfeil: {str(e)}")
+            log_event(logger, logging.ERROR, 'mitre.fetch_failed', {'url': url, 'error': str(e)},
+                      "Tilkoblingsfeil")
         except Exception as e:
-            print(f"\n✗ Uventet feil: {str(e)}")
-            print(f"Feiltype: {type(e).__name__}")
+            log_event(logger, logging.ERROR, 'mitre.fetch_failed',
+                      {'url': url, 'error': str(e), 'error_type': type(e).__name__}, "Uventet feil")
         finally:
             if not self.techniques_cache:
-                print("\n⚠ Bruker fallback data siden MITRE data ikke kunne hentes")
                 self._initialize_fallback_data()
     
+    def _load_stix_objects(self, attack_data: Dict) -> int:
+        """Fyller teknikk-cachen fra et STIX-bundle, returnerer antall teknikker"""
+        technique_count = 0
+        for obj in attack_data.get('objects', []):
+            if obj.get('type') == 'attack-pattern':
+                try:
+                    technique_id = obj.get('external_references', [{}])[0].get('external_id')
+                    if technique_id:
+                        self.techniques_cache[technique_id] = {
+                            'name': obj.get('name', ''),
+                            'description': obj.get('description', ''),
+                            'tactics': [phase['phase_name'] for phase in obj.get('kill_chain_phases', [])],
+                            'severity': self._calculate_technique_severity(obj),
+                            'platforms': obj.get('x_mitre_platforms', []),
+                            'detection': obj.get('x_mitre_detection', ''),
+                            'data_sources': obj.get('x_mitre_data_sources', [])
+                        }
+                        technique_count += 1
+                except Exception as e:
+                    log_event(logger, logging.WARNING, 'mitre.bad_technique', {'error': str(e)},
+                              f"Feil ved prosessering av teknikk: {str(e)}")
+        return technique_count
+    
     def _initialize_fallback_data(self):
         """Initialiserer basis teknikker hvis API-kallet feiler"""
         fallback_techniques = {
@@ -118,7 +286,9 @@ class MitreAttackAnalyzer:
             }
         }
         self.techniques_cache.update(fallback_techniques)
-        print("Using fallback technique data")
+        self.data_source = 'fallback'
+        log_event(logger, logging.WARNING, 'mitre.fallback', {'techniques': len(fallback_techniques)},
+                  "Bruker fallback data siden MITRE data ikke kunne hentes")
 
     def _calculate_technique_severity(self, technique: Dict) -> int:
         """Beregner alvorlighetsgrad for en teknikk basert på ulike faktorer"""
@@ -148,17 +318,9 @@ class MitreAttackAnalyzer:
         url = data.get('url', '').lower()
         
         # Identifiser teknikker basert på URL-mønstre
-        if any(pattern in url for pattern in ['download', 'exe', 'bin', 'dll']):
-            identified_techniques.extend([
-                'T1105',  # Ingress Tool Transfer
-                'T1129'   # Shared Modules
-            ])
-        
-        if any(pattern in url for pattern in ['phish', 'login', 'signin']):
-            identified_techniques.extend([
-                'T1566',  # Phishing
-                'T1204.001'  # User Execution: Malicious Link
-            ])
+        for patterns, techniques in URL_TECHNIQUE_PATTERNS:
+            if any(pattern in url for pattern in patterns):
+                identified_techniques.extend(techniques)
         
         # Identifiser teknikker basert på risikokategori
         if risk_category == 'HØY':
@@ -180,12 +342,15 @@ class MitreAttackAnalyzer:
                 'T1588'   # Obtain Capabilities
             ])
         
-        # Sjekk for crypto mining indikatorer
-        if 'crypto' in url or 'miner' in url:
-            identified_techniques.extend([
-                'T1496',      # Resource Hijacking
-                'T1071.001'   # Web Protocols
-            ])
+        # Funn fra berikelsen (DNS, domenealder, passiv DNS)
+        if base_findings.get('downloaded_files'):
+            identified_techniques.append('T1105')  # Ingress Tool Transfer
+        domain_age_days = base_findings.get('domain_age_days')
+        if domain_age_days is not None and domain_age_days < NEW_DOMAIN_DAYS:
+            identified_techniques.append('T1583.001')  # Acquire Infrastructure: Domains
+        addresses = set(base_findings.get('ip_addresses') or []) | set(base_findings.get('historic_ips') or [])
+        if len(addresses) >= FAST_FLUX_IPS:
+            identified_techniques.append('T1568.001')  # Dynamic Resolution: Fast Flux DNS
         
         return list(set(identified_techniques))  # Fjern duplikater
 
@@ -211,9 +376,11 @@ class MitreAttackAnalyzer:
                 tactics.update(self.techniques_cache[technique_id]['tactics'])
         return list(tactics)
 
-    def _calculate_risk_score(self, techniques: List[str]) -> int:
+    def _calculate_risk_score(self, techniques: List[str], weights: Dict[str, float] = None) -> int:
         """
-        Beregner risikoscore basert på MITRE ATT&CK beste praksis
+        Beregner risikoscore basert på MITRE ATT&CK beste praksis. weights er vektene
+        for delscorene fra kategoriseringspolicyen (standard MITRE_SCORE_WEIGHTS).
+        Analysatoren deles av policyer, så vektene sendes med per kall.
         """
         if not techniques:
             return 0
@@ -242,24 +409,9 @@ class MitreAttackAnalyzer:
             'impact': 1.0
         }
         
-        # Teknikk-spesifikke vekter
-        technique_base_severity = {
-            'T1190': 85,  # Exploit Public-Facing Application
-            'T1133': 75,  # External Remote Services
-            'T1566': 80,  # Phishing
-            'T1105': 70,  # Ingress Tool Transfer
-            'T1496': 65,  # Resource Hijacking
-            'T1071.001': 55,  # Web Protocols
-            'T1102': 50,  # Web Service
-            'T1129': 60,  # Shared Modules
-            'T1587': 75,  # Develop Capabilities
-            'T1588': 70,  # Obtain Capabilities
-            'T1204.001': 75  # User Execution: Malicious Link
-        }
-        
         for technique in techniques:
             tech_data = self.techniques_cache.get(technique, {})
-            base_severity = technique_base_severity.get(technique, 50)
+            base_severity = TECHNIQUE_BASE_SEVERITY.get(technique, 50)
             
             # Hent taktikker for teknikken
             tactics = tech_data.get('tactics', [])
@@ -282,32 +434,47 @@ class MitreAttackAnalyzer:
             scores['detection_coverage'] = (scores['detection_coverage'] / num_techniques) * 100
             scores['mitigation_status'] = (scores['mitigation_status'] / num_techniques) * 100
             
-            # Vektet total score med justerte vekter
-            final_score = (
-                scores['technique_severity'] * 0.4 +  # Alvorlighetsgrad er viktigst
-                scores['technique_coverage'] * 0.3 +  # Dekningsgrad er nest viktigst
-                scores['detection_coverage'] * 0.2 +  # Oppdagelsesmuligheter
-                scores['mitigation_status'] * 0.1     # Mottiltak minst vektet
-            )
+            # Vektet total score
+            weights = weights or MITRE_SCORE_WEIGHTS
+            final_score = sum(scores[name] * weights.get(name, 0) for name in scores)
         else:
             final_score = 0
         
-        # Legg til debug-utskrift
-        print(f"\nMITRE Score Calculation:")
-        print(f"Number of techniques: {num_techniques}")
-        print(f"Sub-scores: {json.dumps(scores, indent=2)}")
-        print(f"Final score: {int(min(100, final_score))}")
+        log_event(logger, logging.DEBUG, 'mitre.score', lambda: {
+            'techniques': num_techniques,
+            'sub_scores': dict(scores),
+            'score': int(min(100, final_score))
+        })
         
         return int(min(100, final_score))
 
-    def analyze_threat(self, data: Dict) -> Dict:
-        """Analyserer trusler mot MITRE ATT&CK rammeverket"""
+    def analyze_threat(self, data: Dict, deadline=None, weights: Dict[str, float] = None) -> Dict:
+        """
+        Analyserer trusler mot MITRE ATT&CK rammeverket. Med en deadline
+        (analyzers.deadline) ventes det på ATT&CK-data høyst til fristen, og
+        DeadlineExceeded kastes hvis fristen går ut før dataen er lastet.
+        weights er policyens vekter for ATT&CK-scoren.
+        """
+        ready_timeout = cap_timeout(deadline, self.ready_timeout)
+        degraded = not self.wait_ready(ready_timeout)
+        if degraded and deadline is not None and ready_timeout < self.ready_timeout:
+            # Fristen, ikke ready_timeout, stoppet ventingen: analysen blir 'pending' og fullføres i bakgrunnen
+            deadline.check('venting på ATT&CK-data')
+        if degraded and not self._not_ready_warned:
+            # Én advarsel når analysene begynner å gå uten ATT&CK-data, og mitre.ready når de slutter
+            self._not_ready_warned = True
+            log_event(logger, logging.WARNING, 'mitre.not_ready', {'waited_seconds': ready_timeout},
+                      f"ATT&CK-data er ikke lastet etter {ready_timeout:g}s - analyserer uten teknikkdetaljer")
         techniques = self._identify_techniques(data)
         tactics = self._map_to_tactics(techniques)
         
-        return {
+        analysis = {
             'timestamp': datetime.now().isoformat(),
             'identified_techniques': techniques,
             'tactics': tactics,
-            'risk_score': self._calculate_risk_score(techniques)
-        }
\ No newline at end of file
+            'risk_score': self._calculate_risk_score(techniques, weights)
+        }
+        if degraded:
+            # Uten teknikkdata er taktikker og score ufullstendige; resultatet er ikke endelig
+            analysis['degraded'] = True
+        return analysis
\ No newline at end of file
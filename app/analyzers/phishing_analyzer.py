@@ -1,16 +1,84 @@
 import json
+import logging
+import os
 import requests
 import time
 from datetime import datetime
+from .vt_key_pool import VTKeyPool, NoKeyAvailableError
+from .report_batcher import ReportBatcher
+from .deadline import DeadlineExceeded, cap_timeout
+from .structured_log import get_logger, log_event
+
+logger = get_logger('virustotal')
 
 class PhishingAnalyzer:
-    def __init__(self):
-        self.vt_api_key = "you virustotal api key"
-        self.vt_base_url = "https://www.virustotal.com/vtapi/v2/"
+    def __init__(self, api_key=None, base_url=None, key_pool=None):
+        self.vt_api_key = api_key or os.environ.get('VIRUSTOTAL_API_KEY', "you virustotal api key")
+        self.vt_base_url = base_url or os.environ.get('VIRUSTOTAL_BASE_URL', "https://www.virustotal.com/vtapi/v2/")
+        # Ventetider i sekunder, kan skaleres ned mot en lokal VirusTotal-erstatning
+        self.rate_limit_wait = 60
+        self.scan_wait = 15
+        # Nøkkelpool med egen kvote per nøkkel (VIRUSTOTAL_API_KEYS / VIRUSTOTAL_KEYS_FILE)
+        self.key_pool = key_pool or (
+            VTKeyPool.from_string(api_key) if api_key else VTKeyPool.from_environment()
+        )
+        # Samtidige url/report-oppslag slås sammen til ett kall med flere ressurser
+        # (VT_BATCH_SIZE=1 slår det av; private nøkler tåler flere enn 4)
+        batch_size = int(os.environ.get('VT_BATCH_SIZE', 4))
+        self.report_batcher = ReportBatcher(
+            self._vt_request, max_batch=batch_size,
+            window=float(os.environ.get('VT_BATCH_WINDOW', 0.05))
+        ) if batch_size > 1 else None
+    
+    def _vt_request(self, method, endpoint, params, priority=0, deadline=None):
+        """
+        Sender et kall til VirusTotal med nøkkelen som har mest ledig kvote.
+        Ved 204 eller avvist nøkkel prøves neste nøkkel i stedet for å vente.
+        Med en deadline (analyzers.deadline) ventes det aldri på kvote eller svar forbi fristen.
+        """
+        response = None
+        for _ in range(len(self.key_pool) + 1):
+            if deadline is not None:
+                deadline.check(f'venting på kvote for {endpoint}')
+            try:
+                key = self.key_pool.acquire(
+                    timeout=cap_timeout(deadline, self.rate_limit_wait * 2), priority=priority
+                )
+            except NoKeyAvailableError:
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(f"Ingen ledig kvote for {endpoint} innen tidsfristen")
+                raise
+            request_params = dict(params, apikey=key.key)
+            # Uten frist venter vi på svaret så lenge det tar, som før
+            timeout = None if deadline is None else max(deadline.remaining(), 1.0)
+            
+            try:
+                if method == 'POST':
+                    response = requests.post(f'{self.vt_base_url}{endpoint}', data=request_params, timeout=timeout)
+                else:
+                    response = requests.get(f'{self.vt_base_url}{endpoint}', params=request_params, timeout=timeout)
+            except requests.Timeout:
+                if deadline is None:
+                    raise
+                raise DeadlineExceeded(f"VirusTotal svarte ikke på {endpoint} innen tidsfristen")
+            
+            self.key_pool.report(key, response.status_code)
+            if response.status_code not in (204, 401, 403):
+                break
+        return response
+    
+    def _report(self, url, priority=0, deadline=None):
+        """Henter url/report for én URL, via batcheren når den er på: (status, rapport)"""
+        if self.report_batcher is not None:
+            return self.report_batcher.report(url, priority, deadline)
+        response = self._vt_request('GET', 'url/report', {'resource': url}, priority, deadline)
+        return response.status_code, response.json() if response.status_code == 200 else None
         
-    def check_url(self, url):
+    def check_url(self, url, priority=0, deadline=None):
         """
-        Sjekker en URL mot VirusTotal API med rate limiting håndtering
+        Sjekker en URL mot VirusTotal API med rate limiting håndtering.
+        priority (f.eks. leksikalsk score) avgjør hvem som får kvote først.
+        Rekker ikke sjekken å bli ferdig innen deadline, kastes DeadlineExceeded.
         """
         try:
             url = url.strip()
@@ -18,59 +86,31 @@ class PhishingAnalyzer:
                 url = 'http://' + url
             
             # Først, prøv å hente eksisterende rapport
-            report_params = {
-                'apikey': self.vt_api_key,
-                'resource': url
-            }
-            
-            print(f"Henter rapport for {url}...")
-            report_response = requests.get(
-                f'{self.vt_base_url}url/report',
-                params=report_params
-            )
-            
-            # Håndter rate limiting
-            if report_response.status_code == 204:
-                print("Rate limit nådd. Venter 60 sekunder...")
-                time.sleep(60)  # Vent ett minutt
-                report_response = requests.get(
-                    f'{self.vt_base_url}url/report',
-                    params=report_params
-                )
+            log_event(logger, logging.DEBUG, 'vt.report', {'url': url}, 'Henter rapport')
+            status_code, report = self._report(url, priority, deadline)
             
-            if report_response.status_code == 200:
-                report = report_response.json()
-                
+            if status_code == 200 and report is not None:
                 # Hvis ingen eksisterende rapport, send til scanning
                 if report.get('response_code', 0) == 0:
-                    print("Ingen eksisterende rapport funnet. Sender URL til scanning...")
+                    log_event(logger, logging.DEBUG, 'vt.scan', {'url': url},
+                              'Ingen eksisterende rapport funnet - sender URL til scanning')
                     scan_params = {
-                        'apikey': self.vt_api_key,
                         'url': url
                     }
-                    scan_response = requests.post(
-                        f'{self.vt_base_url}url/scan',
-                        data=scan_params
-                    )
-                    
-                    if scan_response.status_code == 204:
-                        print("Rate limit nådd. Venter 60 sekunder...")
-                        time.sleep(60)
-                        scan_response = requests.post(
-                            f'{self.vt_base_url}url/scan',
-                            data=scan_params
-                        )
+                    scan_response = self._vt_request('POST', 'url/scan', scan_params, priority, deadline)
                     
                     if scan_response.status_code == 200:
-                        print("URL sendt til scanning. Venter på resultater...")
-                        time.sleep(15)
+                        if deadline is not None and deadline.remaining() < self.scan_wait:
+                            # Skanningen er sendt; rapporten hentes når analysen fullføres i bakgrunnen
+                            raise DeadlineExceeded("Tidsfristen rekker ikke å vente på skanningen")
+                        log_event(logger, logging.DEBUG, 'vt.scan_wait', {'url': url, 'wait': self.scan_wait},
+                                  'URL sendt til scanning - venter på resultater')
+                        time.sleep(self.scan_wait)
                         
                         # Hent oppdatert rapport
-                        report_response = requests.get(
-                            f'{self.vt_base_url}url/report',
-                            params=report_params
-                        )
-                        report = report_response.json()
+                        status_code, updated = self._report(url, priority, deadline)
+                        if status_code == 200 and updated is not None:
+                            report = updated
                 
                 return {
                     "url": url,
@@ -85,10 +125,12 @@ class PhishingAnalyzer:
             return {
                 "url": url,
                 "status": "error",
-                "error_message": f"Kunne ikke hente rapport. Status: {report_response.status_code}",
+                "error_message": f"Kunne ikke hente rapport. Status: {status_code}",
                 "risk_score": "ukjent"
             }
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return {
                 "url": url,
@@ -0,0 +1,70 @@
+from typing import Callable, Dict, List, Optional
+from datetime import datetime
+import heapq
+import os
+
+from .lexical_scorer import LexicalScorer
+
+
+def parse_hours(value: str) -> Optional[tuple]:
+    """Parser et timevindu som '22-6' til (start, slutt), None hvis tomt"""
+    if not value:
+        return None
+    start, _, end = value.partition('-')
+    return int(start) % 24, int(end or start) % 24
+
+
+class PriorityScheduler:
+    """
+    Ordner URLer etter leksikalsk forhåndsscore slik at de mest mistenkelige
+    får VirusTotal-kvote først. Under kvotepress utsettes URLer med lav score
+    til et lavtrafikkvindu i stedet for å bruke interaktiv kvote.
+    """
+
+    def __init__(self, scorer: LexicalScorer = None, defer_below: int = None, off_peak_hours: str = None,
+                 boost: Callable[[str], Optional[int]] = None):
+        self.scorer = scorer or LexicalScorer()
+        # Valgfri forhåndsscore fra tidligere verdikter (f.eks. URL-klynger); høyeste score gjelder
+        self.boost = boost
+        if defer_below is None:
+            defer_below = int(os.environ.get('VT_DEFER_BELOW', 15))
+        self.defer_below = defer_below
+        self.off_peak = parse_hours(
+            off_peak_hours if off_peak_hours is not None else os.environ.get('VT_OFF_PEAK_HOURS', '0-6')
+        )
+
+    def is_off_peak(self, now: datetime = None) -> bool:
+        if not self.off_peak:
+            return False
+        hour = (now or datetime.now()).hour
+        start, end = self.off_peak
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def plan(self, urls: List[str], capacity: int, allow_defer: bool = True, now: datetime = None) -> Dict:
+        """
+        Returnerer {'ordered': [...], 'deferred': [...]} der hvert element er
+        {'index', 'url', 'score', 'features'}. Rekkefølgen er høyest score først.
+        """
+        heap = []
+        for index, url in enumerate(urls):
+            lexical = self.scorer.score(url)
+            score = lexical['score']
+            if self.boost:
+                score = max(score, self.boost(url) or 0)
+            heapq.heappush(heap, (-score, index, url, lexical['features']))
+
+        under_pressure = len(urls) > capacity
+        may_defer = allow_defer and self.defer_below > 0 and under_pressure and not self.is_off_peak(now)
+
+        ordered, deferred = [], []
+        while heap:
+            negative_score, index, url, features = heapq.heappop(heap)
+            item = {'index': index, 'url': url, 'score': -negative_score, 'features': features}
+            # De som får plass i kvoten analyseres uansett score
+            if may_defer and len(ordered) >= capacity and item['score'] < self.defer_below:
+                deferred.append(item)
+            else:
+                ordered.append(item)
+        return {'ordered': ordered, 'deferred': deferred, 'under_pressure': under_pressure}
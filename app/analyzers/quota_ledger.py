@@ -0,0 +1,188 @@
+from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import date
+import os
+import sqlite3
+import threading
+import time
+
+# Karantene uten utløp (avvist nøkkel)
+PERMANENT = 1e18
+
+
+class QuotaLedger:
+    """
+    Delt kvotebok for VirusTotal-kall på tvers av prosesser (gunicorn-arbeidere,
+    cron og CLI). Hvert kall registreres i en SQLite-fil før det sendes, slik at
+    alle prosesser ser samme glidende minuttvindu, døgnkvote og karantene.
+
+    Prosessene står i én felles kø (billetter ordnet etter prioritet, deretter
+    ankomst), og bare billetten først i køen kan ta neste ledige kall.
+    """
+
+    def __init__(self, path: str, ticket_timeout: float = 5.0):
+        self.path = path
+        # Billetter som ikke er fornyet innen fristen tilhører en prosess som er borte
+        self.ticket_timeout = ticket_timeout
+        self.owner = f'{os.getpid()}'
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as c:
+            c.execute('CREATE TABLE IF NOT EXISTS calls (key_id TEXT NOT NULL, at REAL NOT NULL)')
+            c.execute('CREATE INDEX IF NOT EXISTS calls_key_at ON calls (key_id, at)')
+            c.execute('CREATE TABLE IF NOT EXISTS daily ('
+                      'key_id TEXT NOT NULL, day TEXT NOT NULL, used INTEGER NOT NULL, '
+                      'PRIMARY KEY (key_id, day))')
+            c.execute('CREATE TABLE IF NOT EXISTS quarantine ('
+                      'key_id TEXT PRIMARY KEY, until REAL NOT NULL, reason TEXT)')
+            c.execute('CREATE TABLE IF NOT EXISTS tickets ('
+                      'id INTEGER PRIMARY KEY AUTOINCREMENT, owner TEXT NOT NULL, '
+                      'priority INTEGER NOT NULL, heartbeat REAL NOT NULL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """Skrivetransaksjon som låser boken for andre prosesser mens den varer"""
+        c = self._connection()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            yield c
+            c.execute('COMMIT')
+        except BaseException:
+            c.execute('ROLLBACK')
+            raise
+
+    def _key_state(self, c, key_id: str, per_minute: int, per_day: int, window: float, now: float) -> Dict:
+        c.execute('DELETE FROM calls WHERE key_id = ? AND at <= ?', (key_id, now - window))
+        in_window, oldest = c.execute(
+            'SELECT COUNT(*), MIN(at) FROM calls WHERE key_id = ?', (key_id,)
+        ).fetchone()
+        row = c.execute('SELECT used FROM daily WHERE key_id = ? AND day = ?',
+                        (key_id, date.today().isoformat())).fetchone()
+        used_today = row[0] if row else 0
+        quarantine = c.execute('SELECT until, reason FROM quarantine WHERE key_id = ?', (key_id,)).fetchone()
+
+        minute_left = per_minute - in_window if per_minute else float('inf')
+        day_left = per_day - used_today if per_day else float('inf')
+        remaining = max(0, min(minute_left, day_left))
+
+        if per_day and used_today >= per_day:
+            wait = float('inf')
+        elif per_minute and in_window >= per_minute:
+            wait = window - (now - oldest)
+        else:
+            wait = 0.0
+
+        quarantined_until, reason = 0.0, None
+        if quarantine and quarantine[0] > now:
+            quarantined_until, reason = quarantine
+            remaining = 0
+            wait = float('inf') if quarantined_until >= PERMANENT else max(wait, quarantined_until - now)
+
+        return {
+            'remaining': remaining,
+            'remaining_minute': max(0, minute_left) if per_minute else None,
+            'remaining_today': max(0, day_left) if per_day else None,
+            'used_today': used_today,
+            'quarantined_until': quarantined_until,
+            'quarantine_reason': reason,
+            'wait': wait
+        }
+
+    def try_acquire(self, keys: List[Tuple], priority: int = 0,
+                    ticket: Optional[int] = None) -> Tuple[Optional[int], Optional[str], float]:
+        """
+        Forsøker å reservere ett kall. keys er (key_id, per_minute, per_day, window_seconds).
+        Returnerer (billett, key_id, ventetid): key_id er satt når kallet er reservert,
+        ellers beholder kalleren billetten og prøver igjen etter ventetiden.
+        """
+        now = time.time()
+        with self._transaction() as c:
+            c.execute('DELETE FROM tickets WHERE heartbeat < ?', (now - self.ticket_timeout,))
+            if ticket is None or not c.execute(
+                'UPDATE tickets SET heartbeat = ?, priority = ? WHERE id = ?', (now, priority, ticket)
+            ).rowcount:
+                ticket = c.execute(
+                    'INSERT INTO tickets (owner, priority, heartbeat) VALUES (?, ?, ?)',
+                    (self.owner, priority, now)
+                ).lastrowid
+
+            head = c.execute('SELECT id FROM tickets ORDER BY priority DESC, id LIMIT 1').fetchone()[0]
+            states = {key[0]: self._key_state(c, *key, now) for key in keys}
+            wait = min(state['wait'] for state in states.values())
+            if head != ticket:
+                # En annen prosess står foran i køen; vent på at den blir betjent
+                return ticket, None, wait if wait == float('inf') else max(wait, 0.02)
+
+            available = [key_id for key_id, state in states.items() if state['remaining'] > 0]
+            if not available:
+                return ticket, None, wait
+
+            key_id = max(available, key=lambda k: states[k]['remaining'])
+            self._local.last_call = c.execute(
+                'INSERT INTO calls (key_id, at) VALUES (?, ?)', (key_id, now)
+            ).lastrowid
+            c.execute('INSERT INTO daily (key_id, day, used) VALUES (?, ?, 1) '
+                      'ON CONFLICT (key_id, day) DO UPDATE SET used = used + 1',
+                      (key_id, date.today().isoformat()))
+            c.execute('DELETE FROM tickets WHERE id = ?', (ticket,))
+            return None, key_id, 0.0
+
+    def completed(self):
+        """
+        Flytter trådens siste kall til tidspunktet svaret kom. VirusTotal teller kallet
+        når det mottas, så vinduet må regnes fra da og ikke fra reservasjonen.
+        """
+        call_id = getattr(self._local, 'last_call', None)
+        if call_id is None:
+            return
+        self._local.last_call = None
+        with self._transaction() as c:
+            c.execute('UPDATE calls SET at = ? WHERE rowid = ?', (time.time(), call_id))
+
+    def release(self, ticket: Optional[int]):
+        """Fjerner en billett når kalleren gir opp"""
+        if ticket is None:
+            return
+        with self._transaction() as c:
+            c.execute('DELETE FROM tickets WHERE id = ?', (ticket,))
+
+    def rate_limited(self, key_id: str, per_minute: int, cooldown: float):
+        """VirusTotal har sagt 204: minuttet regnes som brukt opp for alle prosesser"""
+        now = time.time()
+        with self._transaction() as c:
+            in_window = c.execute('SELECT COUNT(*) FROM calls WHERE key_id = ?', (key_id,)).fetchone()[0]
+            c.executemany('INSERT INTO calls (key_id, at) VALUES (?, ?)',
+                          [(key_id, now)] * max(0, (per_minute or 0) - in_window))
+            self._quarantine(c, key_id, now + cooldown, 'rate_limit')
+
+    def rejected(self, key_id: str):
+        """Nøkkelen ble avvist (401/403) og brukes ikke av noen prosess"""
+        with self._transaction() as c:
+            self._quarantine(c, key_id, PERMANENT, 'auth')
+
+    def _quarantine(self, c, key_id: str, until: float, reason: str):
+        c.execute('INSERT INTO quarantine (key_id, until, reason) VALUES (?, ?, ?) '
+                  'ON CONFLICT (key_id) DO UPDATE SET until = excluded.until, reason = excluded.reason',
+                  (key_id, until, reason))
+
+    def key_states(self, keys: List[Tuple]) -> Dict[str, Dict]:
+        """Felles kvotestatus per nøkkel, sett fra alle prosesser"""
+        now = time.time()
+        with self._transaction() as c:
+            c.execute('DELETE FROM daily WHERE day < ?', (date.today().isoformat(),))
+            return {key[0]: self._key_state(c, *key, now) for key in keys}
+
+    def queue_length(self) -> int:
+        now = time.time()
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM tickets WHERE heartbeat >= ?', (now - self.ticket_timeout,)
+        ).fetchone()[0]
@@ -0,0 +1,109 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import threading
+
+from .deadline import Deadline, DeadlineExceeded
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        # Seneste frist blant kallerne; None så snart én kaller er uten frist
+        self.deadline = None
+        self.bounded = True
+
+    def add(self, item: Tuple, deadline: Optional[Deadline]):
+        self.items.append(item)
+        if deadline is None:
+            self.bounded = False
+            self.deadline = None
+        elif self.bounded and (self.deadline is None or deadline.expires > self.deadline.expires):
+            self.deadline = deadline
+
+
+class ReportBatcher:
+    """
+    Samler url/report-oppslag fra samtidige kallere i et kort vindu og sender dem
+    som ett VirusTotal-kall med flere linjeskilte ressurser. Kallet teller én gang
+    mot minuttkvoten uansett antall ressurser (opptil 4 på offentlige nøkler).
+
+    Første kaller i en batch leder den: venter til batchen er full eller vinduet
+    er ute, sender kallet og fordeler svarene til de ventende kallerne.
+    """
+
+    def __init__(self, request: Callable, max_batch: int = 4, window: float = 0.05):
+        # request(method, endpoint, params, priority, deadline) -> requests.Response
+        self.request = request
+        self.max_batch = max_batch
+        self.window = window
+        self._open = None
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'resources': 0}
+
+    def report(self, resource: str, priority: int = 0,
+               deadline: Optional[Deadline] = None) -> Tuple[int, Optional[Dict]]:
+        """
+        Returnerer (HTTP-status, rapport) for én ressurs; rapport er None ved feil.
+        Med en deadline kastes DeadlineExceeded hvis svaret ikke kommer innen fristen.
+        """
+        future = Future()
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            batch.add((resource, priority, future), deadline)
+            if len(batch.items) >= self.max_batch:
+                self._open = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window if deadline is None else deadline.cap(self.window))
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._send(batch.items, batch.deadline)
+        try:
+            return future.result(timeout=None if deadline is None else deadline.remaining())
+        except FutureTimeout:
+            raise DeadlineExceeded(f"Ingen rapport for {resource} innen tidsfristen")
+
+    def _send(self, items: List[Tuple], deadline: Optional[Deadline] = None):
+        resources = list(dict.fromkeys(resource for resource, _, _ in items))
+        # Batchen arver høyeste prioritet blant kallerne
+        priority = max(item_priority for _, item_priority, _ in items)
+        try:
+            if len(resources) == 1:
+                response = self.request('GET', 'url/report', {'resource': resources[0]}, priority, deadline)
+            else:
+                response = self.request('POST', 'url/report', {'resource': '\n'.join(resources)},
+                                        priority, deadline)
+            with self._lock:
+                self.stats['requests'] += 1
+                self.stats['resources'] += len(resources)
+
+            reports = {}
+            if response.status_code == 200:
+                payload = response.json()
+                if isinstance(payload, dict):
+                    payload = [payload]
+                for index, report in enumerate(payload):
+                    # Svarene kommer i samme rekkefølge som ressursene; 'resource' brukes når den passer
+                    resource = report.get('resource')
+                    if resource not in resources and index < len(resources):
+                        resource = resources[index]
+                    reports[resource] = report
+            for resource, _, future in items:
+                future.set_result((response.status_code, reports.get(resource)))
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+    def status(self) -> Dict:
+        with self._lock:
+            requests = self.stats['requests']
+            return dict(self.stats, resources_per_request=(
+                round(self.stats['resources'] / requests, 2) if requests else None
+            ))
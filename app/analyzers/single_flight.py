@@ -0,0 +1,205 @@
+from typing import Callable, Dict, Optional, Tuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .deadline import Deadline, DeadlineExceeded
+
+
+def flight_key(url: str) -> str:
+    """Normalisert URL: samme ressurs gir samme nøkkel uansett skrivemåte av skjema og vert"""
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'http://' + url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    path = parts.path if parts.path not in ('', '/') else ''
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ''))
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class InflightTable:
+    """
+    Oppslag som pågår i en av prosessene på maskinen, i en delt SQLite-fil.
+    Første prosess som gjør krav på en URL gjør oppslaget; de andre venter på
+    resultatet, som også gjenbrukes i result_ttl sekunder etterpå.
+    """
+
+    def __init__(self, path: str, result_ttl: float = 30.0, max_age: float = 600.0):
+        self.path = path
+        self.result_ttl = result_ttl
+        # Et krav eldre enn dette regnes som forlatt selv om prosessen lever
+        self.max_age = max_age
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as c:
+            c.execute('CREATE TABLE IF NOT EXISTS flights ('
+                      'key TEXT PRIMARY KEY, pid INTEGER NOT NULL, started REAL NOT NULL, '
+                      'result TEXT, completed REAL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        c = self._connection()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            yield c
+            c.execute('COMMIT')
+        except BaseException:
+            c.execute('ROLLBACK')
+            raise
+
+    def claim(self, key: str) -> Tuple[str, Optional[Dict]]:
+        """
+        Returnerer ('done', resultat) hvis en fersk lagret verdi finnes, ('owner', None) hvis
+        kalleren nå eier oppslaget, eller ('wait', None) mens en annen prosess holder på.
+        """
+        now = time.time()
+        with self._transaction() as c:
+            c.execute('DELETE FROM flights WHERE completed < ?', (now - self.result_ttl,))
+            row = c.execute('SELECT pid, started, result FROM flights WHERE key = ?', (key,)).fetchone()
+            if row:
+                pid, started, result = row
+                if result is not None:
+                    return 'done', json.loads(result)
+                if now - started < self.max_age and _process_alive(pid):
+                    return 'wait', None
+            c.execute('INSERT OR REPLACE INTO flights (key, pid, started, result, completed) '
+                      'VALUES (?, ?, ?, NULL, NULL)', (key, os.getpid(), now))
+            return 'owner', None
+
+    def complete(self, key: str, result: Dict):
+        with self._transaction() as c:
+            c.execute('UPDATE flights SET result = ?, completed = ? WHERE key = ? AND pid = ?',
+                      (json.dumps(result, ensure_ascii=False), time.time(), key, os.getpid()))
+
+    def abandon(self, key: str):
+        """Oppslaget feilet; ventende prosesser gjør det selv i stedet"""
+        with self._transaction() as c:
+            c.execute('DELETE FROM flights WHERE key = ? AND pid = ?', (key, os.getpid()))
+
+    def in_flight(self) -> int:
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM flights WHERE result IS NULL'
+        ).fetchone()[0]
+
+
+class SingleFlight:
+    """
+    Slår sammen samtidige oppslag med samme nøkkel. Tråder i samme prosess venter på
+    én Future; med en InflightTable venter også andre arbeidsprosesser på samme oppslag.
+    Hver kaller får sin egen kopi av resultatet.
+    """
+
+    def __init__(self, table: InflightTable = None, max_wait: float = 300.0, poll_interval: float = 0.2):
+        self.table = table
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {'led': 0, 'joined': 0, 'joined_shared': 0}
+
+    def run(self, key: str, compute: Callable[[], Dict], deadline: Optional[Deadline] = None) -> Dict:
+        """Med en deadline venter kalleren aldri på andres oppslag forbi fristen"""
+        while True:
+            with self._lock:
+                future = self._flights.get(key)
+                leader = future is None
+                if leader:
+                    future = self._flights[key] = Future()
+                else:
+                    self.stats['joined'] += 1
+            if leader:
+                break
+            try:
+                return copy.deepcopy(future.result(timeout=None if deadline is None else deadline.remaining()))
+            except FutureTimeout:
+                raise DeadlineExceeded("Tidsfristen gikk ut mens et annet oppslag av samme URL pågikk")
+            except DeadlineExceeded:
+                # Lederens frist gikk ut; en kaller med mer tid gjør oppslaget selv
+                if deadline is not None and deadline.expired():
+                    raise
+
+        try:
+            result = self._run_shared(key, compute, deadline) if self.table else self._lead(compute)
+            future.set_result(copy.deepcopy(result))
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _lead(self, compute: Callable[[], Dict]) -> Dict:
+        with self._lock:
+            self.stats['led'] += 1
+        return compute()
+
+    def _run_shared(self, key: str, compute: Callable[[], Dict], deadline: Optional[Deadline] = None) -> Dict:
+        max_wait = time.monotonic() + self.max_wait
+        while True:
+            try:
+                state, shared = self.table.claim(key)
+            except sqlite3.Error as e:
+                print(f"Delt oppslagstabell utilgjengelig ({str(e)}), slår opp selv")
+                return self._lead(compute)
+
+            if state == 'done':
+                with self._lock:
+                    self.stats['joined_shared'] += 1
+                return shared
+
+            if state == 'owner':
+                try:
+                    result = self._lead(compute)
+                except BaseException:
+                    self.table.abandon(key)
+                    raise
+                # Feil og degraderte resultater (uten ATT&CK-data) deles ikke; neste kaller prøver på nytt
+                if result.get('status') == 'error' or result.get('degraded'):
+                    self.table.abandon(key)
+                else:
+                    self.table.complete(key, result)
+                return result
+
+            if deadline is not None:
+                deadline.check('venting på et annet oppslag av samme URL')
+            if time.monotonic() > max_wait:
+                return self._lead(compute)
+            time.sleep(self.poll_interval if deadline is None else deadline.cap(self.poll_interval))
+
+    def status(self) -> Dict:
+        with self._lock:
+            status = dict(self.stats, in_flight_local=len(self._flights))
+        if self.table is not None:
+            try:
+                status['in_flight_shared'] = self.table.in_flight()
+            except sqlite3.Error:
+                status['in_flight_shared'] = None
+        return status
@@ -1,66 +1,109 @@
 import json
+import logging
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
 from .phishing_analyzer import PhishingAnalyzer
 from .mitre_analyzer import MitreAttackAnalyzer
+from .lexical_scorer import LexicalScorer
+from .single_flight import flight_key
+from .indicators import extract_indicators
+from .structured_log import get_logger, log_event
+from .categorization import BUILTIN_POLICIES, DEFAULT_POLICY_VERSION
+from .deadline import DeadlineExceeded
+
+logger = get_logger('analysis')
 
 class SOCAnalyzer:
-    def __init__(self):
-        self.analyzer = PhishingAnalyzer()
-        self.mitre_analyzer = MitreAttackAnalyzer()
+    def __init__(self, domain_policy=None, phishing_analyzer=None, mitre_analyzer=None, url_lists=None,
+                 keep_history=True, single_flight=None, cluster_policy=None, policy=None, enrichment=None):
+        self.analyzer = phishing_analyzer or PhishingAnalyzer()
+        self.mitre_analyzer = mitre_analyzer or MitreAttackAnalyzer()
         self.report_history = []
+        # Webappen lagrer historikk i databasen og holder ingen kopi per prosess
+        self.keep_history = keep_history
+        # Valgfri DomainReputationPolicy som kan besvare URLer uten VirusTotal
+        self.domain_policy = domain_policy
+        self.lexical_scorer = LexicalScorer()
+        # Valgfri URLListMatcher (tillatelses-/blokkeringslister) som sjekkes først
+        self.url_lists = url_lists
+        # Valgfri SingleFlight: samtidige analyser av samme URL deler ett oppslag
+        self.single_flight = single_flight
+        # Valgfri UrlClusterPolicy: verdikter fra nesten like URLer (samme phishing-kit)
+        self.cluster_policy = cluster_policy
+        # Versjonert CategorizationPolicy: grenser for risikokategori og vekter for ATT&CK-scoren
+        # (vektene sendes med hvert kall, siden ATT&CK-analysatoren kan deles med andre policyer)
+        self.policy = policy or BUILTIN_POLICIES[DEFAULT_POLICY_VERSION]
+        # Valgfri EnrichmentPipeline (DNS, domenealder, passiv DNS) som kjører mens VirusTotal svarer
+        self.enrichment = enrichment
         
-    def analyze_and_categorize(self, url):
+    def analyze_and_categorize(self, url, use_domain_policy=True, priority=None, deadline=None):
         """
-        Analyserer URL og kategoriserer risikonivå med tre nivåer
+        Analyserer URL og kategoriserer risikonivå med tre nivåer.
+        Re-skanning bruker use_domain_policy=False for å få et ferskt VirusTotal-verdikt,
+        og en lav priority slik at interaktive analyser får kvote først.
+        Med en deadline (analyzers.deadline.Deadline) kastes DeadlineExceeded når
+        analysen ikke rekker å bli ferdig; den kan da kjøres på nytt uten frist.
         """
-        result = self.analyzer.check_url(url)
+        if self.single_flight is None:
+            return self._analyze(url, use_domain_policy, priority, deadline)
+        key = f"{'full' if use_domain_policy else 'vt'}:{flight_key(url)}"
+        return self.single_flight.run(
+            key, lambda: self._analyze(url, use_domain_policy, priority, deadline), deadline
+        )
+
+    def _analyze(self, url, use_domain_policy, priority, deadline=None):
+        # Lister gir umiddelbart verdikt, deretter domeneomdømme og URL-klynge før vi bruker VirusTotal-kvote
+        list_match = self.list_match(url)
+        domain_verdict = None
+        cluster_verdict = None
+        if not list_match and self.domain_policy and use_domain_policy:
+            domain_verdict = self.domain_policy.evaluate(url)
+        if (not list_match and self.cluster_policy and use_domain_policy
+                and not (domain_verdict and domain_verdict['decision'] == 'answer')):
+            cluster_verdict = self.cluster_policy.evaluate(url)
+
+        if list_match:
+            result = self.url_lists.build_result(url, list_match)
+        elif domain_verdict and domain_verdict['decision'] == 'answer':
+            result = self.domain_policy.build_result(url, domain_verdict)
+        elif cluster_verdict and cluster_verdict['decision'] == 'answer':
+            result = self.cluster_policy.build_result(url, cluster_verdict)
+        else:
+            if priority is None:
+                priority = self.priority_for(url, domain_verdict, cluster_verdict)
+            # Berikelsen startes før VirusTotal-kallet, så den ikke legger til ventetid
+            enrichment = self.enrichment.start(url) if self.enrichment else None
+            result = self.analyzer.check_url(url, priority=priority, deadline=deadline)
+            result['lexical_score'] = priority
+            if enrichment:
+                for key, value in enrichment.wait(deadline).items():
+                    result.setdefault(key, value)
+        
+        if domain_verdict:
+            result['domain_reputation'] = domain_verdict
+        if cluster_verdict:
+            result['url_cluster'] = cluster_verdict
         
         # Legg til tidsstempel
         result['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        if result['status'] == 'completed':
-            # Parse risk score
-            risk_score = result.get('risk_score', 'N/A')
-            if risk_score != 'N/A':
-                positives, total = map(int, risk_score.split('/'))
-                score_percent = (positives / total) * 100 if total > 0 else 0
-                
-                # Nye risikokategorier med oppdaterte grenser
-                if score_percent < 3:  # 0-2 positive
-                    result['risk_category'] = 'LAV'
-                    result['action_required'] = 'Ingen umiddelbar handling nødvendig'
-                elif score_percent < 10:  # 3-9 positive
-                    result['risk_category'] = 'MEDIUM'
-                    result['action_required'] = 'Undersøk nærmere - mulig falsk positiv'
-                elif score_percent < 20:  # 10-19 positive
-                    result['risk_category'] = 'HØY'
-                    result['action_required'] = 'Umiddelbar handling påkrevd!'
-                else:  # 20+ positive
-                    result['risk_category'] = 'KRITISK'
-                    result['action_required'] = 'KRITISK: Umiddelbar isolasjon og handling påkrevd!'
-            else:
-                result['risk_category'] = 'UKJENT'
-                result['action_required'] = 'Kunne ikke bestemme risiko - manuell vurdering nødvendig'
-        else:
-            result['risk_category'] = 'FEIL'
-            result['action_required'] = f'Analyse feilet - {result.get("error_message", "ukjent feil")}'
-        
-        # Debug utskrift før MITRE analyse
-        print("\n=== DEBUG: MITRE Analysis Flow ===")
-        print("1. Input URL:", url)
+        if 'risk_category' not in result:
+            self._categorize(result)
         
-        # Legg til MITRE ATT&CK analyse
+        try:
+            return self.finish_analysis(url, result, deadline)
+        except DeadlineExceeded as e:
+            # VirusTotal-svaret er klart; bakgrunnsfullføringen trenger bare ATT&CK-steget (ingen ny kvote)
+            e.partial = result
+            raise
+
+    def finish_analysis(self, url, result, deadline=None):
+        """ATT&CK-steget for et kategorisert resultat, også for analyser fullført i bakgrunnen"""
         analysis_input = {
             'url': url,
             'base_findings': result,
             'risk_category': result.get('risk_category', 'UKJENT')
         }
-        print("2. Analysis Input:", json.dumps(analysis_input, indent=2))
-        
-        mitre_analysis = self.mitre_analyzer.analyze_threat(analysis_input)
-        print("3. MITRE Analysis Result:", json.dumps(mitre_analysis, indent=2))
+        mitre_analysis = self.mitre_analyzer.analyze_threat(analysis_input, deadline, self.policy.mitre_weights)
         
         # Kombiner resultatene
         result['mitre_analysis'] = {
@@ -68,23 +111,61 @@ class SOCAnalyzer:
             'tactics': mitre_analysis['tactics'],
             'risk_score': mitre_analysis['risk_score']
         }
-        print("4. Final Result Structure:", json.dumps({
-            'mitre_analysis': result['mitre_analysis'],
-            'mitre_details': result.get('mitre_details', {})
-        }, indent=2))
+        if mitre_analysis.get('degraded'):
+            # Analysert før ATT&CK-data var lastet: vises, men lagres og deles ikke som endelig verdikt
+            result['degraded'] = True
+        # Feltene bygges bare med LOG_LEVEL=DEBUG (kopi, siden result endres videre)
+        log_event(logger, logging.DEBUG, 'analysis.mitre', lambda: {
+            'url': url,
+            'base_findings': dict(result),
+            'mitre_analysis': mitre_analysis
+        })
         
         # Lagre resultatet i historikken
-        self.report_history.append(result)
+        if self.keep_history:
+            self.report_history.append(result)
         return result
     
-    def export_to_excel(self, filename="soc_reports.xlsx"):
+    def list_match(self, url):
+        """Treff på tillatelses- eller blokkeringsliste, None hvis ingen"""
+        return self.url_lists.match(url) if self.url_lists else None
+
+    def priority_for(self, url, domain_verdict=None, cluster_verdict=None):
+        """Leksikalsk forhåndsscore, løftet hvis domenet eller lignende URLer tidligere har vært farlige"""
+        priority = self.lexical_scorer.score(url)['score']
+        if domain_verdict and domain_verdict['dominant_category'] in ('KRITISK', 'HØY'):
+            priority = max(priority, 80)
+        if cluster_verdict and cluster_verdict['dominant_category'] in ('KRITISK', 'HØY'):
+            priority = max(priority, 80)
+        return priority
+
+    def cluster_priority(self, url):
+        """Forhåndsscore fra URL-klyngen alene (80 for farlige klynger), None uten treff"""
+        if not self.cluster_policy or self.list_match(url):
+            return None
+        verdict = self.cluster_policy.evaluate(url)
+        if verdict and verdict['dominant_category'] in ('KRITISK', 'HØY'):
+            return 80
+        return None
+    
+    def _categorize(self, result):
+        """Setter risikokategori og anbefalt handling fra VirusTotal-resultatet etter gjeldende policy"""
+        self.policy.categorize(result)
+    
+    def export_to_excel(self, filename="soc_reports.xlsx", reports=None):
         """
-        Eksporterer analyserapporter til Excel med detaljert formatering
+        Eksporterer analyserapporter til Excel med detaljert formatering.
+        Bruker report_history hvis reports ikke er gitt (f.eks. rader fra databasen).
         """
-        if not self.report_history:
+        reports = self.report_history if reports is None else list(reports)
+        if not reports:
             return "Ingen rapporter å eksportere"
             
         try:
+            # openpyxl lastes først ved eksport, ikke når analysatoren importeres
+            from openpyxl import Workbook
+            from openpyxl.styles import Font, PatternFill, Alignment
+            
             wb = Workbook()
             
             # Hovedark for alle analyser
@@ -120,7 +201,7 @@ class SOCAnalyzer:
             }
             
             # Skriv data til hovedark
-            for row, report in enumerate(self.report_history, 2):
+            for row, report in enumerate(reports, 2):
                 ws_main.cell(row=row, column=1, value=report.get('timestamp'))
                 ws_main.cell(row=row, column=2, value=report.get('url'))
                 
@@ -148,7 +229,7 @@ class SOCAnalyzer:
                 cell.font = header_font
                 cell.alignment = Alignment(horizontal='center')
             
-            for row, report in enumerate(self.report_history, 2):
+            for row, report in enumerate(reports, 2):
                 ws_mitre.cell(row=row, column=1, value=report.get('url'))
                 
                 if 'mitre_analysis' in report:
@@ -182,15 +263,16 @@ class SOCAnalyzer:
             print(f"Feil ved eksport: {str(e)}")
             return f"Feil ved eksport: {str(e)}"
     
-    def generate_summary(self):
+    def generate_summary(self, reports=None):
         """
         Genererer en oppsummering med tre risikokategorier
         """
-        if not self.report_history:
+        reports = self.report_history if reports is None else list(reports)
+        if not reports:
             return "Ingen analyser å oppsummere"
             
         summary = {
-            'total_analyzed': len(self.report_history),
+            'total_analyzed': len(reports),
             'risk_distribution': {
                 'HØY': {
                     'antall': 0,
@@ -209,15 +291,16 @@ class SOCAnalyzer:
                     'urls': []
                 }
             },
-            'latest_analysis': self.report_history[-1].get('timestamp', 'N/A')
+            'latest_analysis': reports[-1].get('timestamp', 'N/A')
         }
         
         # Samle URLer per kategori
-        for report in self.report_history:
+        for report in reports:
             category = report.get('risk_category', 'UKJENT')
             url = report.get('url', 'ukjent_url')
-            summary['risk_distribution'][category]['antall'] += 1
-            summary['risk_distribution'][category]['urls'].append({
+            distribution = summary['risk_distribution'].setdefault(category, {'antall': 0, 'urls': []})
+            distribution['antall'] += 1
+            distribution['urls'].append({
                 'url': url,
                 'score': report.get('risk_score', 'N/A')
             })
@@ -225,51 +308,8 @@ class SOCAnalyzer:
         return summary
     
     def _extract_indicators(self, analysis_result):
-        """Trekker ut relevante indikatorer for MITRE-analyse"""
-        indicators = {
-            'network_indicators': [],
-            'host_indicators': [],
-            'behavioral_patterns': []
-        }
-        
-        try:
-            # Nettverksindikatorer
-            if 'url' in analysis_result:
-                indicators['network_indicators'].append({
-                    'type': 'url',
-                    'value': analysis_result['url']
-                })
-                
-            if 'ip_addresses' in analysis_result:
-                indicators['network_indicators'].extend([
-                    {'type': 'ip', 'value': ip} 
-                    for ip in analysis_result['ip_addresses']
-                ])
-                
-            # Host-indikatorer
-            if 'downloaded_files' in analysis_result:
-                indicators['host_indicators'].extend([
-                    {'type': 'file', 'value': file_info}
-                    for file_info in analysis_result['downloaded_files']
-                ])
-                
-            # Atferdsmønstre
-            if 'risk_category' in analysis_result:
-                indicators['behavioral_patterns'].append({
-                    'type': 'risk_level',
-                    'value': analysis_result['risk_category']
-                })
-                
-            if 'action_required' in analysis_result:
-                indicators['behavioral_patterns'].append({
-                    'type': 'recommended_action',
-                    'value': analysis_result['action_required']
-                })
-                
-        except Exception as e:
-            print(f"Feil ved uttrekking av indikatorer: {str(e)}")
-            
-        return indicators
+        """Trekker ut relevante indikatorer for MITRE-analyse (se analyzers.indicators)"""
+        return extract_indicators(analysis_result)
 
 # Eksempel på bruk
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+from typing import Callable, Dict, Optional, Union
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+
+# Alle loggere i appen ligger under 'soc', f.eks. 'soc.analysis' og 'soc.mitre'
+ROOT_LOGGER = 'soc'
+# Poster som ikke får plass i køen kastes i stedet for å blokkere forespørselen
+QUEUE_SIZE = 10000
+
+Fields = Union[Dict, Callable[[], Dict], None]
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parser 'analysis.flow=0.01,mitre.score=0' til {hendelse: andel som logges}"""
+    rates = {}
+    for part in (value or '').split(','):
+        event, _, rate = part.partition('=')
+        if event.strip() and rate.strip():
+            rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class EventSampler:
+    """
+    Logger hver n-te post av en hendelsestype, der n = 1/andel. Tellingen er
+    deterministisk, så en andel på 0.1 gir nøyaktig hver tiende post.
+    """
+
+    def __init__(self, rates: Dict[str, float] = None):
+        self.rates = dict(rates or {})
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def sample(self, event: str) -> int:
+        """0 hvis posten skal droppes, ellers hvor mange poster den representerer"""
+        rate = self.rates.get(event, 1.0)
+        if rate >= 1.0:
+            return 1
+        if rate <= 0.0:
+            return 0
+        every = round(1 / rate)
+        with self._lock:
+            seen = self._seen.get(event, 0)
+            self._seen[event] = seen + 1
+        return every if seen % every == 0 else 0
+
+
+_sampler = EventSampler()
+
+
+def log_event(logger: logging.Logger, level: int, event: str, fields: Fields = None, message: str = None,
+              exc_info=None):
+    """
+    Logger en strukturert hendelse. Er nivået av, eller hendelsen samplet bort, gjøres
+    ingenting mer: fields kan være en funksjon som bygger feltene, og den kalles bare
+    når posten faktisk skal skrives. Serialisering skjer i skrivetråden, så feltene
+    må ikke endres etter kallet (send kopier av objekter som endres videre).
+    """
+    if not logger.isEnabledFor(level):
+        return
+    weight = _sampler.sample(event)
+    if not weight:
+        return
+    if callable(fields):
+        fields = fields()
+    extra = {'event': event, 'fields': fields or {}}
+    if weight > 1:
+        extra['sample_weight'] = weight
+    logger.log(level, message or event, exc_info=exc_info, extra=extra)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """Én JSON-linje per post: tid, nivå, logger, hendelse, melding og feltene"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': getattr(record, 'event', None),
+            'msg': record.getMessage(),
+            'thread': record.threadName
+        }
+        if getattr(record, 'sample_weight', None):
+            entry['sample_weight'] = record.sample_weight
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=_json_default)
+
+
+class TextFormatter(logging.Formatter):
+    """Lesbart format for utvikling: melding etterfulgt av feltene"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + json.dumps(fields, ensure_ascii=False, default=_json_default)
+        return line
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Legger poster i en begrenset kø uten å formatere dem; skrivetråden formaterer.
+    Er køen full, telles posten som droppet i stedet for å vente.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Standardversjonen formaterer meldingen i kallende tråd; det gjør skrivetråden her
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    """Kø, skrivetråd og sampling for 'soc'-loggerne (se configure_logging)"""
+
+    def __init__(self, level: int, fmt: str = 'json', sample_rates: Dict[str, float] = None, stream=None,
+                 queue_size: int = QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        writer = logging.StreamHandler(stream or sys.stderr)
+        writer.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        self.listener = QueueListener(self.queue, writer, respect_handler_level=False)
+        self.level = level
+        self.sample_rates = dict(sample_rates or {})
+
+    def start(self):
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.handlers = [self.handler]
+        logger.setLevel(self.level)
+        logger.propagate = False
+        _sampler.rates = self.sample_rates
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # Tømmer køen før prosessen avslutter
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def status(self) -> Dict:
+        return {
+            'level': logging.getLevelName(self.level),
+            'queued': self.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'sample_rates': self.sample_rates
+        }
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def configure_logging(level: str = 'INFO', fmt: str = 'json', sample: str = None, stream=None) -> LoggingPipeline:
+    """
+    Setter opp loggingen én gang per prosess: 'soc'-loggerne skriver via en kø til en
+    bakgrunnstråd med JSON- (eller tekst-) format. Senere kall gir samme pipeline.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            if isinstance(level, str):
+                level = logging.getLevelName(level.upper())
+            _pipeline = LoggingPipeline(
+                level if isinstance(level, int) else logging.INFO, fmt, parse_sample_rates(sample), stream
+            )
+            _pipeline.start()
+        return _pipeline
@@ -0,0 +1,154 @@
+from typing import Dict, Iterator, Optional
+from contextlib import contextmanager
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: ingen fillås, første prosess bygger uansett
+    fcntl = None
+
+# Hvor lenge nedlastet ATT&CK-data brukes før den hentes på nytt
+STORE_MAX_AGE = 7 * 24 * 3600
+# Hvor ofte vi prøver å erstatte fallback-data med ekte ATT&CK-data
+FALLBACK_RETRY_AGE = 3600
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+def techniques_version(techniques) -> str:
+    """Innholdshash av teknikkdataen, brukes som versjon og ETag"""
+    digest = hashlib.sha256()
+    for technique_id, data in sorted(techniques.items()):
+        digest.update(technique_id.encode('utf-8'))
+        digest.update(json.dumps(data, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class TechniqueStore:
+    """
+    Skrivebeskyttet ATT&CK-teknikkdata i en SQLite-fil som alle arbeidsprosesser
+    leser via mmap. Dataen bygges én gang (under fillås) og deles gjennom
+    operativsystemets sidecache i stedet for én kopi per prosess.
+    Oppfører seg som en dict for lesing: get, [], in, len, keys og items.
+    """
+
+    def __init__(self, path: str, cache_size: int = 256):
+        self.path = path
+        self._local = threading.local()
+        self._lookup = functools.lru_cache(maxsize=cache_size)(self._fetch)
+
+    @contextmanager
+    def build_lock(self):
+        """Eksklusiv lås slik at bare én prosess laster ned og bygger lageret"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def meta(self) -> Dict:
+        try:
+            rows = self._connection().execute('SELECT key, value FROM meta').fetchall()
+        except sqlite3.Error:
+            return {}
+        return dict(rows)
+
+    def version(self) -> str:
+        return self.meta().get('version') or techniques_version(dict(self.items()))
+
+    def needs_build(self, allow_download: bool = True) -> bool:
+        if not os.path.exists(self.path):
+            return True
+        meta = self.meta()
+        if not meta:
+            return True
+        if not allow_download:
+            return False
+        age = time.time() - float(meta.get('built_at', 0))
+        if meta.get('source') == 'fallback':
+            return age > FALLBACK_RETRY_AGE
+        return age > STORE_MAX_AGE
+
+    def build(self, techniques: Dict[str, Dict], source: str):
+        """Skriver teknikkene til en ny fil og bytter den inn atomisk"""
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.execute('CREATE TABLE techniques (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            connection.executemany(
+                'INSERT INTO techniques (id, data) VALUES (?, ?)',
+                ((technique_id, json.dumps(data)) for technique_id, data in techniques.items())
+            )
+            connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+                ('source', source or 'unknown'),
+                ('version', techniques_version(techniques)),
+                ('built_at', str(time.time())),
+                ('count', str(len(techniques)))
+            ])
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_path, self.path)
+        self.reopen()
+        print(f"ATT&CK-lager bygget med {len(techniques)} teknikker ({source}): {self.path}")
+
+    def reopen(self):
+        """Lukker trådens tilkobling og tømmer cachen, f.eks. etter ny build"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+        self._lookup.cache_clear()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            connection.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+            self._local.connection = connection
+        return connection
+
+    def _fetch(self, technique_id: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            'SELECT data FROM techniques WHERE id = ?', (technique_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, technique_id: str, default=None):
+        value = self._lookup(technique_id)
+        return default if value is None else value
+
+    def __getitem__(self, technique_id: str) -> Dict:
+        value = self._lookup(technique_id)
+        if value is None:
+            raise KeyError(technique_id)
+        return value
+
+    def __contains__(self, technique_id) -> bool:
+        return self._lookup(technique_id) is not None
+
+    def __len__(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM techniques').fetchone()[0]
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def keys(self) -> Iterator[str]:
+        for (technique_id,) in self._connection().execute('SELECT id FROM techniques ORDER BY id'):
+            yield technique_id
+
+    def items(self) -> Iterator:
+        for technique_id, data in self._connection().execute('SELECT id, data FROM techniques ORDER BY id'):
+            yield technique_id, json.loads(data)
@@ -0,0 +1,353 @@
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import glob
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from .domain_reputation import normalize_host, registered_domain
+
+BLOOM_MAGIC = b'BLM2'
+
+# Tegn som betyr at oppføringen er mer enn et rent vertsnavn
+URL_MARKERS = re.compile(r'[/:?@#\\]')
+
+
+class BloomFilter:
+    """Kompakt probabilistisk mengde: ingen falske negative, få falske positive"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        # Optimal antall bits og hashfunksjoner for ønsket falsk positiv-rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: bytes):
+        digest = hashlib.blake2b(value, digest_size=8).digest()
+        h1, h2 = struct.unpack('<II', digest)
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, value: bytes):
+        bits, size = self.bits, self.size
+        h1, h2 = struct.unpack('<II', hashlib.blake2b(value, digest_size=8).digest())
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % size
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def save(self, path: str):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(BLOOM_MAGIC + struct.pack('<QI', self.size, self.hash_count))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BloomFilter':
+        with open(path, 'rb') as f:
+            header = f.read(16)
+            if header[:4] != BLOOM_MAGIC:
+                raise ValueError(f"Ugyldig bloom-fil: {path}")
+            bloom = cls(1)
+            bloom.size, bloom.hash_count = struct.unpack('<QI', header[4:])
+            bloom.bits = bytearray(f.read())
+        if len(bloom.bits) != (bloom.size + 7) // 8:
+            raise ValueError(f"Avkortet bloom-fil: {path}")
+        return bloom
+
+
+def normalize_entry(value: str) -> str:
+    """Normaliserer en listeoppføring eller URL: vertsnavn alene, eller vert+sti uten skjema"""
+    value = value.strip()
+    if not value:
+        return ''
+    # Rask vei for rene vertsnavn, som er det vanligste i store lister
+    if not URL_MARKERS.search(value):
+        host = value.rstrip('.').lower()
+        return host[4:] if host.startswith('www.') else host
+    host = normalize_host(value)
+    if not host:
+        return ''
+    raw = value if value.startswith(('http://', 'https://')) else 'http://' + value
+    try:
+        parsed = urlparse(raw)
+    except ValueError:
+        return host
+    path = parsed.path.rstrip('/')
+    query = f'?{parsed.query}' if parsed.query else ''
+    return f'{host}{path}{query}'
+
+
+def lookup_candidates(url: str) -> List[str]:
+    """Alle oppføringer som kan matche URL-en: full URL, vertsnavn og overordnede domener"""
+    candidates = []
+    full = normalize_entry(url)
+    if full:
+        candidates.append(full)
+    host = normalize_host(url)
+    domain = registered_domain(url)
+    if host:
+        labels = host.split('.')
+        for i in range(len(labels)):
+            parent = '.'.join(labels[i:])
+            candidates.append(parent)
+            if parent == domain:
+                break
+    return list(dict.fromkeys(candidates))
+
+
+class SortedEntryFile:
+    """Sortert, normalisert kopi av en listefil som søkes binært via mmap (eksakt bekreftelse)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def __contains__(self, needle: bytes) -> bool:
+        mm = self._mm
+        if mm is None:
+            return False
+        lo, hi = 0, len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mm.rfind(b'\n', 0, mid) + 1
+            end = mm.find(b'\n', start)
+            if end == -1:
+                end = len(mm)
+            line = mm[start:end]
+            if line == needle:
+                return True
+            if line < needle:
+                lo = end + 1
+            else:
+                hi = start
+        return False
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+
+class URLList:
+    """Én liste (fil) med bloom-filter i minnet og sortert fil for eksakt bekreftelse"""
+
+    def __init__(self, source_path: str, cache_dir: str, error_rate: float = 0.01):
+        self.source_path = source_path
+        self.name = os.path.basename(source_path)
+        self.mtime = os.path.getmtime(source_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        digest = hashlib.sha1(os.path.abspath(source_path).encode('utf-8')).hexdigest()[:12]
+        sorted_path = os.path.join(cache_dir, f'{self.name}.{digest}.sorted')
+        bloom_path = os.path.join(cache_dir, f'{self.name}.{digest}.bloom')
+
+        cache_fresh = all(
+            os.path.exists(path) and os.path.getmtime(path) >= self.mtime
+            for path in (sorted_path, bloom_path)
+        )
+        if cache_fresh:
+            self.bloom = BloomFilter.load(bloom_path)
+            self.count = None
+        else:
+            entries = self._read_entries(source_path)
+            self.count = len(entries)
+            self.bloom = BloomFilter(len(entries), error_rate)
+            for entry in entries:
+                self.bloom.add(entry)
+            tmp_path = f'{sorted_path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(b'\n'.join(entries))
+            os.replace(tmp_path, sorted_path)
+            self.bloom.save(bloom_path)
+            del entries
+        self.sorted_entries = SortedEntryFile(sorted_path)
+
+    @staticmethod
+    def _read_entries(path: str) -> List[bytes]:
+        entries = set()
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                # Støtter også hosts-filer ("0.0.0.0 domene")
+                if ' ' in line or '\t' in line:
+                    line = line.split()[-1]
+                entry = normalize_entry(line)
+                if entry:
+                    entries.add(entry.encode('utf-8'))
+        return sorted(entries)
+
+    def match(self, candidates: List[bytes]) -> Optional[str]:
+        for candidate in candidates:
+            if candidate in self.bloom and candidate in self.sorted_entries:
+                return candidate.decode('utf-8')
+        return None
+
+    def close(self):
+        self.sorted_entries.close()
+
+
+class _ListGeneration:
+    """
+    Listene fra én innlasting. Oppslag holder en referanse mens de søker i mmap-ene,
+    så en innlasting som bytter listene ut lukker dem først når siste oppslag er ferdig.
+    """
+
+    def __init__(self, lists: Dict[str, List[URLList]]):
+        self.lists = lists
+        self._users = 0
+        self._retired = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """False hvis generasjonen allerede er lukket (den er da byttet ut)"""
+        with self._lock:
+            if self._closed:
+                return False
+            self._users += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            close = self._retired and self._users == 0 and not self._closed
+            self._closed = self._closed or close
+        if close:
+            self._close()
+
+    def retire(self):
+        """Byttet ut: lukkes nå hvis ingen oppslag bruker den, ellers av siste release"""
+        with self._lock:
+            self._retired = True
+            close = self._users == 0 and not self._closed
+            self._closed = self._closed or close
+        if close:
+            self._close()
+
+    def _close(self):
+        for url_list in [l for lists in self.lists.values() for l in lists]:
+            url_list.close()
+
+
+class URLListMatcher:
+    """
+    Tillatelses- og blokkeringslister som gir umiddelbare verdikter uten VirusTotal.
+    Filene i listekatalogene lastes inn i bloom-filtre og lastes atomisk på nytt
+    i bakgrunnen når de endres.
+    """
+
+    VERDICTS = {
+        'blocklist': ('KRITISK', 'KRITISK: URL finnes på blokkeringsliste - isoler og håndter umiddelbart!'),
+        'allowlist': ('LAV', 'Ingen handling nødvendig - URL finnes på tillatelsesliste')
+    }
+
+    def __init__(self, lists_dir: str, check_interval: float = 10.0, error_rate: float = 0.01):
+        self.lists_dir = lists_dir
+        self.cache_dir = os.path.join(lists_dir, '.cache')
+        self.check_interval = check_interval
+        self.error_rate = error_rate
+        self._generation = _ListGeneration({'blocklist': [], 'allowlist': []})
+        self._signature = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self.reload()
+
+    def _list_files(self) -> Dict[str, List[str]]:
+        return {
+            kind: sorted(glob.glob(os.path.join(self.lists_dir, kind, '*.txt')))
+            for kind in self.VERDICTS
+        }
+
+    def _current_signature(self, files: Dict[str, List[str]]):
+        return tuple(
+            (path, os.path.getmtime(path), os.path.getsize(path))
+            for kind in sorted(files) for path in files[kind]
+        )
+
+    def reload(self):
+        """Bygger nye lister og bytter dem inn atomisk; gamle lister brukes til da"""
+        with self._reload_lock:
+            try:
+                files = self._list_files()
+                signature = self._current_signature(files)
+                if signature == self._signature:
+                    return False
+                start = time.time()
+                new_lists = {
+                    kind: [URLList(path, self.cache_dir, self.error_rate) for path in paths]
+                    for kind, paths in files.items()
+                }
+                old_generation, self._generation = self._generation, _ListGeneration(new_lists)
+                self._signature = signature
+                print(f"URL-lister lastet ({sum(len(v) for v in new_lists.values())} filer) "
+                      f"på {time.time() - start:.2f}s")
+                # Oppslag som fortsatt søker i de gamle listene, får fullføre før de lukkes
+                old_generation.retire()
+                return True
+            except Exception as e:
+                print(f"Feil ved lasting av URL-lister: {str(e)}")
+                return False
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        if self._reload_thread and self._reload_thread.is_alive():
+            return
+        try:
+            changed = self._current_signature(self._list_files()) != self._signature
+        except OSError:
+            changed = True
+        if changed:
+            self._reload_thread = threading.Thread(target=self.reload, daemon=True)
+            self._reload_thread.start()
+
+    def match(self, url: str) -> Optional[Dict]:
+        """Returnerer {'list', 'name', 'entry'} for første treff (blokkering før tillatelse)"""
+        self._maybe_reload()
+        candidates = [candidate.encode('utf-8') for candidate in lookup_candidates(url)]
+        if not candidates:
+            return None
+        # Lukket generasjon betyr at listene nettopp er byttet ut; da brukes de nye
+        generation = self._generation
+        while not generation.acquire():
+            generation = self._generation
+        try:
+            for kind in ('blocklist', 'allowlist'):
+                for url_list in generation.lists[kind]:
+                    entry = url_list.match(candidates)
+                    if entry:
+                        return {'list': kind, 'name': url_list.name, 'entry': entry}
+            return None
+        finally:
+            generation.release()
+
+    def build_result(self, url: str, match: Dict) -> Dict:
+        """Bygger et analyseresultat fra et listetreff, med opphav"""
+        url = url.strip()
+        if not url.startswith(('http://', 'https://')):
+            url = 'http://' + url
+        category, action = self.VERDICTS[match['list']]
+        return {
+            'url': url,
+            'status': 'completed',
+            'source': f"{match['list']}:{match['name']}"[:50],
+            'list_match': match,
+            'risk_score': 'N/A',
+            'permalink': '',
+            'risk_category': category,
+            'action_required': action
+        }
@@ -0,0 +1,207 @@
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+import hashlib
+import random
+import re
+import struct
+
+from .domain_reputation import CATEGORY_ACTIONS, VERDICT_CATEGORIES, registered_domain
+
+# 64 permutasjoner i 16 bånd à 4 rader: URLer med Jaccard-likhet rundt 0,5 eller
+# mer havner i samme bøtte i minst ett bånd med høy sannsynlighet
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# For få tokens gir tilfeldige treff (f.eks. bare 'example' og 'com')
+MIN_TOKENS = 3
+# Estimert Jaccard-likhet mot klyngens representant for å regnes som medlem
+MIN_SIMILARITY = 0.6
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1729)
+# Faste koeffisienter, slik at signaturer er sammenlignbare på tvers av prosesser og omstarter
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+_SIGNATURE = struct.Struct(f'<{NUM_PERM}I')
+
+_SEPARATORS = re.compile(r'([-_.~]+)')
+
+
+def _shape_part(part: str) -> str:
+    if part.isdigit():
+        return '<num>'
+    digits = sum(1 for char in part if char.isdigit())
+    if len(part) >= 6 and digits >= 2 and part.isalnum():
+        return f'<rand{min(len(part) // 8, 4)}>'
+    return part.lower()
+
+
+def _shape(token: str) -> str:
+    """
+    Tilfeldige deler (ID-er, hasher, sesjonsnøkler, tall) byttes ut med formen sin,
+    slik at URLer fra samme phishing-kit får like tokens: 'page-70' -> 'page-<num>',
+    'a8f3k2q1' -> '<rand1>', mens 'login.php' og 'secure-account' beholdes.
+    """
+    return ''.join(
+        part if index % 2 else _shape_part(part)
+        for index, part in enumerate(_SEPARATORS.split(token))
+    )
+
+
+def url_tokens(url: str) -> Set[str]:
+    """
+    Tokens for en URL: vertsetiketter, stisegmenter og spørrenøkler, med posisjon der det
+    betyr noe. Registrert domene beholdes ordrett; bare underdomener og stien formes.
+    """
+    url = (url or '').strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'http://' + url
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').rstrip('.')
+    except ValueError:
+        return set()
+    if host.startswith('www.'):
+        host = host[4:]
+
+    domain = registered_domain(host)
+    subdomain = host[:-len(domain)].rstrip('.') if domain and host.endswith(domain) else host
+    # Registrert domene teller dobbelt, så korte, generiske stier på ulike domener ikke slås sammen
+    tokens = {f'd:{domain}', f'd2:{domain}'} if domain else set()
+    for label in subdomain.split('.'):
+        if label:
+            tokens.add(f'h:{_shape(label)}')
+    for position, segment in enumerate(segment for segment in parts.path.split('/') if segment):
+        shaped = _shape(segment)
+        tokens.add(f'p:{shaped}')
+        tokens.add(f'p{position}:{shaped}')
+    for key, _ in parse_qsl(parts.query, keep_blank_values=True):
+        tokens.add(f'q:{key.lower()}')
+    return tokens
+
+
+def minhash(tokens: Iterable[str]) -> Optional[Tuple[int, ...]]:
+    """MinHash-signatur, eller None hvis URLen har for få tokens til å klynges"""
+    values = [
+        int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+        for token in set(tokens)
+    ]
+    if len(values) < MIN_TOKENS:
+        return None
+    return tuple(
+        min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in values)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def url_signature(url: str) -> Optional[Tuple[int, ...]]:
+    return minhash(url_tokens(url))
+
+
+def band_keys(signature: Tuple[int, ...]) -> List[str]:
+    """LSH-bøtter: én nøkkel per bånd av signaturen"""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<{ROWS}I', *rows), digest_size=8).hexdigest()
+        keys.append(f'{band}:{digest}')
+    return keys
+
+
+def pack_signature(signature: Tuple[int, ...]) -> bytes:
+    return _SIGNATURE.pack(*signature)
+
+
+def unpack_signature(data: bytes) -> Tuple[int, ...]:
+    return _SIGNATURE.unpack(data)
+
+
+def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """Estimert Jaccard-likhet: andel like posisjoner i signaturene"""
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERM
+
+
+def best_cluster(signature: Tuple[int, ...], candidates: Iterable[Tuple[int, bytes]],
+                 min_similarity: float = MIN_SIMILARITY) -> Optional[Tuple[int, float]]:
+    """
+    (klynge-ID, likhet) for kandidaten som ligner mest, hvis den er lik nok. Ved lik
+    likhet vinner laveste ID, så inkrementell plassering og ombygging gir samme svar.
+    """
+    best = None
+    for cluster_id, packed in candidates:
+        score = similarity(signature, unpack_signature(packed))
+        if score >= min_similarity and (best is None or (-score, cluster_id) < (-best[1], best[0])):
+            best = (cluster_id, score)
+    return best
+
+
+class UrlClusterPolicy:
+    """
+    Avgjør om en URL kan forhåndsscores (eller besvares) fra verdiktene i klyngen av
+    nesten like URLer den havner i. Oppslaget går via LSH-bøttene, så kostnaden
+    avhenger av antall bånd og ikke av hvor mange analyser som er lagret.
+    """
+
+    def __init__(self, lookup: Callable[[List[str]], List[Dict]], min_size: int = 5,
+                 min_agreement: float = 0.9, answer: bool = False, answer_categories=('KRITISK', 'HØY')):
+        # lookup(band_keys) -> [{'id', 'size', 'category_counts', 'signature'}, ...]
+        self.lookup = lookup
+        self.min_size = min_size
+        self.min_agreement = min_agreement
+        self.answer = answer
+        self.answer_categories = tuple(answer_categories)
+
+    def evaluate(self, url: str) -> Optional[Dict]:
+        """
+        None hvis URLen ikke ligner noen klynge, ellers et verdikt med decision
+        'answer' (stor klynge med entydig verdikt, og svar er slått på) eller 'prescore'.
+        """
+        signature = url_signature(url)
+        if signature is None:
+            return None
+        clusters = {cluster['id']: cluster for cluster in self.lookup(band_keys(signature))}
+        match = best_cluster(signature, ((cluster_id, cluster['signature']) for cluster_id, cluster in clusters.items()))
+        if match is None:
+            return None
+
+        cluster = clusters[match[0]]
+        counts = {category: count for category, count in (cluster['category_counts'] or {}).items()
+                  if category in VERDICT_CATEGORIES}
+        total = sum(counts.values())
+        verdict = {
+            'cluster_id': cluster['id'],
+            'similarity': round(match[1], 3),
+            'size': cluster['size'],
+            'dominant_category': None,
+            'agreement': 0.0,
+            'decision': 'prescore'
+        }
+        if total:
+            dominant_category, dominant_count = max(counts.items(), key=lambda item: item[1])
+            verdict['dominant_category'] = dominant_category
+            verdict['agreement'] = round(dominant_count / total, 3)
+            if (self.answer and total >= self.min_size and verdict['agreement'] >= self.min_agreement
+                    and dominant_category in self.answer_categories):
+                verdict['decision'] = 'answer'
+        return verdict
+
+    def build_result(self, url: str, verdict: Dict) -> Dict:
+        """Bygger et analyseresultat fra klyngens etablerte verdikt"""
+        url = url.strip()
+        if not url.startswith(('http://', 'https://')):
+            url = 'http://' + url
+        return {
+            'url': url,
+            'status': 'completed',
+            'source': 'url_cluster',
+            'positives': 0,
+            'total_scans': 0,
+            'scan_date': '',
+            'risk_score': 'N/A',
+            'permalink': '',
+            'risk_category': verdict['dominant_category'],
+            'action_required': (
+                f"{CATEGORY_ACTIONS[verdict['dominant_category']]} "
+                f"(basert på {verdict['size']} lignende URLer i klynge {verdict['cluster_id']})"
+            )
+        }
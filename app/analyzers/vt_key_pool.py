@@ -0,0 +1,326 @@
+from typing import Dict, List, Optional
+from collections import deque
+from datetime import date
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from .quota_ledger import QuotaLedger, PERMANENT
+
+# Grensene for VirusTotals offentlige API
+DEFAULT_PER_MINUTE = 4
+DEFAULT_PER_DAY = 500
+# Lengste ventetid før den delte kvoteboken sjekkes på nytt
+LEDGER_POLL_INTERVAL = 1.0
+
+
+class NoKeyAvailableError(Exception):
+    """Ingen API-nøkkel har kapasitet innen tidsfristen"""
+
+
+class QuotaBucket:
+    """Kvote for én nøkkel: glidende minuttvindu og teller per døgn"""
+
+    def __init__(self, per_minute: int = DEFAULT_PER_MINUTE, per_day: int = DEFAULT_PER_DAY,
+                 window_seconds: float = 60.0):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.window_seconds = window_seconds
+        self.recent = deque()
+        self.day = date.today()
+        self.used_today = 0
+
+    def _expire(self, now: float):
+        while self.recent and now - self.recent[0] >= self.window_seconds:
+            self.recent.popleft()
+        today = date.today()
+        if today != self.day:
+            self.day = today
+            self.used_today = 0
+
+    def remaining(self, now: float) -> int:
+        self._expire(now)
+        minute_left = self.per_minute - len(self.recent) if self.per_minute else float('inf')
+        day_left = self.per_day - self.used_today if self.per_day else float('inf')
+        return max(0, min(minute_left, day_left))
+
+    def remaining_today(self) -> Optional[int]:
+        return self.per_day - self.used_today if self.per_day else None
+
+    def seconds_until_available(self, now: float) -> float:
+        self._expire(now)
+        if self.per_day and self.used_today >= self.per_day:
+            return float('inf')
+        if self.per_minute and len(self.recent) >= self.per_minute:
+            return self.window_seconds - (now - self.recent[0])
+        return 0.0
+
+    def consume(self, now: float):
+        self.recent.append(now)
+        self.used_today += 1
+
+    def exhaust_minute(self, now: float):
+        """VirusTotal har sagt 204: regn minuttkvoten som brukt opp"""
+        while self.per_minute and len(self.recent) < self.per_minute:
+            self.recent.append(now)
+
+
+class VTApiKey:
+    def __init__(self, key: str, per_minute: int = DEFAULT_PER_MINUTE, per_day: int = DEFAULT_PER_DAY,
+                 label: str = '', window_seconds: float = 60.0):
+        self.key = key
+        self.label = label
+        self.bucket = QuotaBucket(per_minute, per_day, window_seconds)
+        self.quarantined_until = 0.0
+        self.quarantine_reason = None
+        self.stats = {'requests': 0, 'rate_limited': 0, 'auth_errors': 0}
+
+    @property
+    def key_id(self) -> str:
+        """Stabil identitet for nøkkelen i den delte kvoteboken, uten selve nøkkelen"""
+        return hashlib.sha256(self.key.encode('utf-8')).hexdigest()[:16]
+
+    @property
+    def masked(self) -> str:
+        return f"{self.key[:4]}…{self.key[-4:]}" if len(self.key) > 8 else '****'
+
+
+class VTKeyPool:
+    """
+    Fordeler VirusTotal-kall på flere API-nøkler. Hvert kall får nøkkelen med
+    mest gjenværende kapasitet; nøkler som gir 204 eller autentiseringsfeil
+    settes i karantene i stedet for at hele arbeideren venter.
+    Med en QuotaLedger deles kvoten med alle andre prosesser som bruker samme nøkler.
+    """
+
+    def __init__(self, keys: List[VTApiKey], rate_limit_cooldown: float = 60.0, ledger: QuotaLedger = None):
+        if not keys:
+            raise ValueError("VTKeyPool trenger minst én API-nøkkel")
+        self.keys = keys
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.condition = threading.Condition()
+        # Ventende kall ordnet etter prioritet, slik at mistenkelige URLer får kvote først
+        self.waiters = []
+        self._sequence = itertools.count()
+        self.ledger = None
+        self._ticket = None
+        if ledger is None and os.environ.get('VT_QUOTA_LEDGER'):
+            ledger = QuotaLedger(os.environ['VT_QUOTA_LEDGER'])
+        if ledger is not None:
+            self.attach_ledger(ledger)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_environment(cls, default_key: str = None, window_seconds: float = 60.0) -> 'VTKeyPool':
+        """
+        Leser nøkler fra konfigurasjon, i prioritert rekkefølge:
+        VIRUSTOTAL_KEYS_FILE (JSON-liste med key/per_minute/per_day/label),
+        VIRUSTOTAL_API_KEYS ("nøkkel[:per_minutt[:per_døgn]],...") og til slutt én enkelt nøkkel.
+        """
+        keys_file = os.environ.get('VIRUSTOTAL_KEYS_FILE')
+        if keys_file:
+            with open(keys_file, encoding='utf-8') as f:
+                entries = json.load(f)
+            return cls([
+                VTApiKey(entry['key'], entry.get('per_minute', DEFAULT_PER_MINUTE),
+                         entry.get('per_day', DEFAULT_PER_DAY), entry.get('label', ''), window_seconds)
+                for entry in entries
+            ])
+
+        keys_value = os.environ.get('VIRUSTOTAL_API_KEYS')
+        if keys_value:
+            return cls.from_string(keys_value, window_seconds)
+
+        return cls([VTApiKey(default_key or os.environ.get('VIRUSTOTAL_API_KEY', "you virustotal api key"),
+                             window_seconds=window_seconds)])
+
+    @classmethod
+    def from_string(cls, value: str, window_seconds: float = 60.0) -> 'VTKeyPool':
+        keys = []
+        for entry in value.split(','):
+            parts = entry.strip().split(':')
+            if not parts[0]:
+                continue
+            per_minute = int(parts[1]) if len(parts) > 1 and parts[1] else DEFAULT_PER_MINUTE
+            per_day = int(parts[2]) if len(parts) > 2 and parts[2] else DEFAULT_PER_DAY
+            keys.append(VTApiKey(parts[0], per_minute, per_day, window_seconds=window_seconds))
+        return cls(keys)
+
+    def set_window(self, seconds: float):
+        """Endrer kvotevindu og karantenetid, f.eks. mot en tidsskalert stand-in"""
+        with self.condition:
+            self.rate_limit_cooldown = seconds
+            for key in self.keys:
+                key.bucket.window_seconds = seconds
+
+    def attach_ledger(self, ledger: QuotaLedger):
+        """Koordinerer kvoten med andre prosesser gjennom en delt kvotebok"""
+        with self.condition:
+            self.ledger = ledger
+            self._keys_by_id = {key.key_id: key for key in self.keys}
+
+    def _ledger_keys(self) -> List[tuple]:
+        return [(key.key_id, key.bucket.per_minute, key.bucket.per_day, key.bucket.window_seconds)
+                for key in self.keys]
+
+    def _acquire_shared(self, priority: int, now: float):
+        """Reserverer et kall i den delte kvoteboken, returnerer (nøkkel, ventetid)"""
+        self._ticket, key_id, wait = self.ledger.try_acquire(self._ledger_keys(), priority, self._ticket)
+        if key_id is None:
+            return None, wait
+        key = self._keys_by_id[key_id]
+        key.bucket.consume(now)
+        key.stats['requests'] += 1
+        return key, 0.0
+
+    def _available(self, key: VTApiKey, now: float) -> bool:
+        return now >= key.quarantined_until and key.bucket.remaining(now) > 0
+
+    def acquire(self, timeout: Optional[float] = None, priority: int = 0) -> VTApiKey:
+        """
+        Reserverer ett kall på nøkkelen med mest gjenværende kapasitet.
+        Når flere tråder venter, får høyest prioritet neste ledige kall.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        entry = (-priority, next(self._sequence))
+        acquired = False
+        with self.condition:
+            heapq.heappush(self.waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.ledger is not None:
+                        # Bare den første i prosessens egen kø står i den felles køen
+                        if self.waiters[0] == entry:
+                            key, wait = self._acquire_shared(priority, now)
+                            if key:
+                                acquired = True
+                                return key
+                            if wait != float('inf'):
+                                wait = min(wait, LEDGER_POLL_INTERVAL)
+                        else:
+                            wait = LEDGER_POLL_INTERVAL
+                    else:
+                        candidates = [key for key in self.keys if self._available(key, now)]
+                        if candidates and self.waiters[0] == entry:
+                            key = max(candidates, key=lambda k: k.bucket.remaining(now))
+                            key.bucket.consume(now)
+                            key.stats['requests'] += 1
+                            return key
+                        wait = min(self._seconds_until_available(key, now) for key in self.keys)
+
+                    if wait == float('inf'):
+                        raise NoKeyAvailableError("Alle API-nøkler er i karantene eller har brukt opp døgnkvoten")
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise NoKeyAvailableError("Ingen API-nøkkel ledig innen tidsfristen")
+                        wait = min(wait, remaining)
+                    self.condition.wait(max(wait, 0.01))
+            finally:
+                if self.ledger is not None and not acquired and self._ticket is not None \
+                        and self.waiters[0] == entry:
+                    self.ledger.release(self._ticket)
+                    self._ticket = None
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+    def _seconds_until_available(self, key: VTApiKey, now: float) -> float:
+        if key.quarantine_reason == 'auth':
+            return float('inf')
+        return max(key.quarantined_until - now, key.bucket.seconds_until_available(now))
+
+    def report(self, key: VTApiKey, status_code: int):
+        """Registrerer utfallet av et kall og setter nøkkelen i karantene ved behov"""
+        with self.condition:
+            now = time.monotonic()
+            if self.ledger is not None:
+                self.ledger.completed()
+            if status_code == 204:
+                key.stats['rate_limited'] += 1
+                key.bucket.exhaust_minute(now)
+                key.quarantined_until = now + self.rate_limit_cooldown
+                key.quarantine_reason = 'rate_limit'
+                if self.ledger is not None:
+                    self.ledger.rate_limited(key.key_id, key.bucket.per_minute, self.rate_limit_cooldown)
+                print(f"VT-nøkkel {key.masked} nådde rate limit, karantene i {self.rate_limit_cooldown:.0f}s")
+            elif status_code in (401, 403):
+                key.stats['auth_errors'] += 1
+                key.quarantined_until = float('inf')
+                key.quarantine_reason = 'auth'
+                if self.ledger is not None:
+                    self.ledger.rejected(key.key_id)
+                print(f"VT-nøkkel {key.masked} ble avvist (status {status_code}), satt i karantene")
+            elif key.quarantine_reason == 'rate_limit' and now >= key.quarantined_until:
+                key.quarantine_reason = None
+            self.condition.notify_all()
+
+    def remaining_capacity(self) -> int:
+        """Antall kall som kan gjøres nå uten å vente"""
+        with self.condition:
+            if self.ledger is not None:
+                states = self.ledger.key_states(self._ledger_keys())
+                return sum(state['remaining'] for state in states.values())
+            now = time.monotonic()
+            return sum(key.bucket.remaining(now) for key in self.keys if now >= key.quarantined_until)
+
+    def remaining_today(self) -> Optional[int]:
+        """Gjenstående døgnkvote for nøkler som ikke er avvist, None hvis ubegrenset"""
+        remaining = 0
+        for key in self.status():
+            if key['quarantine_reason'] == 'auth':
+                continue
+            if key['remaining_today'] is None:
+                return None
+            remaining += key['remaining_today']
+        return remaining
+
+    def status(self) -> List[Dict]:
+        """Status per nøkkel for rapportering (maskerte nøkler)"""
+        with self.condition:
+            if self.ledger is not None:
+                return self._shared_status()
+            now = time.monotonic()
+            return [{
+                'key': key.masked,
+                'label': key.label,
+                'remaining_minute': key.bucket.remaining(now),
+                'remaining_today': key.bucket.remaining_today(),
+                'quarantined': now < key.quarantined_until,
+                'quarantine_reason': key.quarantine_reason if now < key.quarantined_until else None,
+                'quarantine_seconds_left': (
+                    None if key.quarantined_until == float('inf')
+                    else round(max(0.0, key.quarantined_until - now), 1)
+                ),
+                **key.stats
+            } for key in self.keys]
+
+    def _shared_status(self) -> List[Dict]:
+        """Status fra den delte kvoteboken: gjelder alle prosesser, ikke bare denne"""
+        states = self.ledger.key_states(self._ledger_keys())
+        now = time.time()
+        status = []
+        for key in self.keys:
+            state = states[key.key_id]
+            quarantined = state['quarantined_until'] > now
+            status.append({
+                'key': key.masked,
+                'label': key.label,
+                'remaining_minute': state['remaining_minute'],
+                'remaining_today': state['remaining_today'],
+                'quarantined': quarantined,
+                'quarantine_reason': state['quarantine_reason'] if quarantined else None,
+                'quarantine_seconds_left': (
+                    None if state['quarantined_until'] >= PERMANENT
+                    else round(max(0.0, state['quarantined_until'] - now), 1)
+                ),
+                **key.stats
+            })
+        return status
@@ -1,44 +1,356 @@
-from flask import Flask, render_template, request, send_file, jsonify
+from flask import Blueprint, Flask, abort, current_app, redirect, render_template, request, send_file, jsonify, url_for
 from analyzers.soc_analyzer import SOCAnalyzer
+from analyzers.mitre_analyzer import MitreAttackAnalyzer
+from analyzers.domain_reputation import DomainReputationPolicy, registered_domain
+from analyzers.priority_scheduler import PriorityScheduler
+from analyzers.url_lists import URLListMatcher
+from analyzers.quota_ledger import QuotaLedger
+from analyzers.single_flight import InflightTable, SingleFlight
+from analyzers.indicators import INDICATOR_TYPES, query_keys
+from analyzers.url_similarity import UrlClusterPolicy
+from analyzers.deadline import Deadline, DeadlineExceeded
+from analyzers.structured_log import configure_logging, get_logger, log_event
+from analyzers.categorization import DEFAULT_POLICY_VERSION, load_policies
+from analyzers.enrichment import build_pipeline
 import os
 import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-from models import db, Analysis
-from reporting.report_generator import ReportGenerator
+from models import (db, Analysis, DomainReputation, DeferredURL, Indicator, PendingAnalysis, RecategorizationRun,
+                    UrlCluster, VerdictChange, upgrade_schema, rebuild_domain_reputation, rebuild_indicator_index,
+                    indicator_sightings, url_clusters_for, url_cluster_sizes,
+                    analysis_summary, analysis_timeline, data_generation, unmigrated_analyses)
+from commands import register_commands
+from pending import PENDING_TIMEOUT, PendingAnalyses, expire_stale_pending, new_handle, pending_result
+from profiling import PROFILE_MODES, RequestProfiler
+from recategorize import RecategorizationJobs
+from response_cache import ResponseCache
+from rescan import (BackgroundJobs, parse_max_age, process_deferred_urls, rescan_stale_verdicts,
+                    select_stale_verdicts)
+from retention import (AnalysisArchive, all_analyses, archive_old_analyses, archived_aggregates,
+                       paginate_analyses, retention_status, vacuum_database)
+from reporting.statistics import calculate_period_stats
 
-# Database setup
-basedir = os.path.abspath(os.path.dirname(__file__))
-instance_path = os.path.join(basedir, 'instance')
+# Rapportmodulene (matplotlib, ReportLab, pandas) og openpyxl importeres først
+# når en rapport eller eksport faktisk lages, så vanlige arbeidere starter raskt.
 
-# Sørg for at instance-mappen eksisterer
-if not os.path.exists(instance_path):
-    os.makedirs(instance_path)
+basedir = os.path.abspath(os.path.dirname(__file__))
 
-app = Flask(__name__, static_url_path='/static')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(instance_path, "soc_analysis.db")}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+main = Blueprint('main', __name__)
+analysis_logger = get_logger('analysis')
+report_logger = get_logger('report')
 
-db.init_app(app)
+def create_app(config=None):
+    """
+    Bygger Flask-appen. All oppstartsarbeid (database, lister, analysatorer)
+    skjer her og ikke ved import, f.eks. `gunicorn 'app:create_app()'`.
+    """
+    app = Flask(__name__, static_url_path='/static')
+    instance_path = os.path.join(basedir, 'instance')
+    
+    # Sørg for at instance-mappen eksisterer
+    if not os.path.exists(instance_path):
+        os.makedirs(instance_path)
+    
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=os.environ.get(
+            'DATABASE_URL', f'sqlite:///{os.path.join(instance_path, "soc_analysis.db")}'
+        ),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # Strukturert logging via kø til en skrivetråd; LOG_SAMPLE='analysis.mitre=0.01' sampler per hendelse
+        LOG_LEVEL=os.environ.get('LOG_LEVEL', 'INFO'),
+        LOG_FORMAT=os.environ.get('LOG_FORMAT', 'json'),
+        LOG_SAMPLE=os.environ.get('LOG_SAMPLE', ''),
+        # Tillatelses-/blokkeringslister: <URL_LISTS_DIR>/allowlist/*.txt og blocklist/*.txt
+        URL_LISTS_DIR=os.environ.get('URL_LISTS_DIR', os.path.join(instance_path, 'lists')),
+        MITRE_STORE_PATH=os.environ.get('MITRE_STORE_PATH', os.path.join(instance_path, 'attack_techniques.db')),
+        VT_QUOTA_LEDGER=os.environ.get('VT_QUOTA_LEDGER', os.path.join(instance_path, 'vt_quota.db')),
+        # Pågående URL-oppslag delt mellom arbeidsprosessene, og hvor lenge resultatet gjenbrukes
+        SINGLE_FLIGHT_PATH=os.environ.get('SINGLE_FLIGHT_PATH', os.path.join(instance_path, 'inflight.db')),
+        SINGLE_FLIGHT_TTL=float(os.environ.get('SINGLE_FLIGHT_TTL', '30')),
+        # Antall URLer i én /analyze-forespørsel som slås opp samtidig (1 = én og én)
+        ANALYZE_CONCURRENCY=int(os.environ.get('ANALYZE_CONCURRENCY', '8')),
+        # Standard tidsfrist i sekunder for /analyze (0 = ingen); klienten kan sende deadline=
+        ANALYZE_DEADLINE=float(os.environ.get('ANALYZE_DEADLINE', '0')),
+        # URLer i en klynge med entydig farlig verdikt besvares uten VirusTotal (ellers bare forhåndsscore)
+        URL_CLUSTER_ANSWER=os.environ.get('URL_CLUSTER_ANSWER', '0') == '1',
+        # Analyser eldre enn RETENTION_DAYS flyttes til komprimerte månedsfiler i ARCHIVE_DIR
+        ARCHIVE_DIR=os.environ.get('ARCHIVE_DIR', os.path.join(instance_path, 'archive')),
+        RETENTION_DAYS=int(os.environ.get('RETENTION_DAYS', '180')),
+        # Planlagt re-skanning av gamle verdikter og behandling av utsatte URLer. Av som standard,
+        # så tester, CLI-kommandoer og skript som bygger appen ikke starter jobber; serveren slår dem på
+        SCHEDULER_ENABLED=os.environ.get('SCHEDULER_ENABLED', '0') == '1',
+        SCHEDULER_LOCK=os.environ.get('SCHEDULER_LOCK', os.path.join(instance_path, 'scheduler.lock')),
+        RESCAN_INTERVAL_MINUTES=float(os.environ.get('RESCAN_INTERVAL_MINUTES', '30')),
+        RESCAN_MAX_AGE=parse_max_age(os.environ.get('RESCAN_MAX_AGE')),
+        RESCAN_MAX_URLS=int(os.environ.get('RESCAN_MAX_URLS', '100')),
+        RESCAN_QUOTA_SHARE=float(os.environ.get('RESCAN_QUOTA_SHARE', '0.5')),
+        # Profilering av enkeltforespørsler og tracemalloc (av som standard; da registreres ingen kroker)
+        PROFILING_ENABLED=os.environ.get('PROFILING', '0') == '1',
+        PROFILE_DIR=os.environ.get('PROFILE_DIR', os.path.join(instance_path, 'profiles')),
+        PROFILE_TOKEN=os.environ.get('PROFILE_TOKEN'),
+        # Versjonen av kategoriseringspolicyen nye analyser får; egne versjoner defineres i JSON-filen
+        CATEGORIZATION_POLICY=os.environ.get('CATEGORIZATION_POLICY', DEFAULT_POLICY_VERSION),
+        CATEGORIZATION_POLICIES_FILE=os.environ.get(
+            'CATEGORIZATION_POLICIES_FILE', os.path.join(instance_path, 'categorization_policies.json')
+        ),
+        # Berikelse som kjører samtidig med VirusTotal, f.eks. 'dns:1.5,whois:3,passive_dns' (av som standard)
+        ENRICHMENT_STAGES=os.environ.get('ENRICHMENT_STAGES', ''),
+        ENRICHMENT_WORKERS=int(os.environ.get('ENRICHMENT_WORKERS', '16')),
+        ENRICHMENT_DNS_URL=os.environ.get('ENRICHMENT_DNS_URL'),
+        ENRICHMENT_RDAP_URL=os.environ.get('ENRICHMENT_RDAP_URL', 'https://rdap.org/'),
+        ENRICHMENT_PDNS_URL=os.environ.get('ENRICHMENT_PDNS_URL'),
+        ENRICHMENT_PDNS_TOKEN=os.environ.get('ENRICHMENT_PDNS_TOKEN')
+    )
+    if config:
+        app.config.update(config)
+    
+    configure_logging(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'], app.config['LOG_SAMPLE'])
+    db.init_app(app)
+    init_db(app)
+    app.extensions['soc'] = create_services(app)
+    app.register_blueprint(main)
+    register_commands(app)
+    
+    if app.config['PROFILING_ENABLED'] and not app.config['PROFILE_TOKEN']:
+        # Profilene viser URLer, stakker og minne - uten token ville hvem som helst kunne hente dem
+        print("PROFILING=1 uten PROFILE_TOKEN - profilering er ikke slått på")
+    elif app.config['PROFILING_ENABLED']:
+        profiler = RequestProfiler(app.config['PROFILE_DIR'], token=app.config['PROFILE_TOKEN'])
+        profiler.install(app)
+        app.extensions['soc']['profiler'] = profiler
+    if app.config['SCHEDULER_ENABLED']:
+        jobs = BackgroundJobs(app, app.config['SCHEDULER_LOCK'], analyze_url)
+        jobs.start(app.config['RESCAN_INTERVAL_MINUTES'])
+        app.extensions['soc']['jobs'] = jobs
+    return app
 
-def init_db():
+def init_db(app):
     with app.app_context():
         try:
             db.create_all()
+            upgrade_schema()
+            # Analyser lagret før snapshots migreres bare på kommando, etter backup
+            unmigrated = unmigrated_analyses()
+            if unmigrated:
+                print(f"{unmigrated} analyser er lagret før snapshots og vises uten verdikt - "
+                      f"kjør `python commands.py migrate-snapshots` (tar backup først)")
+            
+            # Bygg domeneomdømmet for eksisterende analyser første gang
+            archive = AnalysisArchive(app.config['ARCHIVE_DIR'])
+            if not DomainReputation.query.first() and Analysis.query.first():
+                domains = rebuild_domain_reputation(archive.iter_records())
+                print(f"Domain reputation built for {domains} domains")
+            # Indikatorindeksen og URL-klyngene går gjennom hele tabellen og arkivet,
+            # så de bygges bare på kommando og ikke i hver arbeidsprosess
+            if not Indicator.query.first() and (Analysis.query.first() or archive.partitions()):
+                print("Indikatorindeksen er tom - eldre analyser finnes ikke i indikatorsøket før "
+                      "`python commands.py rebuild indicators` er kjørt")
+            if not UrlCluster.query.first() and (Analysis.query.first() or archive.partitions()):
+                print("URL-klyngene er tomme - eldre analyser er ikke klynget før "
+                      "`python commands.py rebuild clusters` er kjørt")
             print("Database successfully initialized")
         except Exception as e:
             print(f"Error initializing database: {str(e)}")
 
-# Initialiser databasen ved oppstart
-init_db()
+def create_services(app):
+    """Oppretter analysatoren og planleggeren appen deler mellom forespørsler"""
+    policies = load_policies(app.config['CATEGORIZATION_POLICIES_FILE'])
+    policy = policies.get(str(app.config['CATEGORIZATION_POLICY']))
+    if policy is None:
+        print(f"Ukjent kategoriseringspolicy {app.config['CATEGORIZATION_POLICY']} - bruker {DEFAULT_POLICY_VERSION}")
+        policy = policies[DEFAULT_POLICY_VERSION]
+    # ATT&CK-data deles av alle arbeidsprosesser via en fil, historikk ligger i databasen
+    analyzer = SOCAnalyzer(
+        policy=policy,
+        enrichment=create_enrichment(app),
+        domain_policy=DomainReputationPolicy(lookup_domain_reputation),
+        # Lastes i bakgrunnen slik at appen tar imot forespørsler med en gang
+        mitre_analyzer=MitreAttackAnalyzer(store_path=app.config['MITRE_STORE_PATH'], background=True),
+        url_lists=URLListMatcher(app.config['URL_LISTS_DIR']),
+        keep_history=False,
+        # Analytikere som limer inn samme URL samtidig deler ett VirusTotal-oppslag
+        single_flight=SingleFlight(InflightTable(
+            app.config['SINGLE_FLIGHT_PATH'], result_ttl=app.config['SINGLE_FLIGHT_TTL']
+        )),
+        # Nesten like URLer (samme phishing-kit) arver klyngens verdikt som forhåndsscore
+        cluster_policy=UrlClusterPolicy(url_clusters_for, answer=app.config['URL_CLUSTER_ANSWER'])
+    )
+    # Felles VirusTotal-kvote for alle arbeidsprosesser og cron-jobber på maskinen
+    if analyzer.analyzer.key_pool.ledger is None:
+        analyzer.analyzer.key_pool.attach_ledger(QuotaLedger(app.config['VT_QUOTA_LEDGER']))
+    archive = AnalysisArchive(app.config['ARCHIVE_DIR'])
+    return {
+        'analyzer': analyzer,
+        'policies': policies,
+        'scheduler': PriorityScheduler(analyzer.lexical_scorer, boost=analyzer.cluster_priority),
+        # /history-sider og statistikk, ugyldiggjøres av datagenerasjonen
+        'response_cache': ResponseCache(),
+        'archive': archive,
+        # Analyser som ikke rakk fristen i /analyze fullføres her
+        'pending': PendingAnalyses(
+            app, analyzer.analyze_and_categorize, finish=analyzer.finish_analysis,
+            workers=max(1, app.config['ANALYZE_CONCURRENCY'])
+        ),
+        # Omkategorisering etter en ny policy, i bakgrunnen
+        'recategorizations': RecategorizationJobs(app, analyzer.mitre_analyzer, archive.iter_records)
+    }
+
+def create_enrichment(app):
+    """Berikelsespipelinen fra ENRICHMENT_STAGES, eller None når ingen steg er valgt"""
+    options = {
+        'dns': {'resolver_url': app.config['ENRICHMENT_DNS_URL']},
+        'whois': {'base_url': app.config['ENRICHMENT_RDAP_URL']},
+        'passive_dns': {'base_url': app.config['ENRICHMENT_PDNS_URL'], 'token': app.config['ENRICHMENT_PDNS_TOKEN']}
+    }
+    if not options['passive_dns']['base_url']:
+        del options['passive_dns']
+    try:
+        return build_pipeline(app.config['ENRICHMENT_STAGES'], options, workers=app.config['ENRICHMENT_WORKERS'])
+    except (TypeError, ValueError) as e:
+        # f.eks. passive_dns uten ENRICHMENT_PDNS_URL
+        print(f"Berikelse er slått av - ugyldig ENRICHMENT_STAGES: {str(e)}")
+        return None
+
+def get_analyzer() -> SOCAnalyzer:
+    return current_app.extensions['soc']['analyzer']
 
-analyzer = SOCAnalyzer()
+def get_scheduler() -> PriorityScheduler:
+    return current_app.extensions['soc']['scheduler']
 
-@app.route('/')
+def get_archive() -> AnalysisArchive:
+    return current_app.extensions['soc']['archive']
+
+def get_pending() -> PendingAnalyses:
+    return current_app.extensions['soc']['pending']
+
+def get_recategorizations() -> RecategorizationJobs:
+    return current_app.extensions['soc']['recategorizations']
+
+def get_profiler() -> RequestProfiler:
+    """Profileringen, eller 404 når PROFILING ikke er slått på"""
+    profiler = current_app.extensions['soc'].get('profiler')
+    if profiler is None or not profiler.authorized(
+            request.headers.get('X-Profile-Token') or request.values.get('token')):
+        abort(404)
+    return profiler
+
+def lookup_domain_reputation(domain):
+    """Henter aggregert omdømme for et registrert domene"""
+    reputation = DomainReputation.query.get(domain)
+    return reputation.to_dict() if reputation else None
+
+@main.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/analyze', methods=['POST'])
+def analyze_url(url, compact=False, result=None):
+    """
+    Analyserer én URL, lagrer resultatet og formaterer MITRE-detaljer for frontend.
+    I kompakt modus sendes bare teknikk-IDene (i mitre_analysis); navn og
+    beskrivelser hentes én gang fra /api/mitre/techniques.
+    result er et ferdig analyseresultat (eller unntaket) fra analyze_urls.
+    """
+    analyzer = get_analyzer()
+    try:
+        if isinstance(result, Exception):
+            raise result
+        if result is None:
+            result = analyzer.analyze_and_categorize(url)
+        
+        # Lagre i database; et degradert resultat (før ATT&CK-data var lastet) er ikke et endelig verdikt
+        if result.get('degraded'):
+            log_event(analysis_logger, logging.DEBUG, 'analysis.degraded', {'url': url},
+                      'ATT&CK-data ikke lastet - resultatet lagres ikke')
+        else:
+            db.session.add(Analysis.from_result(url, result))
+        
+        if not compact:
+            format_mitre_details(result)
+        return result
+        
+    except Exception as e:
+        log_event(analysis_logger, logging.ERROR, 'analysis.failed', {'url': url, 'error': str(e)},
+                  f"Feil ved analysering av URL {url}: {str(e)}")
+        return {
+            'url': url,
+            'status': 'error',
+            'error_message': str(e),
+            'risk_category': 'FEIL',
+            'action_required': 'Analyse feilet - kontakt administrator'
+        }
+
+def format_mitre_details(result):
+    """Legger til MITRE-detaljer med navn, beskrivelse og taktikker for frontend"""
+    if 'mitre_analysis' not in result:
+        return result
+    analyzer = get_analyzer()
+    result['mitre_details'] = {
+        'techniques': [
+            {
+                'id': tech,
+                'name': get_technique_name(tech),
+                'description': get_technique_description(tech),
+                'tactics': analyzer.mitre_analyzer.techniques_cache.get(tech, {}).get('tactics', [])
+            }
+            for tech in result['mitre_analysis']['techniques']
+        ],
+        'tactics': result['mitre_analysis']['tactics'],
+        'risk_score': result['mitre_analysis']['risk_score']
+    }
+    return result
+
+def analyze_urls(urls, compact=False, deadline=None):
+    """
+    Analyserer flere URLer samtidig slik at VirusTotal-oppslagene kan samles i
+    flerressurskall. Lagring og formatering skjer etterpå i forespørselens tråd.
+    Med en deadline venter vi høyst til fristen: URLer som ikke er ferdige kommer
+    tilbake som 'pending' med et håndtak og fullføres i bakgrunnen.
+    """
+    workers = min(len(urls), current_app.config['ANALYZE_CONCURRENCY'])
+    if not urls or (workers <= 1 and deadline is None):
+        return [analyze_url(url, compact) for url in urls]
+    
+    app = current_app._get_current_object()
+    analyzer = get_analyzer()
+    
+    def run(url):
+        with app.app_context():
+            try:
+                return analyzer.analyze_and_categorize(url, deadline=deadline)
+            except Exception as e:
+                return e
+    
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = [pool.submit(run, url) for url in urls]
+    wait(futures, timeout=None if deadline is None else deadline.remaining())
+    # Uferdige oppslag fortsetter i trådene; vi venter ikke på dem her
+    pool.shutdown(wait=False)
+    
+    results, unfinished = [], []
+    for url, future in zip(urls, futures):
+        if future.done() and not isinstance(future.result(), DeadlineExceeded):
+            results.append(analyze_url(url, compact, future.result()))
+            continue
+        handle = new_handle()
+        db.session.add(PendingAnalysis(handle=handle, url=url))
+        unfinished.append((handle, url, future))
+        results.append(pending_result(url, handle))
+    
+    if unfinished:
+        # Håndtakene må være lagret før bakgrunnstrådene skriver resultatet
+        db.session.commit()
+        pending = get_pending()
+        for handle, url, future in unfinished:
+            pending.track(handle, url, future)
+    return results
+
+@main.route('/analyze', methods=['POST'])
 def analyze():
+    analyzer = get_analyzer()
+    scheduler = get_scheduler()
     try:
         urls = request.form.get('urls', '').split('\n')
         urls = [url.strip() for url in urls if url.strip()]
@@ -48,65 +360,194 @@ def analyze():
                 'error': 'Ingen URLer å analysere'
             }), 400
         
-        results = []
-        for url in urls:
-            try:
-                result = analyzer.analyze_and_categorize(url)
-                
-                # Lagre i database
-                analysis = Analysis(
-                    url=url,
-                    risk_category=result.get('risk_category'),
-                    risk_score=result.get('risk_score'),
-                    action_required=result.get('action_required'),
-                    mitre_analysis=result.get('mitre_analysis')
-                )
-                db.session.add(analysis)
-                
-                # Formater MITRE-resultatene for frontend
-                if 'mitre_analysis' in result:
-                    result['mitre_details'] = {
-                        'techniques': [
-                            {
-                                'id': tech,
-                                'name': get_technique_name(tech),
-                                'description': get_technique_description(tech),
-                                'tactics': analyzer.mitre_analyzer.techniques_cache.get(tech, {}).get('tactics', [])
-                            }
-                            for tech in result['mitre_analysis']['techniques']
-                        ],
-                        'tactics': result['mitre_analysis']['tactics'],
-                        'risk_score': result['mitre_analysis']['risk_score']
-                    }
-                
-                results.append(result)
-                
-            except Exception as e:
-                print(f"Feil ved analysering av URL {url}: {str(e)}")
-                results.append({
-                    'url': url,
-                    'status': 'error',
-                    'error_message': str(e),
-                    'risk_category': 'FEIL',
-                    'action_required': 'Analyse feilet - kontakt administrator'
-                })
+        compact = request.form.get('compact') == '1'
+        # Tidsbudsjett for hele forespørselen; det som ikke rekkes kommer som 'pending'
+        seconds = request.form.get('deadline', type=float)
+        if seconds is None:
+            seconds = current_app.config['ANALYZE_DEADLINE']
+        deadline = Deadline(seconds) if seconds and seconds > 0 else None
+        
+        # URLer på tillatelses-/blokkeringslister bruker ingen kvote og utsettes aldri
+        results = [None] * len(urls)
+        pending = []
+        for index, url in enumerate(urls):
+            if analyzer.list_match(url):
+                results[index] = analyze_url(url, compact)
+            else:
+                pending.append(index)
+        
+        # Mest mistenkelige URLer får kvote først, lav score kan utsettes under kvotepress
+        plan = scheduler.plan(
+            [urls[index] for index in pending],
+            capacity=analyzer.analyzer.key_pool.remaining_capacity(),
+            allow_defer=request.form.get('defer', '1') != '0'
+        )
+        
+        # Samtidige oppslag slik at de kan samles i flerressurskall mot VirusTotal
+        ordered = plan['ordered']
+        for item, result in zip(ordered, analyze_urls([item['url'] for item in ordered], compact, deadline)):
+            results[pending[item['index']]] = result
+        
+        for item in plan['deferred']:
+            db.session.add(DeferredURL(url=item['url'], lexical_score=item['score']))
+            results[pending[item['index']]] = {
+                'url': item['url'],
+                'status': 'deferred',
+                'lexical_score': item['score'],
+                'risk_category': 'UKJENT',
+                'risk_score': 'N/A',
+                'action_required': 'Lav forhåndsscore - analyseres i lavtrafikkvinduet'
+            }
         
         db.session.commit()
         
-        return jsonify({
+        response = {
             'results': results,
-            'summary': analyzer.generate_summary()
-        })
+            'deferred': len(plan['deferred']),
+            'pending': sum(1 for result in results if result.get('status') == 'pending'),
+            'summary': analysis_summary()
+        }
+        if compact:
+            response['techniques_version'] = analyzer.mitre_analyzer.techniques_version()
+        return jsonify(response)
         
     except Exception as e:
-        print(f"Kritisk feil i analyze-endepunkt: {str(e)}")
+        log_event(analysis_logger, logging.ERROR, 'analysis.request_failed', {'error': str(e)},
+                  f"Kritisk feil i analyze-endepunkt: {str(e)}", exc_info=True)
         return jsonify({
             'error': 'En feil oppstod under analysen',
             'details': str(e)
         }), 500
 
+@main.route('/analyze/pending/<handle>')
+def pending_analysis(handle):
+    """
+    Resultatet av en analyse som ikke ble ferdig innen fristen i /analyze.
+    status er 'pending' til den er ferdig; compact=1 gir kompakt resultat.
+    """
+    pending = PendingAnalysis.query.get(handle)
+    if pending is None:
+        return jsonify({'error': 'Ukjent håndtak', 'handle': handle}), 404
+    if pending.status == 'pending' and pending.requested_at < datetime.utcnow() - PENDING_TIMEOUT:
+        # Arbeidsprosessen som skulle fullføre analysen, finnes ikke lenger
+        expire_stale_pending()
+        db.session.commit()
+        db.session.refresh(pending)
+    
+    response = pending.to_dict()
+    if pending.status == 'completed':
+        result = dict(pending.result)
+        if request.args.get('compact') != '1':
+            format_mitre_details(result)
+        response['result'] = result
+    return jsonify(response)
+
+@main.route('/deferred')
+def deferred():
+    """Lister URLer som venter på analyse i lavtrafikkvinduet"""
+    scheduler = get_scheduler()
+    pending = DeferredURL.query.filter(DeferredURL.processed_at.is_(None)) \
+        .order_by(DeferredURL.lexical_score.desc(), DeferredURL.requested_at).all()
+    return jsonify({
+        'pending': [item.to_dict() for item in pending],
+        'off_peak': scheduler.is_off_peak()
+    })
+
+@main.route('/deferred/process', methods=['POST'])
+def process_deferred():
+    """
+    Analyserer utsatte URLer i prioritert rekkefølge, innenfor ledig kvote.
+    Kjøres i lavtrafikkvinduet (f.eks. fra cron), eller med force=1.
+    """
+    analyzer = get_analyzer()
+    scheduler = get_scheduler()
+    if not scheduler.is_off_peak() and request.form.get('force') != '1':
+        return jsonify({'error': 'Utenfor lavtrafikkvinduet - bruk force=1 for å kjøre nå'}), 409
+    
+    limit = request.form.get('limit', type=int) or max(1, analyzer.analyzer.key_pool.remaining_capacity())
+    return jsonify(process_deferred_urls(analyze_url, scheduler, limit, force=True))
+
+@main.route('/rescan')
+def rescan():
+    """Verdikter som står for tur til re-skanning, og de siste verdiktendringene"""
+    limit = request.args.get('limit', 50, type=int)
+    changes = VerdictChange.query.order_by(VerdictChange.changed_at.desc()).limit(limit).all()
+    return jsonify({
+        'stale': select_stale_verdicts(current_app.config['RESCAN_MAX_AGE'], limit),
+        'recent_changes': [change.to_dict() for change in changes],
+        'max_age_days': current_app.config['RESCAN_MAX_AGE'],
+        'off_peak': get_scheduler().is_off_peak()
+    })
+
+@main.route('/rescan/run', methods=['POST'])
+def run_rescan():
+    """
+    Re-skanner gamle verdikter nå i stedet for å vente på den planlagte jobben.
+    Utenfor lavtrafikkvinduet kreves force=1.
+    """
+    scheduler = get_scheduler()
+    force = request.form.get('force') == '1'
+    if not scheduler.is_off_peak() and not force:
+        return jsonify({'error': 'Utenfor lavtrafikkvinduet - bruk force=1 for å kjøre nå'}), 409
+    result = rescan_stale_verdicts(
+        get_analyzer(), scheduler, current_app.config['RESCAN_MAX_AGE'],
+        request.form.get('limit', type=int) or current_app.config['RESCAN_MAX_URLS'],
+        current_app.config['RESCAN_QUOTA_SHARE'], force=force
+    )
+    return jsonify(result)
+
+@main.route('/policies')
+def policies():
+    """Kategoriseringspolicyene, hvilken som er aktiv og hvor mange analyser som har hver versjon"""
+    counts = db.session.query(Analysis.policy_version, db.func.count(Analysis.id)).group_by(Analysis.policy_version)
+    latest = RecategorizationRun.query.order_by(RecategorizationRun.id.desc()).first()
+    return jsonify({
+        'active': get_analyzer().policy.version,
+        'policies': [policy.to_dict() for policy in current_app.extensions['soc']['policies'].values()],
+        'analyses_by_version': {version or 'ingen': count for version, count in counts},
+        'latest_recategorization': latest.to_dict() if latest else None
+    })
+
+@main.route('/policies/recategorize', methods=['POST'])
+def run_recategorize():
+    """
+    Starter omkategorisering av lagrede analyser etter policyen version= (standard den
+    aktive) fra lagret score, uten VirusTotal-oppslag. Jobben kjører i bakgrunnen;
+    svaret er 202 med kjøringen, og status og resultat hentes fra
+    /policies/recategorize/<id>. rebuild=0 hopper over ombygging av domeneomdømme og
+    indikatorindeks og opptelling av verdiktene i URL-klyngene etterpå.
+    """
+    analyzer = get_analyzer()
+    version = request.form.get('version') or analyzer.policy.version
+    policy = current_app.extensions['soc']['policies'].get(version)
+    if policy is None:
+        return jsonify({'error': f'Ukjent policyversjon {version}'}), 404
+    try:
+        run, started = get_recategorizations().start(policy, rebuild=request.form.get('rebuild') != '0')
+    except Exception as e:
+        db.session.rollback()
+        print(f"Kunne ikke starte omkategorisering: {str(e)}")
+        return jsonify({'error': 'Kunne ikke starte omkategorisering', 'details': str(e)}), 500
+    response = dict(run.to_dict(), status_url=url_for('main.recategorize_status', run_id=run.id))
+    if not started:
+        response['error'] = f'Omkategorisering {run.id} kjører allerede'
+        return jsonify(response), 409
+    if version != analyzer.policy.version:
+        response['warning'] = (f'Nye analyser bruker fortsatt policy {analyzer.policy.version} '
+                               f'- sett CATEGORIZATION_POLICY={version}')
+    return jsonify(response), 202
+
+@main.route('/policies/recategorize/<int:run_id>')
+def recategorize_status(run_id):
+    """Status for en omkategorisering ('running', 'completed' eller 'error') og resultatet når den er ferdig"""
+    run = RecategorizationRun.query.get(run_id)
+    if run is None:
+        return jsonify({'error': 'Ukjent omkategorisering'}), 404
+    return jsonify(run.to_dict())
+
 def safe_get_technique_info(technique_id: str, info_type: str) -> str:
     """Sikker henting av teknikk-informasjon"""
+    analyzer = get_analyzer()
     try:
         technique_info = analyzer.mitre_analyzer.techniques_cache.get(technique_id, {})
         return technique_info.get(info_type, f'Unknown {info_type}')
@@ -122,8 +563,215 @@ def get_technique_description(technique_id: str) -> str:
     """Henter beskrivelsen av en MITRE ATT&CK teknikk"""
     return safe_get_technique_info(technique_id, 'description')
 
-@app.route('/export')
+def technique_payload():
+    """Serialisert teknikkordbok for gjeldende versjon, bygges én gang per versjon"""
+    mitre_analyzer = get_analyzer().mitre_analyzer
+    version = mitre_analyzer.techniques_version()
+    cached = current_app.extensions['soc'].get('technique_payload')
+    if not cached or cached[0] != version:
+        body = json.dumps({
+            'version': version,
+            'techniques': mitre_analyzer.technique_dictionary()
+        }, ensure_ascii=False)
+        cached = (version, body)
+        current_app.extensions['soc']['technique_payload'] = cached
+    return cached
+
+def technique_response(version, body, cache_control):
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(version)
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+@main.route('/api/mitre/techniques')
+def mitre_techniques():
+    """
+    Teknikkordboken (navn, beskrivelse, taktikker per ID) for kompakte /analyze-svar.
+    Må revalideres, men svarer 304 så lenge ETag (versjonen) er uendret.
+    """
+    if not get_analyzer().mitre_analyzer.ready.done():
+        return jsonify({'error': 'ATT&CK-data lastes fortsatt'}), 503, {'Retry-After': '5'}
+    version, body = technique_payload()
+    return technique_response(version, body, 'no-cache')
+
+@main.route('/api/mitre/techniques/<version>')
+def mitre_techniques_versioned(version):
+    """Versjonert ordbok som aldri endres og kan caches for alltid"""
+    if not get_analyzer().mitre_analyzer.ready.done():
+        return jsonify({'error': 'ATT&CK-data lastes fortsatt'}), 503, {'Retry-After': '5'}
+    current_version, body = technique_payload()
+    if version != current_version:
+        return redirect(url_for('main.mitre_techniques_versioned', version=current_version))
+    return technique_response(current_version, body, 'public, max-age=31536000, immutable')
+
+@main.route('/domain_reputation/<path:domain>')
+def domain_reputation(domain):
+    """Returnerer aggregert omdømme for domenet til en URL eller et vertsnavn"""
+    analyzer = get_analyzer()
+    domain = registered_domain(domain)
+    reputation = lookup_domain_reputation(domain) if domain else None
+    if not reputation:
+        return jsonify({'error': 'Ingen analyser for domenet', 'domain': domain}), 404
+    
+    verdict = analyzer.domain_policy.evaluate(domain)
+    for field in ('first_seen', 'last_seen'):
+        if reputation[field]:
+            reputation[field] = reputation[field].strftime("%Y-%m-%d %H:%M:%S")
+    return jsonify({
+        'reputation': reputation,
+        'decision': verdict['decision'] if verdict else 'unknown'
+    })
+
+@main.route('/indicators/lookup')
+def indicator_lookup():
+    """
+    Har vi sett denne URLen, verten, domenet, IP-adressen eller filen før, og hva
+    ble konklusjonen? Slår opp i den inverterte indikatorindeksen (type= for å
+    velge type, ellers gjettes den; limit= siste observasjoner per indikator).
+    """
+    query = request.args.get('q', '')
+    kind = request.args.get('type') or None
+    if kind and kind not in INDICATOR_TYPES:
+        return jsonify({'error': f"Ukjent type - bruk {', '.join(INDICATOR_TYPES)}"}), 400
+    keys = query_keys(query, kind)
+    if not keys:
+        return jsonify({'error': 'Ingen indikator å slå opp', 'q': query}), 400
+    
+    limit = min(max(request.args.get('limit', 20, type=int), 0), 500)
+    matches = indicator_sightings(keys, limit)
+    return jsonify({
+        'q': query,
+        'indicators': keys,
+        'seen_before': bool(matches),
+        'matches': matches
+    })
+
+@main.route('/indicators/rebuild', methods=['POST'])
+def rebuild_indicators():
+    """Bygger indikatorindeksen på nytt fra alle lagrede og arkiverte analyser"""
+    try:
+        indicators = rebuild_indicator_index(get_archive().iter_records())
+        return jsonify({'indicators': indicators})
+    except Exception as e:
+        db.session.rollback()
+        print(f"Gjenoppbygging av indikatorindeksen feilet: {str(e)}")
+        return jsonify({'error': 'Gjenoppbygging feilet', 'details': str(e)}), 500
+
+@main.route('/healthz')
+def healthz():
+    """
+    Helsesjekk. Svarer alltid 200 mens prosessen lever; med ?ready=1 svarer den
+    503 til ATT&CK-data er lastet (for readiness-prober og lastbalanserere).
+    """
+    analyzer = get_analyzer()
+    mitre = analyzer.mitre_analyzer.load_state()
+    ready = mitre['state'] != 'loading'
+    status_code = 503 if request.args.get('ready') == '1' and not ready else 200
+    return jsonify({
+        'status': 'ok' if ready else 'starting',
+        'mitre': mitre,
+        'pending_analyses': get_pending().status(),
+        'logging': configure_logging().status()
+    }), status_code
+
+@main.route('/enrichment')
+def enrichment_status():
+    """Stegene i berikelsespipelinen med tidsfrister, cache-treff og tider"""
+    enrichment = get_analyzer().enrichment
+    if enrichment is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(enrichment.status(), enabled=True))
+
+@main.route('/profiling')
+def profiling_status():
+    """Lagrede profiler, bestilte profileringer og tracemalloc-status"""
+    profiler = get_profiler()
+    return jsonify({
+        'files': profiler.files(),
+        'armed': profiler.armed,
+        'memory': profiler.memory_status()
+    })
+
+@main.route('/profiling/arm', methods=['POST'])
+def profiling_arm():
+    """
+    Profilerer de neste count= forespørslene der stien starter med path= (f.eks.
+    /generate_report), med mode=sample (foldede stakker) eller mode=cprofile
+    """
+    profiler = get_profiler()
+    path = request.form.get('path', '').strip()
+    mode = request.form.get('mode', 'sample')
+    if not path.startswith('/') or mode not in PROFILE_MODES:
+        return jsonify({'error': f"Bruk path=/sti og mode={' eller '.join(PROFILE_MODES)}"}), 400
+    count = min(max(request.form.get('count', 1, type=int), 1), 100)
+    return jsonify({'armed': profiler.arm(path, count, mode)})
+
+@main.route('/profiling/memory', methods=['POST'])
+def profiling_memory():
+    """tracemalloc: action=start (frames=), snapshot (limit=) eller stop"""
+    profiler = get_profiler()
+    action = request.form.get('action', 'snapshot')
+    try:
+        if action == 'start':
+            return jsonify(profiler.start_memory(min(max(request.form.get('frames', 25, type=int), 1), 100)))
+        if action == 'stop':
+            return jsonify(profiler.stop_memory())
+        if action == 'snapshot':
+            return jsonify(profiler.snapshot_memory(min(max(request.form.get('limit', 20, type=int), 1), 200)))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'error': 'Ukjent action - bruk start, snapshot eller stop'}), 400
+
+@main.route('/profiling/files/<name>')
+def profiling_file(name):
+    """Laster ned en lagret profil"""
+    path = get_profiler().path(name)
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True)
+
+@main.route('/retention')
+def retention():
+    """Status for arkivet: horisont, rader i tabellen og arkiverte månedsfiler"""
+    return jsonify(dict(retention_status(), retention_days=current_app.config['RETENTION_DAYS']))
+
+@main.route('/retention/archive', methods=['POST'])
+def run_retention():
+    """
+    Flytter analyser eldre enn RETENTION_DAYS (eller days=) til månedsarkivet,
+    f.eks. fra cron. vacuum=1 krymper SQLite-filen etterpå.
+    """
+    days = request.form.get('days', type=int) or current_app.config['RETENTION_DAYS']
+    if days <= 0:
+        return jsonify({'error': 'Arkivering er slått av (RETENTION_DAYS=0)'}), 409
+    try:
+        result = archive_old_analyses(get_archive(), days)
+        if request.form.get('vacuum') == '1':
+            result['vacuumed'] = vacuum_database()
+        return jsonify(result)
+    except Exception as e:
+        print(f"Arkivering feilet: {str(e)}")
+        return jsonify({'error': 'Arkivering feilet', 'details': str(e)}), 500
+
+@main.route('/vt_keys')
+def vt_keys():
+    """Rapporterer kvote og karantenestatus per VirusTotal-nøkkel"""
+    analyzer = get_analyzer()
+    key_pool = analyzer.analyzer.key_pool
+    keys = key_pool.status()
+    return jsonify({
+        'keys': keys,
+        'available_keys': sum(1 for key in keys if not key['quarantined']),
+        'remaining_capacity': key_pool.remaining_capacity(),
+        'single_flight': analyzer.single_flight.status() if analyzer.single_flight else None,
+        'report_batching': (
+            analyzer.analyzer.report_batcher.status() if analyzer.analyzer.report_batcher else None
+        )
+    })
+
+@main.route('/export')
 def export():
+    analyzer = get_analyzer()
     try:
         # Opprett en export-mappe hvis den ikke eksisterer
         export_dir = os.path.join(os.path.dirname(__file__), 'exports')
@@ -135,8 +783,10 @@ def export():
         filename = f"soc_report_{timestamp}.xlsx"
         filepath = os.path.join(export_dir, filename)
         
-        # Eksporter til Excel
-        result = analyzer.export_to_excel(filepath)
+        # Eksporter til Excel fra databasen og arkivet, så alle arbeidsprosesser gir samme fil
+        filters = history_filters()
+        analyses = all_analyses(get_archive(), history_query(filters), filters)
+        result = analyzer.export_to_excel(filepath, reports=analyses[::-1])
         
         if os.path.exists(filepath):
             try:
@@ -160,103 +810,133 @@ def export():
             'details': str(e)
         }), 500
 
-@app.route('/history')
-def history():
-    # Hent søkeparametere
-    search = request.args.get('search', '')
-    risk_category = request.args.get('risk_category', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
-    
-    # Bygg spørringen
+def history_filters(args=None):
+    """Normaliserte filterparametere, slik at like visninger deler cacheoppføring"""
+    args = request.args if args is None else args
+    filters = {
+        'search': args.get('search', '').strip(),
+        'risk_category': args.get('risk_category', '').strip(),
+        'date_from': args.get('date_from', '').strip(),
+        'date_to': args.get('date_to', '').strip(),
+        # Medlemmene i én URL-klynge
+        'cluster': args.get('cluster', '').strip(),
+        # Bare observasjoner der verdiktet endret seg
+        'changed': '1' if args.get('changed') == '1' else ''
+    }
+    if not filters['cluster'].isdigit():
+        filters['cluster'] = ''
+    # Ugyldige datoer gir ValueError som før
+    for field in ('date_from', 'date_to'):
+        if filters[field]:
+            filters[field] = datetime.strptime(filters[field], '%Y-%m-%d').strftime('%Y-%m-%d')
+    return filters
+
+def history_query(filters):
     query = Analysis.query
     
-    if search:
-        query = query.filter(Analysis.url.like(f'%{search}%'))
+    if filters['search']:
+        query = query.filter(Analysis.url.like(f"%{filters['search']}%"))
     
-    if risk_category:
-        query = query.filter(Analysis.risk_category == risk_category)
+    if filters['risk_category']:
+        query = query.filter(Analysis.risk_category == filters['risk_category'])
         
-    if date_from:
-        query = query.filter(Analysis.timestamp >= datetime.strptime(date_from, '%Y-%m-%d'))
+    if filters['date_from']:
+        query = query.filter(Analysis.timestamp >= datetime.strptime(filters['date_from'], '%Y-%m-%d'))
         
-    if date_to:
-        query = query.filter(Analysis.timestamp <= datetime.strptime(date_to, '%Y-%m-%d'))
-    
-    # Sorter og paginer
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    if filters['date_to']:
+        query = query.filter(Analysis.timestamp <= datetime.strptime(filters['date_to'], '%Y-%m-%d'))
     
-    pagination = query.order_by(Analysis.timestamp.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    if filters.get('cluster'):
+        query = query.filter(Analysis.cluster_id == int(filters['cluster']))
     
-    # Beregn statistikk for den filtrerte perioden
-    stats = calculate_period_stats(query.all())
+    if filters.get('changed'):
+        query = query.filter(Analysis.changed.is_(True))
     
-    return render_template('history.html',
-        analyses=[a.to_dict() for a in pagination.items],
-        pagination=pagination,
-        stats=stats
-    )
+    return query
 
-def calculate_period_stats(analyses):
-    """Beregner statistikk for en gitt periode"""
-    stats = {
-        'total_analyses': len(analyses),
-        'critical_risk': sum(1 for a in analyses if a.risk_category == 'KRITISK'),
-        'high_risk': sum(1 for a in analyses if a.risk_category == 'HØY'),
-        'avg_mitre_score': 0,
-        'most_common_technique': 'Ingen data'
-    }
-    
-    # Beregn gjennomsnittlig MITRE-score
-    mitre_scores = [
-        a.mitre_analysis.get('risk_score', 0) 
-        for a in analyses 
-        if a.mitre_analysis
-    ]
-    if mitre_scores:
-        stats['avg_mitre_score'] = sum(mitre_scores) / len(mitre_scores)
-    
-    # Finn mest brukte MITRE-teknikk
-    technique_count = {}
-    for analysis in analyses:
-        if analysis.mitre_analysis and 'techniques' in analysis.mitre_analysis:
-            for tech in analysis.mitre_analysis['techniques']:
-                technique_count[tech] = technique_count.get(tech, 0) + 1
+@main.route('/history')
+def history():
+    """
+    Historikk med statistikk. Svaret caches per normaliserte filter og datagenerasjon,
+    og gjentatte visninger uten nye analyser besvares med 304 via ETag.
+    """
+    cache = current_app.extensions['soc']['response_cache']
+    filters = history_filters()
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, request.args.get('per_page', 10, type=int))
+    filter_key = tuple(sorted(filters.items()))
+    key = ('history', filter_key, page, per_page)
+    generation = data_generation()
+    etag = cache.etag(key, generation)
     
-    if technique_count:
-        most_common = max(technique_count.items(), key=lambda x: x[1])
-        stats['most_common_technique'] = most_common[0]
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        def render():
+            archive = get_archive()
+            query = history_query(filters)
+            # Arkivet leses bare når datointervallet går forbi det som ligger i tabellen
+            archived = cache.get_or_build(('archived', filter_key), generation,
+                                          lambda: archived_aggregates(archive, filters))
+            pagination = paginate_analyses(archive, query, filters, page, per_page, archived)
+            # Statistikken avhenger bare av filteret og deles mellom sidene
+            stats = cache.get_or_build(('stats', filter_key), generation,
+                                       lambda: calculate_period_stats(query.all(), archived))
+            return render_template('history.html',
+                analyses=pagination.items,
+                pagination=pagination,
+                stats=stats,
+                filters=filters,
+                cluster_sizes=url_cluster_sizes(item.get('cluster_id') for item in pagination.items)
+            )
+        response = current_app.response_class(cache.get_or_build(key, generation, render))
     
-    return stats
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-@app.route('/generate_report', methods=['POST'])
+@main.route('/history/timeline')
+def history_timeline():
+    """
+    Verdiktene for én URL over tid, rekonstruert fra observasjonene: én periode per
+    sammenhengende rekke med samme verdikt (snapshot), nyeste først.
+    """
+    url = request.args.get('url', '').strip()
+    if not url:
+        return jsonify({'error': 'Mangler url='}), 400
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 10000)
+    periods = analysis_timeline(url, limit)
+    return jsonify({
+        'url': url,
+        'observations': sum(period['observations'] for period in periods),
+        'verdict_changes': max(len(periods) - 1, 0),
+        'periods': periods
+    })
+
+@main.route('/generate_report', methods=['POST'])
 def generate_report():
     try:
-        print("\n=== Starting Report Generation ===")
-        
         # Sørg for at exports-mappen eksisterer
-        export_dir = os.path.join(app.root_path, 'exports')
+        export_dir = os.path.join(current_app.root_path, 'exports')
         if not os.path.exists(export_dir):
             os.makedirs(export_dir)
-            print(f"Created exports directory: {export_dir}")
         
-        # Hent data fra databasen
+        # Hent data fra databasen, og fra arkivet hvis datointervallet krever det
         try:
-            analyses = Analysis.query.order_by(Analysis.timestamp.desc()).all()
-            print(f"Found {len(analyses)} analyses in database")
+            filters = history_filters(request.form)
+            analyses = all_analyses(get_archive(), history_query(filters), filters)
         except Exception as e:
-            print(f"Database error: {str(e)}")
+            log_event(report_logger, logging.ERROR, 'report.query_failed', {'error': str(e)},
+                      f"Databasefeil ved henting av analyser: {str(e)}")
             return jsonify({'error': 'Databasefeil ved henting av analyser', 'details': str(e)}), 500
         
         if not analyses:
             return jsonify({'error': 'Ingen data å generere rapport fra'}), 400
         
-        # Debug: Skriv ut alle risikokategorier
-        risk_categories = set(a.risk_category for a in analyses)
-        print("\nUnique risk categories in database:", risk_categories)
+        log_event(report_logger, logging.DEBUG, 'report.input', lambda: {
+            'analyses': len(analyses),
+            'risk_categories': sorted({a['risk_category'] or '' for a in analyses})
+        })
         
         # Konverter til dict og valider data
         analyses_dict = []
@@ -264,7 +944,7 @@ def generate_report():
         
         for i, analysis in enumerate(analyses):
             try:
-                analysis_data = analysis.to_dict()
+                analysis_data = dict(analysis)
                 # Valider nødvendige felter
                 required_fields = ['url', 'risk_category', 'risk_score', 'timestamp']
                 missing_fields = [field for field in required_fields if field not in analysis_data]
@@ -275,7 +955,8 @@ def generate_report():
                 analyses_dict.append(analysis_data)
             except Exception as e:
                 error_msg = f"Error converting analysis {i}: {str(e)}"
-                print(error_msg)
+                log_event(report_logger, logging.WARNING, 'report.bad_analysis', {'index': i, 'error': str(e)},
+                          error_msg)
                 conversion_errors.append(error_msg)
         
         if not analyses_dict:
@@ -287,20 +968,23 @@ def generate_report():
         
         # Generer rapport
         try:
+            from reporting.report_generator import ReportGenerator
             report_generator = ReportGenerator()
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             report_path = os.path.join(export_dir, f'soc_report_{timestamp}.pdf')
             
-            print(f"Generating report to: {report_path}")
-            print(f"Number of analyses to include: {len(analyses_dict)}")
-            
             # Generer PDF
+            started = time.perf_counter()
             report_generator.generate_pdf_report(analyses_dict, report_path)
             
             if not os.path.exists(report_path):
                 raise FileNotFoundError(f"Generated report file not found at: {report_path}")
             
-            print("Report generated successfully")
+            log_event(report_logger, logging.INFO, 'report.generated', {
+                'path': report_path,
+                'analyses': len(analyses_dict),
+                'seconds': round(time.perf_counter() - started, 3)
+            }, "Rapport generert")
             
             try:
                 return send_file(
@@ -310,36 +994,35 @@ def generate_report():
                     mimetype='application/pdf'
                 )
             except Exception as e:
-                print(f"Error sending file: {str(e)}")
+                log_event(report_logger, logging.ERROR, 'report.send_failed', {'error': str(e)},
+                          f"Error sending file: {str(e)}")
                 raise
             
         except Exception as e:
-            print(f"Error during PDF generation: {str(e)}")
+            log_event(report_logger, logging.ERROR, 'report.pdf_failed', {'error': str(e)},
+                      f"Error during PDF generation: {str(e)}")
             if os.path.exists(report_path):
                 os.remove(report_path)
             raise
             
     except Exception as e:
-        import traceback
-        print(f"Critical error in generate_report:")
-        print(f"Error type: {type(e).__name__}")
-        print(f"Error message: {str(e)}")
-        print("Traceback:")
-        traceback.print_exc()
+        log_event(report_logger, logging.ERROR, 'report.failed', {'error_type': type(e).__name__, 'error': str(e)},
+                  f"Critical error in generate_report: {str(e)}", exc_info=True)
         
         return jsonify({
             'error': 'Kunne ikke generere rapport',
             'details': str(e)
         }), 500
 
-@app.route('/test_report')
+@main.route('/test_report')
 def test_report():
     try:
-        export_dir = os.path.join(app.root_path, 'exports')
+        export_dir = os.path.join(current_app.root_path, 'exports')
         if not os.path.exists(export_dir):
             os.makedirs(export_dir)
             
         report_path = os.path.join(export_dir, 'test_report.pdf')
+        from reporting.report_generator import ReportGenerator
         report_generator = ReportGenerator()
         
         if report_generator.test_pdf_generation(report_path):
@@ -358,7 +1041,7 @@ def test_report():
             'details': str(e)
         }), 500
 
-@app.route('/test_simple_report')
+@main.route('/test_simple_report')
 def test_simple_report():
     try:
         print("\n=== Testing Simple Report Generation ===")
@@ -378,11 +1061,12 @@ def test_simple_report():
         }]
         
         # Opprett exports-mappe
-        export_dir = os.path.join(app.root_path, 'exports')
+        export_dir = os.path.join(current_app.root_path, 'exports')
         if not os.path.exists(export_dir):
             os.makedirs(export_dir)
         
         # Generer test-rapport
+        from reporting.report_generator import ReportGenerator
         report_generator = ReportGenerator()
         report_path = os.path.join(export_dir, 'simple_test_report.pdf')
         
@@ -410,4 +1094,5 @@ def test_simple_report():
         }), 500
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Utviklingsserveren kjører de planlagte jobbene med mindre SCHEDULER_ENABLED=0
+    create_app({'SCHEDULER_ENABLED': os.environ.get('SCHEDULER_ENABLED', '1') == '1'}).run(debug=True)
\ No newline at end of file
@@ -0,0 +1,223 @@
+"""
+Gjennomstrømningsbenchmark for SOCAnalyzer og /analyze mot en lokal VirusTotal-erstatning.
+
+Kjøres fra app-mappen:
+
+    python -m benchmarks.analyzer_throughput --batch-sizes 10,50 --concurrency 1,4 --time-scale 0.01
+    python -m benchmarks.analyzer_throughput --update-baseline
+    python -m benchmarks.analyzer_throughput --check   # feiler ved regresjon mot baseline
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analyzers.vt_key_pool import VTKeyPool
+from benchmarks.vt_standin import VirusTotalStandIn, add_standin_arguments, standin_options
+from benchmarks.baseline import (percentile, baseline_path, load_baseline, save_baseline,
+                                 compare, report_regressions)
+
+BENIGN_DOMAINS = ['vg.no', 'nrk.no', 'example.com', 'wikipedia.org', 'github.com', 'intranet.local']
+SUSPICIOUS_DOMAINS = ['login-paypal-secure.xyz', 'signin-microsoft.top', 'crypto-miner.ru',
+                      'evil-kit.example.co.uk', '185.23.44.10']
+PATH_WORDS = ['index', 'account', 'verify', 'download', 'update', 'docs', 'news', 'login', 'setup.exe']
+
+DEFAULT_THRESHOLDS = {'urls_per_sec': 0.25, 'p95_ms': 0.35, 'quota_efficiency': 0.1}
+
+
+def generate_urls(count, rng, suspicious_share=0.3):
+    """Lager syntetiske, men realistiske URLer med tilfeldige stier"""
+    urls = []
+    for _ in range(count):
+        pool = SUSPICIOUS_DOMAINS if rng.random() < suspicious_share else BENIGN_DOMAINS
+        domain = rng.choice(pool)
+        path = '/'.join(rng.choice(PATH_WORDS) for _ in range(rng.randint(1, 3)))
+        token = ''.join(rng.choice('abcdef0123456789') for _ in range(8))
+        urls.append(f'http://{domain}/{path}?id={token}')
+    return urls
+
+
+def is_verdict(result):
+    return result.get('risk_category') in ('KRITISK', 'HØY', 'MEDIUM', 'LAV')
+
+
+def summarize(latencies, elapsed, verdicts, urls, stats_before, stats_after):
+    quota_requests = stats_after.get('quota_requests', 0) - stats_before.get('quota_requests', 0)
+    rate_limited = stats_after.get('rate_limited', 0) - stats_before.get('rate_limited', 0)
+    return {
+        'urls': urls,
+        'seconds': round(elapsed, 3),
+        'urls_per_sec': round(urls / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'verdicts': verdicts,
+        'vt_requests': quota_requests,
+        'rate_limited': rate_limited,
+        'quota_efficiency': round(verdicts / quota_requests, 3) if quota_requests else float(verdicts)
+    }
+
+
+def benchmark_keys(count):
+    return ','.join(f'benchmark-key-{i}' for i in range(count))
+
+
+def configure_phishing(phishing_analyzer, time_scale, key_count):
+    """Peker analysatoren mot benchmark-nøkler og skalerer ventetidene"""
+    phishing_analyzer.key_pool = VTKeyPool.from_string(benchmark_keys(key_count))
+    phishing_analyzer.key_pool.set_window(60 * time_scale)
+    phishing_analyzer.rate_limit_wait = 60 * time_scale
+    phishing_analyzer.scan_wait = 15 * time_scale
+
+
+def run_direct(standin, batch_size, concurrency, time_scale, key_count, rng):
+    """Driver SOCAnalyzer.analyze_and_categorize direkte fra en trådpool"""
+    from analyzers.soc_analyzer import SOCAnalyzer
+    from analyzers.phishing_analyzer import PhishingAnalyzer
+    from analyzers.mitre_analyzer import MitreAttackAnalyzer
+
+    phishing = PhishingAnalyzer(base_url=standin.base_url)
+    configure_phishing(phishing, time_scale, key_count)
+    with contextlib.redirect_stdout(io.StringIO()):
+        soc = SOCAnalyzer(phishing_analyzer=phishing, mitre_analyzer=MitreAttackAnalyzer(offline=True))
+
+    urls = generate_urls(batch_size, rng)
+    latencies = []
+
+    def analyze(url):
+        start = time.perf_counter()
+        result = soc.analyze_and_categorize(url)
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    stats_before = standin.state.stats()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(analyze, urls))
+    elapsed = time.perf_counter() - start
+
+    verdicts = sum(1 for r in results if is_verdict(r))
+    return summarize(latencies, elapsed, verdicts, len(urls), stats_before, standin.state.stats())
+
+
+def load_app(standin, time_scale, key_count):
+    """Importerer Flask-appen mot en midlertidig database og stand-in serveren"""
+    workdir = tempfile.mkdtemp(prefix='soc_bench_')
+    db_path = os.path.join(workdir, 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}?timeout=30'
+    os.environ['VIRUSTOTAL_BASE_URL'] = standin.base_url
+    os.environ['VIRUSTOTAL_API_KEYS'] = benchmark_keys(key_count)
+    os.environ['MITRE_OFFLINE'] = '1'
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import create_app
+        app = create_app({
+            'URL_LISTS_DIR': os.path.join(workdir, 'lists'),
+            'MITRE_STORE_PATH': os.path.join(workdir, 'attack_techniques.db'),
+            'VT_QUOTA_LEDGER': os.path.join(workdir, 'vt_quota.db'),
+            'ARCHIVE_DIR': os.path.join(workdir, 'archive'),
+            'SINGLE_FLIGHT_PATH': os.path.join(workdir, 'inflight.db'),
+            'SCHEDULER_ENABLED': False
+        })
+    configure_phishing(app.extensions['soc']['analyzer'].analyzer, time_scale, key_count)
+    return app
+
+
+def run_route(app, standin, batch_size, concurrency, rng):
+    """Driver POST /analyze med `concurrency` samtidige klienter som hver sender en batch"""
+    batches = [generate_urls(batch_size, rng) for _ in range(concurrency)]
+    latencies = []
+    verdicts = []
+
+    def post(batch):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/analyze', data={'urls': '\n'.join(batch)})
+        latencies.append(time.perf_counter() - start)
+        if response.status_code == 200:
+            verdicts.append(sum(1 for r in response.get_json()['results'] if is_verdict(r)))
+
+    stats_before = standin.state.stats()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(post, batches))
+    elapsed = time.perf_counter() - start
+
+    return summarize(latencies, elapsed, sum(verdicts), batch_size * concurrency,
+                     stats_before, standin.state.stats())
+
+
+def print_table(results):
+    print(f"\n{'Case':<22}{'URLs':>6}{'URLs/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'VT-kall':>9}{'204':>6}{'Kvote-eff.':>12}")
+    for case, r in results.items():
+        print(f"{case:<22}{r['urls']:>6}{r['urls_per_sec']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['vt_requests']:>9}{r['rate_limited']:>6}{r['quota_efficiency']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gjennomstrømningsbenchmark for URL-analyse')
+    parser.add_argument('--mode', choices=['direct', 'route', 'both'], default='both')
+    parser.add_argument('--batch-sizes', default='10,50,200')
+    parser.add_argument('--concurrency', default='1,4,16')
+    parser.add_argument('--time-scale', type=float, default=0.01,
+                        help='Skalerer kvotevindu og ventetider (1.0 = ekte VirusTotal-tider)')
+    parser.add_argument('--keys', type=int, default=1, help='Antall API-nøkler i nøkkelpoolen')
+    parser.add_argument('--baseline', default=baseline_path('analyzer_throughput'))
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help='Avslutt med feil ved regresjon')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='Overstyr tillatt relativ forverring for alle metrikker')
+    add_standin_arguments(parser)
+    parser.set_defaults(seed=42)
+    args = parser.parse_args()
+
+    options = standin_options(args)
+    options['window_seconds'] = args.window * args.time_scale
+    rng = random.Random(args.seed)
+    batch_sizes = [int(v) for v in args.batch_sizes.split(',')]
+    concurrencies = [int(v) for v in args.concurrency.split(',')]
+
+    results = {}
+    with VirusTotalStandIn(**options) as standin:
+        print(f"Stand-in kjører på {standin.base_url}")
+        flask_app = load_app(standin, args.time_scale, args.keys) if args.mode in ('route', 'both') else None
+
+        for batch_size in batch_sizes:
+            for concurrency in concurrencies:
+                if args.mode in ('direct', 'both'):
+                    case = f'direct-b{batch_size}-c{concurrency}'
+                    results[case] = run_direct(standin, batch_size, concurrency, args.time_scale, args.keys, rng)
+                    print(f"✓ {case}: {results[case]['urls_per_sec']} URLs/s")
+                if flask_app:
+                    case = f'route-b{batch_size}-c{concurrency}'
+                    results[case] = run_route(flask_app, standin, batch_size, concurrency, rng)
+                    print(f"✓ {case}: {results[case]['urls_per_sec']} URLs/s")
+
+    print_table(results)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results)
+        print(f"\nBaseline lagret til {args.baseline}")
+        return 0
+
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if args.max_regression is not None:
+        thresholds = {metric: args.max_regression for metric in thresholds}
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        # Med --check er en manglende baseline en feil, ellers passerer sjekken uten å sammenligne noe
+        print(f"\nIngen baseline funnet ({args.baseline}) - kjør med --update-baseline")
+        return 1 if args.check else 0
+    exit_code = report_regressions(compare(results, baseline, thresholds))
+    return exit_code if args.check else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
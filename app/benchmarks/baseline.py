@@ -0,0 +1,100 @@
+"""Lagring av baseline-tall og sjekk av regresjoner for benchmarks"""
+import json
+import os
+import platform
+from datetime import datetime
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# Retning per metrikk: 'higher' betyr at høyere verdi er bedre
+METRIC_DIRECTIONS = {
+    'urls_per_sec': 'higher',
+    'quota_efficiency': 'higher',
+    'p50_ms': 'lower',
+    'p95_ms': 'lower',
+    'p99_ms': 'lower',
+    'median_ms': 'lower',
+    'peak_kb': 'lower'
+}
+
+
+def percentile(values, pct):
+    """Enkel persentil med lineær interpolasjon"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    """Lagrer resultater som ny baseline sammen med litt kontekst om maskinen"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results
+        }, f, indent=2, ensure_ascii=False)
+
+
+def compare(results, baseline, thresholds, noise_floor=None):
+    """
+    Sammenligner resultater mot baseline.
+    thresholds er maks tillatt relativ forverring per metrikk, f.eks. {'p95_ms': 0.25}.
+    noise_floor er minste absolutte endring per metrikk som kan regnes som regresjon.
+    Returnerer en liste med regresjoner (tom liste = ok).
+    """
+    regressions = []
+    baseline_results = (baseline or {}).get('results', {})
+
+    for case, metrics in results.items():
+        previous = baseline_results.get(case)
+        if not previous:
+            continue
+        for metric, limit in thresholds.items():
+            if metric not in metrics or not previous.get(metric):
+                continue
+            old, new = previous[metric], metrics[metric]
+            if abs(new - old) < (noise_floor or {}).get(metric, 0):
+                continue
+            if METRIC_DIRECTIONS.get(metric, 'lower') == 'higher':
+                change = (old - new) / old
+            else:
+                change = (new - old) / old
+            if change > limit:
+                regressions.append({
+                    'case': case,
+                    'metric': metric,
+                    'baseline': old,
+                    'current': new,
+                    'change_pct': round(change * 100, 1),
+                    'limit_pct': round(limit * 100, 1)
+                })
+    return regressions
+
+
+def report_regressions(regressions):
+    """Skriver ut regresjoner og returnerer exit-kode"""
+    if not regressions:
+        print("\n✓ Ingen regresjoner mot baseline")
+        return 0
+    print(f"\n✗ {len(regressions)} regresjon(er) mot baseline:")
+    for r in regressions:
+        print(f"  {r['case']} {r['metric']}: {r['baseline']} -> {r['current']} "
+              f"({r['change_pct']:+}% > {r['limit_pct']}%)")
+    return 1
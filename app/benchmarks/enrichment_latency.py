@@ -0,0 +1,110 @@
+"""
+Latens per URL med og uten berikelse, mot lokale erstatninger for VirusTotal og
+berikelsestjenestene. Viser at berikelsen koster den kritiske stien og ikke
+summen av stegene, og at den skjules bak VirusTotal-oppslaget.
+
+Kjøres fra app-mappen:
+
+    python -m benchmarks.enrichment_latency --urls 100 --concurrency 4
+    python -m benchmarks.enrichment_latency --stages dns,whois:0.1,passive_dns --rdap-latency fixed:0.5
+"""
+import argparse
+import contextlib
+import io
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analyzers.enrichment import build_pipeline
+from benchmarks.analyzer_throughput import configure_phishing, generate_urls
+from benchmarks.baseline import percentile
+from benchmarks.enrichment_standin import (EnrichmentStandIn, add_enrichment_standin_arguments,
+                                           enrichment_standin_options)
+from benchmarks.vt_standin import VirusTotalStandIn
+
+
+def make_pipeline(spec, enrichment_standin, cache):
+    options = enrichment_standin.stage_options
+    if not cache:
+        for stage_options in options.values():
+            stage_options['cache_ttl'] = 0
+    return build_pipeline(spec, options)
+
+
+def run_case(vt_standin, pipeline, urls, concurrency, time_scale):
+    """Analyserer URLene med SOCAnalyzer og gir latenser og stegtider per URL"""
+    from analyzers.soc_analyzer import SOCAnalyzer
+    from analyzers.phishing_analyzer import PhishingAnalyzer
+    from analyzers.mitre_analyzer import MitreAttackAnalyzer
+
+    phishing = PhishingAnalyzer(base_url=vt_standin.base_url)
+    configure_phishing(phishing, time_scale, key_count=64)
+    with contextlib.redirect_stdout(io.StringIO()):
+        soc = SOCAnalyzer(phishing_analyzer=phishing, mitre_analyzer=MitreAttackAnalyzer(offline=True),
+                          enrichment=pipeline)
+
+    latencies, enrichment_ms, stage_sums, techniques = [], [], [], 0
+
+    def analyze(url):
+        nonlocal techniques
+        start = time.perf_counter()
+        result = soc.analyze_and_categorize(url)
+        latencies.append(time.perf_counter() - start)
+        if 'enrichment' in result:
+            enrichment_ms.append(result['enrichment']['elapsed_ms'])
+            stage_sums.append(result['enrichment']['stage_ms_sum'])
+            techniques += sum(1 for technique in ('T1583.001', 'T1568.001')
+                              if technique in result['mitre_analysis']['techniques'])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(analyze, urls))
+
+    summary = {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1)
+    }
+    if enrichment_ms:
+        summary.update(
+            enrichment_p50_ms=round(percentile(enrichment_ms, 50), 1),
+            stage_sum_p50_ms=round(percentile(stage_sums, 50), 1),
+            enrichment_techniques=techniques
+        )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latens per URL med og uten berikelse')
+    parser.add_argument('--urls', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--stages', default='dns,whois,passive_dns',
+                        help='Steg med valgfri tidsfrist, f.eks. dns:1,whois:0.5,passive_dns')
+    parser.add_argument('--cache', action='store_true', help='Bruk stegcachen (standard av, så alle kall måles)')
+    parser.add_argument('--vt-latency', default='fixed:0.2', help='Latens for VirusTotal-erstatningen')
+    parser.add_argument('--time-scale', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=42)
+    add_enrichment_standin_arguments(parser)
+    args = parser.parse_args()
+
+    urls = generate_urls(args.urls, random.Random(args.seed))
+    results = {}
+    with VirusTotalStandIn(latency=args.vt_latency, rate_limit=0, unknown_rate=0.0) as vt_standin, \
+            EnrichmentStandIn(**enrichment_standin_options(args)) as enrichment_standin:
+        results['uten berikelse'] = run_case(vt_standin, None, urls, args.concurrency, args.time_scale)
+        pipeline = make_pipeline(args.stages, enrichment_standin, args.cache)
+        results['med berikelse'] = run_case(vt_standin, pipeline, urls, args.concurrency, args.time_scale)
+        stages = pipeline.status()['stages']
+
+    print(f"\n{'Tilfelle':<18}{'p50 ms':>10}{'p95 ms':>10}{'berik. p50':>12}{'sum steg p50':>14}{'teknikker':>11}")
+    for case, r in results.items():
+        print(f"{case:<18}{r['p50_ms']:>10}{r['p95_ms']:>10}{r.get('enrichment_p50_ms', '-'):>12}"
+              f"{r.get('stage_sum_p50_ms', '-'):>14}{r.get('enrichment_techniques', '-'):>11}")
+    print(f"\n{'Steg':<14}{'kjøringer':>10}{'ok':>6}{'feil':>6}{'tidsavbrudd':>13}{'cache':>7}{'snitt ms':>10}")
+    for name, stage in stages.items():
+        print(f"{name:<14}{stage['runs']:>10}{stage['ok']:>6}{stage['error']:>6}{stage['timeout']:>13}"
+              f"{stage['cache_hits']:>7}{str(stage['avg_ms']):>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,197 @@
+"""
+Lokal erstatning for berikelsestjenestene: DNS-over-HTTPS (JSON), RDAP og passiv DNS.
+
+Brukes til benchmarks og testing av berikelsespipelinen uten nettverk:
+
+    python -m benchmarks.enrichment_standin --port 8766 --dns-latency fixed:0.05 --rdap-latency fixed:0.2
+    ENRICHMENT_STAGES=dns,whois,passive_dns \\
+    ENRICHMENT_DNS_URL=http://127.0.0.1:8766/dns-query \\
+    ENRICHMENT_RDAP_URL=http://127.0.0.1:8766/rdap/ \\
+    ENRICHMENT_PDNS_URL=http://127.0.0.1:8766/pdns/query/ python app.py
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.vt_standin import MALICIOUS_KEYWORDS, parse_latency
+
+
+def _digest(value):
+    return int(hashlib.sha256(value.encode('utf-8')).hexdigest(), 16)
+
+
+def _addresses(host, count):
+    digest = _digest(host)
+    return [f'198.51.{(digest >> (8 * i)) % 256}.{(digest >> (8 * i + 4)) % 254 + 1}' for i in range(count)]
+
+
+class EnrichmentStandInState:
+    """
+    Deterministiske svar basert på navnet: vertsnavn med 'nx' finnes ikke, 'flux' gir
+    mange IP-adresser, og domener med mistenkelige ord er registrert de siste dagene.
+    """
+
+    def __init__(self, dns_latency='fixed:0.0', rdap_latency='fixed:0.0', pdns_latency='fixed:0.0'):
+        self.latency = {
+            'dns': parse_latency(dns_latency),
+            'rdap': parse_latency(rdap_latency),
+            'pdns': parse_latency(pdns_latency)
+        }
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+
+    def count(self, service):
+        with self.lock:
+            self.counters[service] += 1
+
+    def dns(self, name, record_type):
+        if 'nx' in name:
+            return {'Status': 3, 'Answer': []}
+        if record_type != 'A':
+            return {'Status': 0, 'Answer': []}
+        count = 12 if 'flux' in name else 1 + _digest(name) % 2
+        return {'Status': 0, 'Answer': [{'name': name, 'type': 1, 'TTL': 300, 'data': ip}
+                                        for ip in _addresses(name, count)]}
+
+    def rdap(self, domain):
+        if 'nx' in domain:
+            return None
+        suspicious = any(keyword in domain for keyword in MALICIOUS_KEYWORDS)
+        age = 1 + _digest(domain) % 20 if suspicious else 400 + _digest(domain) % 5000
+        created = datetime.now(timezone.utc) - timedelta(days=age)
+        return {
+            'objectClassName': 'domain',
+            'ldhName': domain,
+            'events': [{'eventAction': 'registration', 'eventDate': created.strftime('%Y-%m-%dT%H:%M:%SZ')}]
+        }
+
+    def pdns(self, host):
+        if 'nx' in host:
+            return None
+        count = 15 if 'flux' in host else 2
+        return [
+            {'rrname': host, 'rrtype': 'A', 'rdata': ip, 'time_first': 1700000000 + i * 3600,
+             'time_last': 1700000000 + i * 3600 + 600, 'count': 1}
+            for i, ip in enumerate(_addresses(host + '#pdns', count))
+        ]
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class EnrichmentStandInHandler(BaseHTTPRequestHandler):
+    server_version = 'EnrichmentStandIn/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.server.state
+        parsed = urlparse(self.path)
+        path = parsed.path
+        params = parse_qs(parsed.query)
+
+        if path == '/_stats':
+            return self._send(200, json.dumps(state.stats()).encode('utf-8'))
+        if path == '/dns-query':
+            state.count('dns')
+            time.sleep(max(0.0, state.latency['dns']()))
+            answer = state.dns(params.get('name', [''])[0].lower(), params.get('type', ['A'])[0].upper())
+            return self._send(200, json.dumps(answer).encode('utf-8'), 'application/dns-json')
+        if path.startswith('/rdap/domain/'):
+            state.count('rdap')
+            time.sleep(max(0.0, state.latency['rdap']()))
+            record = state.rdap(path[len('/rdap/domain/'):].lower())
+            if record is None:
+                return self._send(404, json.dumps({'errorCode': 404}).encode('utf-8'))
+            return self._send(200, json.dumps(record).encode('utf-8'), 'application/rdap+json')
+        if path.startswith('/pdns/query/'):
+            state.count('pdns')
+            time.sleep(max(0.0, state.latency['pdns']()))
+            records = state.pdns(path[len('/pdns/query/'):].lower())
+            if records is None:
+                return self._send(404)
+            body = '\n'.join(json.dumps(record) for record in records).encode('utf-8')
+            return self._send(200, body, 'application/x-ndjson')
+        return self._send(404, json.dumps({'error': 'not found'}).encode('utf-8'))
+
+
+class EnrichmentStandIn:
+    """Starter stand-in serveren i en bakgrunnstråd"""
+
+    def __init__(self, host='127.0.0.1', port=0, **state_options):
+        self.state = EnrichmentStandInState(**state_options)
+        self.server = ThreadingHTTPServer((host, port), EnrichmentStandInHandler)
+        self.server.daemon_threads = True
+        self.server.state = self.state
+        self.thread = None
+
+    @property
+    def root_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    @property
+    def stage_options(self):
+        """Konstruktørargumenter til analyzers.enrichment.build_pipeline"""
+        return {
+            'dns': {'resolver_url': self.root_url + 'dns-query'},
+            'whois': {'base_url': self.root_url + 'rdap/'},
+            'passive_dns': {'base_url': self.root_url + 'pdns/query/'}
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_enrichment_standin_arguments(parser):
+    """Felles kommandolinjevalg for latensen til hver tjeneste"""
+    parser.add_argument('--dns-latency', default='fixed:0.03', help='Latens for DNS-over-HTTPS, f.eks. fixed:0.03')
+    parser.add_argument('--rdap-latency', default='lognormal:-1.9,0.4', help='Latens for RDAP (domenealder)')
+    parser.add_argument('--pdns-latency', default='lognormal:-2.3,0.4', help='Latens for passiv DNS')
+    return parser
+
+
+def enrichment_standin_options(args):
+    return {'dns_latency': args.dns_latency, 'rdap_latency': args.rdap_latency, 'pdns_latency': args.pdns_latency}
+
+
+if __name__ == '__main__':
+    parser = add_enrichment_standin_arguments(argparse.ArgumentParser(description='Lokal erstatning for berikelse'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    standin = EnrichmentStandIn(args.host, args.port, **enrichment_standin_options(args))
+    print(f"Berikelses-stand-in lytter på {standin.root_url}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        standin.server.server_close()
@@ -0,0 +1,114 @@
+"""
+Sjekker importtiden for Flask-appen med `python -X importtime` mot et budsjett,
+og at tunge rapportmoduler ikke lastes av arbeidere som aldri lager rapporter.
+
+Kjøres fra app-mappen:
+
+    python -m benchmarks.import_budget                   # import app
+    python -m benchmarks.import_budget --create-app      # import app + create_app()
+    python -m benchmarks.import_budget --budget-ms 400 --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Moduler som bare trengs for PDF-rapporter og Excel-eksport
+HEAVY_MODULES = ('matplotlib', 'reportlab', 'pandas', 'numpy', 'openpyxl')
+
+CREATE_APP_SNIPPET = """
+import os, sys, resource, tempfile
+workdir = tempfile.mkdtemp(prefix='soc_import_')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(workdir, 'import.db'))
+os.environ.setdefault('MITRE_OFFLINE', '1')
+from app import create_app
+create_app({
+    'URL_LISTS_DIR': os.path.join(workdir, 'lists'),
+    'MITRE_STORE_PATH': os.path.join(workdir, 'attack_techniques.db'),
+    'VT_QUOTA_LEDGER': os.path.join(workdir, 'vt_quota.db'),
+    'ARCHIVE_DIR': os.path.join(workdir, 'archive'),
+    'SINGLE_FLIGHT_PATH': os.path.join(workdir, 'inflight.db'),
+    'SCHEDULER_ENABLED': False
+})
+"""
+
+REPORT_SNIPPET = """
+print('HEAVY=' + ','.join(m for m in {heavy!r} if m in sys.modules), file=sys.stderr)
+print('MAXRSS_KB=%d' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+"""
+
+
+def parse_importtime(stderr):
+    """Returnerer [(modul, self_us, kumulativ_us, dybde)] fra -X importtime-utskrift"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(create_app=False):
+    code = 'import sys, resource\n' + (CREATE_APP_SNIPPET if create_app else 'import app\n')
+    code += REPORT_SNIPPET.format(heavy=HEAVY_MODULES)
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=app_dir)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=app_dir, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr[-2000:])
+
+    rows = parse_importtime(completed.stderr)
+    # Alt før 'resource' er tolkerens egen oppstart (site, encodings, ...)
+    start = next(i for i, row in enumerate(rows) if row[0] == 'resource' and row[3] == 0) + 1
+    rows = rows[start:]
+    values = dict(line.split('=', 1) for line in completed.stderr.splitlines()
+                  if line.startswith(('HEAVY=', 'MAXRSS_KB=')))
+    return {
+        # Toppnivåimporter summert gir total importtid
+        'import_ms': sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000,
+        'heavy': [m for m in values.get('HEAVY', '').split(',') if m],
+        'maxrss_mb': int(values.get('MAXRSS_KB', 0)) / 1024,
+        'slowest': sorted(rows, key=lambda row: row[1], reverse=True)[:10]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=500.0,
+                        help='maks median importtid i millisekunder')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--create-app', action='store_true', help='kjør også create_app()')
+    args = parser.parse_args()
+
+    # Første kjøring kompilerer .pyc-filer og telles ikke
+    measure(args.create_app)
+    runs = [measure(args.create_app) for _ in range(args.runs)]
+    median_ms = statistics.median(run['import_ms'] for run in runs)
+    last = runs[-1]
+
+    print(f"Importtid (median av {args.runs}): {median_ms:.1f} ms (budsjett {args.budget_ms:.0f} ms)")
+    print(f"Maks RSS: {last['maxrss_mb']:.1f} MB")
+    print("Tregeste moduler (egen tid):")
+    for name, self_us, cumulative_us, _ in last['slowest']:
+        print(f"  {self_us / 1000:7.1f} ms  {name}")
+
+    failed = False
+    if last['heavy']:
+        print(f"✗ Tunge moduler lastet ved oppstart: {', '.join(last['heavy'])}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"✗ Importtiden er over budsjettet")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✓ Innenfor budsjett")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Lasttest av Flask-rutene mot stadig større analysetabeller. For hver tabellstørrelse
+fylles en egen database med benchmarks.seed_database, og hver rute kjøres med et
+antall samtidige klienter. Resultatet er latens (p50/p95/p99) og topp-minne
+(tracemalloc, egen kjøring) per rute og størrelse, og hvor raskt p50 vokser med
+tabellen (1.0 = lineært).
+
+Kjøres fra app-mappen:
+
+    python -m benchmarks.load_driver --sizes 10000,100000,1000000 --requests 20 --concurrency 4
+    python -m benchmarks.load_driver --routes history,export_all --workdir /tmp/soc_load --warm
+
+Databasene i --workdir gjenbrukes, så en ny kjøring slipper å fylle dem på nytt.
+Etter seeding bygges domeneomdømme, indikatorindeks og URL-klynger (--rebuild), siden
+masseinnsettingen går utenom dem; i en gjenbrukt database bare de som er tomme.
+Ruter der forventet p50 (lineært fra forrige størrelse) går over --budget sekunder
+hoppes over for resten av størrelsene.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks.baseline import percentile
+from benchmarks.seed_database import (REBUILD_CHOICES, empty_targets, load_app, parse_rebuild, rebuild,
+                                     seed_database)
+from benchmarks.synthetic import PATH_WORDS, RISK_DISTRIBUTION
+
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'exports')
+
+
+def _days_ago(days):
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def _category(rng):
+    return rng.choice([category for category, _ in RISK_DISTRIBUTION])
+
+
+# Rute -> funksjon som gir (metode, sti, skjemadata); None betyr kall i prosessen
+ROUTES = {
+    'history': lambda rng: ('GET', f'/history?page={rng.randint(1, 20)}', None),
+    'history_search': lambda rng: (
+        'GET', f'/history?search={rng.choice(PATH_WORDS)}&risk_category={_category(rng)}', None
+    ),
+    'history_30d': lambda rng: ('GET', f'/history?date_from={_days_ago(30)}&page={rng.randint(1, 5)}', None),
+    'period_stats': None,
+    'export_30d': lambda rng: ('GET', f'/export?date_from={_days_ago(30)}', None),
+    'export_all': lambda rng: ('GET', '/export', None),
+    'report_30d': lambda rng: ('POST', '/generate_report', {'date_from': _days_ago(30)}),
+    'report_all': lambda rng: ('POST', '/generate_report', {})
+}
+DEFAULT_ROUTES = 'history,history_search,history_30d,period_stats,export_30d,report_30d'
+
+
+def period_stats(app):
+    """calculate_period_stats over hele tabellen, slik /history gjør uten filter"""
+    from app import history_filters, history_query
+    from models import db
+    from reporting.statistics import calculate_period_stats
+
+    with app.app_context():
+        try:
+            return calculate_period_stats(history_query(history_filters({})).all())
+        finally:
+            db.session.remove()
+
+
+def make_request(app, route, rng, cold):
+    """Én forespørsel; gir True hvis den lyktes"""
+    if ROUTES[route] is None:
+        period_stats(app)
+        return True
+    if cold:
+        app.extensions['soc']['response_cache'].clear()
+    method, path, data = ROUTES[route](rng)
+    client = app.test_client()
+    response = client.open(path, method=method, data=data)
+    try:
+        response.get_data()
+        return response.status_code < 400
+    finally:
+        response.close()
+
+
+def run_route(app, route, requests, concurrency, cold, seed):
+    latencies, errors = [], 0
+
+    def one(index):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + index)
+        start = time.perf_counter()
+        ok = make_request(app, route, rng, cold)
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+
+    # Topp-minne måles for seg, siden tracemalloc gjør alt annet tregere
+    tracemalloc.start()
+    try:
+        make_request(app, route, random.Random(seed), cold)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'peak_mb': round(peak / 1024 / 1024, 1)
+    }
+
+
+def remove_new_exports(before):
+    """Fjerner filene rutene la i exports-mappen under kjøringen"""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    for name in set(os.listdir(EXPORT_DIR)) - before:
+        os.remove(os.path.join(EXPORT_DIR, name))
+
+
+def growth(results, route, sizes):
+    """Eksponenten i p50 ~ rader^k mellom de to største målte størrelsene"""
+    measured = [size for size in sizes if results[size].get(route, {}).get('p50_ms')]
+    if len(measured) < 2:
+        return None
+    small, large = measured[-2], measured[-1]
+    ratio = results[large][route]['p50_ms'] / results[small][route]['p50_ms']
+    return round(math.log(ratio) / math.log(large / small), 2)
+
+
+def print_table(results, routes, sizes):
+    header = f"{'Rute':<16}{'rader':>10}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'topp MB':>9}{'feil':>6}"
+    print('\n' + header)
+    print('-' * len(header))
+    for route in routes:
+        for size in sizes:
+            r = results[size].get(route)
+            if r is None:
+                print(f"{route:<16}{size:>10}{'hoppet over (budsjett)':>42}")
+                continue
+            print(f"{route:<16}{size:>10}{r['p50_ms']:>11}{r['p95_ms']:>11}{r['p99_ms']:>11}"
+                  f"{r['peak_mb']:>9}{r['errors']:>6}")
+        exponent = growth(results, route, sizes)
+        if exponent is not None:
+            print(f"{'':<16}{'vekst':>10}{exponent:>11}")
+
+
+def parse_sizes(value):
+    return sorted(int(size) for size in value.split(',') if size.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lasttest av rutene mot voksende analysetabeller')
+    parser.add_argument('--sizes', type=parse_sizes, default=[10000, 100000, 1000000])
+    parser.add_argument('--routes', default=DEFAULT_ROUTES, help=f"Blant: {', '.join(ROUTES)}")
+    parser.add_argument('--requests', type=int, default=20, help='Forespørsler per rute og størrelse')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warm', action='store_true',
+                        help='Behold svarcachen mellom forespørslene (standard: tømmes før hver)')
+    parser.add_argument('--budget', type=float, default=60.0,
+                        help='Hopp over en rute når forventet p50 i sekunder går over dette')
+    parser.add_argument('--workdir', help='Mappe for databasene (gjenbrukes); standard er en midlertidig mappe')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rebuild', type=parse_rebuild, default=list(REBUILD_CHOICES),
+                        help='Avledede tabeller som bygges etter seeding (standard alle; clusters er tregt)')
+    parser.add_argument('--output', help='Skriv resultatene som JSON hit')
+    args = parser.parse_args()
+
+    routes = [route.strip() for route in args.routes.split(',') if route.strip()]
+    unknown = [route for route in routes if route not in ROUTES]
+    if unknown:
+        parser.error(f"Ukjente ruter: {', '.join(unknown)}")
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory(prefix='soc_load_'))
+        os.makedirs(workdir, exist_ok=True)
+        exports_before = set(os.listdir(EXPORT_DIR)) if os.path.isdir(EXPORT_DIR) else set()
+        results, previous = {}, {}
+        try:
+            for size in args.sizes:
+                app = load_app(f"sqlite:///{os.path.join(workdir, f'load_{size}.db')}?timeout=30",
+                               os.path.join(workdir, f'app_{size}'))
+                started = time.perf_counter()
+                with app.app_context():
+                    inserted = seed_database(size, seed=args.seed)
+                    print(f"{size} rader ({inserted} nye på {time.perf_counter() - started:.1f} s)", flush=True)
+                    targets = args.rebuild if inserted else empty_targets(args.rebuild)
+                    for target, seconds in rebuild(targets).items():
+                        print(f"  bygde {target} på nytt på {seconds} s", flush=True)
+
+                results[size] = {}
+                for route in routes:
+                    if route in previous:
+                        last_size, last = previous[route]
+                        expected = last['p50_ms'] / 1000 * size / last_size
+                        if expected > args.budget:
+                            print(f"  {route}: hoppet over, forventet p50 {expected:.0f} s", flush=True)
+                            continue
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        result = run_route(app, route, args.requests, args.concurrency, not args.warm, args.seed)
+                    results[size][route] = result
+                    previous[route] = (size, result)
+                    print(f"  {route}: p50 {result['p50_ms']} ms, topp {result['peak_mb']} MB", flush=True)
+        finally:
+            remove_new_exports(exports_before)
+
+    print_table(results, routes, args.sizes)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({str(size): by_route for size, by_route in results.items()}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
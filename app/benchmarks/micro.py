@@ -0,0 +1,175 @@
+"""
+Mikrobenchmarks for MITRE-analyse og rapportbygging med regresjonsterskler.
+
+Kjøres fra app-mappen:
+
+    python -m benchmarks.micro                       # kjør og sammenlign mot baseline
+    python -m benchmarks.micro --update-baseline     # lagre nye baseline-tall
+    python -m benchmarks.micro --check --sizes 100,10000 --only mitre
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from analyzers.mitre_analyzer import MitreAttackAnalyzer
+from analyzers.domain_reputation import parse_risk_score
+from benchmarks.baseline import baseline_path, load_baseline, save_baseline, compare, report_regressions
+from benchmarks.synthetic import synthetic_analyses, synthetic_stix_bundle
+
+DEFAULT_THRESHOLDS = {'median_ms': 0.30, 'peak_kb': 0.20}
+# Absolutte endringer under dette regnes som støy (små cases varierer mye relativt)
+NOISE_FLOOR = {'median_ms': 2.0, 'peak_kb': 64.0}
+
+
+def quiet(fn):
+    """Kjører fn uten debug-utskriftene fra analysatorene"""
+    def wrapper(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn(*args)
+    return wrapper
+
+
+def measure(fn, setup, repeat):
+    """Median kjøretid over `repeat` kjøringer og toppminne fra en separat kjøring"""
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+
+    arg = setup()
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'runs': repeat,
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'min_ms': round(min(timings) * 1000, 3),
+        'peak_kb': round(peak / 1024, 1)
+    }
+
+
+def offline_mitre():
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer = MitreAttackAnalyzer(offline=True)
+        analyzer._load_stix_objects(synthetic_stix_bundle())
+    return analyzer
+
+
+def threat_inputs(count):
+    """Input på samme form som SOCAnalyzer sender til analyze_threat"""
+    inputs = []
+    for analysis in synthetic_analyses(count, seed=7):
+        positives = (parse_risk_score(analysis['risk_score']) or (0, 0))[0]
+        inputs.append({
+            'url': analysis['url'],
+            'risk_category': analysis['risk_category'],
+            'base_findings': {'positives': positives, 'risk_score': analysis['risk_score']}
+        })
+    return inputs
+
+
+def mitre_cases(repeat):
+    bundle_json = json.dumps(synthetic_stix_bundle())
+    analyzer = offline_mitre()
+    inputs = threat_inputs(1000)
+    technique_sets = [analyzer._identify_techniques(data) for data in inputs]
+
+    def load_stix(target):
+        # Inkluderer JSON-parsing, som er en stor del av oppstartskostnaden
+        target._load_stix_objects(json.loads(bundle_json))
+
+    def fresh_analyzer():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return MitreAttackAnalyzer(offline=True)
+
+    return {
+        'mitre_stix_load': (quiet(load_stix), fresh_analyzer, repeat),
+        'mitre_identify_techniques_x1000': (
+            lambda _: [analyzer._identify_techniques(data) for data in inputs], lambda: None, repeat),
+        'mitre_risk_score_x1000': (
+            quiet(lambda _: [analyzer._calculate_risk_score(t) for t in technique_sets]), lambda: None, repeat),
+        'mitre_analyze_threat_x1000': (
+            quiet(lambda _: [analyzer.analyze_threat(data) for data in inputs]), lambda: None, repeat)
+    }
+
+
+def report_cases(sizes, repeat):
+    from reporting.report_generator import ReportGenerator
+    from reporting.statistics import calculate_period_stats
+
+    output_dir = tempfile.mkdtemp(prefix='soc_micro_')
+    generator = ReportGenerator()
+    cases = {}
+
+    for size in sizes:
+        rows = []
+        for analysis in synthetic_analyses(size, seed=size):
+            analysis['timestamp'] = analysis['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
+            rows.append(analysis)
+        records = [SimpleNamespace(**row) for row in rows]
+        output_path = os.path.join(output_dir, f'report_{size}.pdf')
+
+        # PDF-er med mange rader er trege, så store størrelser kjøres færre ganger
+        pdf_repeat = max(1, repeat if size <= 1000 else repeat // 3 if size <= 10000 else 1)
+        cases[f'report_pdf_{size}'] = (
+            quiet(lambda data, path=output_path: generator.generate_pdf_report(data, path)),
+            lambda rows=rows: rows, pdf_repeat)
+        cases[f'period_stats_{size}'] = (
+            lambda data: calculate_period_stats(data), lambda records=records: records, repeat)
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mikrobenchmarks for MITRE-analyse og rapporter')
+    parser.add_argument('--sizes', default='100,10000,100000', help='Antall rader for rapport-benchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', choices=['mitre', 'report'], default=None)
+    parser.add_argument('--baseline', default=baseline_path('micro'))
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help='Avslutt med feil ved regresjon')
+    parser.add_argument('--time-threshold', type=float, default=DEFAULT_THRESHOLDS['median_ms'])
+    parser.add_argument('--memory-threshold', type=float, default=DEFAULT_THRESHOLDS['peak_kb'])
+    args = parser.parse_args()
+
+    sizes = [int(v) for v in args.sizes.split(',')]
+    cases = {}
+    if args.only in (None, 'mitre'):
+        cases.update(mitre_cases(args.repeat))
+    if args.only in (None, 'report'):
+        cases.update(report_cases(sizes, args.repeat))
+
+    results = {}
+    print(f"{'Case':<34}{'Runs':>6}{'Median ms':>14}{'Min ms':>14}{'Peak KB':>14}")
+    for name, (fn, setup, repeat) in cases.items():
+        results[name] = measure(fn, setup, repeat)
+        r = results[name]
+        print(f"{name:<34}{r['runs']:>6}{r['median_ms']:>14}{r['min_ms']:>14}{r['peak_kb']:>14}")
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results)
+        print(f"\nBaseline lagret til {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        # Med --check er en manglende baseline en feil, ellers passerer sjekken uten å sammenligne noe
+        print(f"\nIngen baseline funnet ({args.baseline}) - kjør med --update-baseline")
+        return 1 if args.check else 0
+    thresholds = {'median_ms': args.time_threshold, 'peak_kb': args.memory_threshold}
+    exit_code = report_regressions(compare(results, baseline, thresholds, NOISE_FLOOR))
+    return exit_code if args.check else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
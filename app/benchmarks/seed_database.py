@@ -0,0 +1,212 @@
+"""
+Fyller analysetabellen med syntetiske, men realistiske analyser for lasttester:
+risikofordelingen og teknikkene fra benchmarks/synthetic.py, tidsstempler spredt
+over flere år, og URLer som sjekkes på nytt med av og til endret verdikt, slik at
+snapshots og observasjoner får samme form som i produksjon.
+
+Kjøres fra app-mappen mot en egen database (--database eller DATABASE_URL). Appens
+egen database (instance/soc_analysis.db) nektes:
+
+    python -m benchmarks.seed_database --database sqlite:////tmp/load.db --rows 1000000
+    DATABASE_URL=sqlite:////tmp/load.db python -m benchmarks.seed_database --rows 1000000 --rebuild domains,indicators
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.engine import make_url
+
+from benchmarks.synthetic import POSITIVES_RANGE, pick_category, synthetic_url, synthetic_verdict
+
+# Andel rader som sjekker en URL som er sett før, og andelen av dem der verdiktet har endret seg
+REVISIT_SHARE = 0.35
+DRIFT_SHARE = 0.1
+# URLene som kan sjekkes på nytt (de siste N nye)
+REVISIT_POOL = 50000
+
+REBUILD_CHOICES = ('domains', 'indicators', 'clusters')
+
+# Appens egen database; syntetiske rader skal aldri havne der
+INSTANCE_DATABASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 'instance', 'soc_analysis.db')
+
+
+def _permalink(url, timestamp):
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return f"https://www.virustotal.com/gui/url/{digest}/detection/u-{digest}-{int(timestamp.timestamp())}"
+
+
+def _row(rng, url, category, timestamp):
+    row = synthetic_verdict(rng, url, category)
+    row.update(url=url, timestamp=timestamp, source='virustotal')
+    if category in POSITIVES_RANGE:
+        row.update(permalink=_permalink(url, timestamp), policy_version='1')
+    else:
+        row['permalink'] = ''
+    return row
+
+
+def seed_rows(count, start, end, seed=42, revisit=REVISIT_SHARE, drift=DRIFT_SHARE):
+    """
+    Genererer `count` analyser med stigende tidsstempler i (start, end]. En andel av
+    radene sjekker en tidligere URL på nytt; da gjentas verdiktet, bortsett fra en
+    andel `drift` der kategorien trekkes på nytt.
+    """
+    rng = random.Random(seed)
+    span = (end - start).total_seconds()
+    pool = []
+    for i in range(count):
+        timestamp = start + timedelta(seconds=span * (i + rng.random()) / count)
+        if pool and rng.random() < revisit:
+            previous = pool[rng.randrange(len(pool))]
+            if rng.random() < drift:
+                row = _row(rng, previous['url'], pick_category(rng), timestamp)
+            else:
+                row = dict(previous, timestamp=timestamp)
+                if row['permalink']:
+                    row['permalink'] = _permalink(row['url'], timestamp)
+        else:
+            category = pick_category(rng)
+            malicious = category in ('HØY', 'KRITISK') or (category == 'MEDIUM' and rng.random() < 0.5)
+            url = synthetic_url(rng, malicious)
+            row = _row(rng, url, category, timestamp)
+            if len(pool) < REVISIT_POOL:
+                pool.append(row)
+            else:
+                pool[rng.randrange(REVISIT_POOL)] = row
+        yield row
+
+
+def seed_database(rows, seed=42, days=365 * 3, batch_size=20000, progress=None):
+    """
+    Legger til analyser til tabellen har `rows` rader. Nye rader får tidsstempler etter
+    den nyeste eksisterende analysen, så IDene følger tiden som i produksjon.
+    Må kjøres i app-kontekst. Returnerer antall nye rader.
+    """
+    from models import db, Analysis, bulk_insert_analyses
+
+    existing = Analysis.query.count()
+    missing = rows - existing
+    if missing <= 0:
+        return 0
+    end = datetime.now()
+    latest = db.session.query(db.func.max(Analysis.timestamp)).scalar()
+    start = latest if latest and latest < end else end - timedelta(days=days)
+
+    inserted, batch = 0, []
+    for row in seed_rows(missing, start, end, seed=seed + existing):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            inserted += bulk_insert_analyses(batch)
+            db.session.commit()
+            batch = []
+            if progress:
+                progress(existing + inserted, rows)
+    if batch:
+        inserted += bulk_insert_analyses(batch)
+        db.session.commit()
+    return inserted
+
+
+def empty_targets(targets):
+    """De av tabellene i targets som er tomme, f.eks. i en gjenbrukt database fylt uten --rebuild"""
+    from models import DomainReputation, Indicator, UrlCluster
+
+    tables = {'domains': DomainReputation, 'indicators': Indicator, 'clusters': UrlCluster}
+    return [target for target in targets if tables[target].query.first() is None]
+
+
+def rebuild(targets):
+    """Bygger avledede tabeller etter seeding (bulk-innsetting går utenom hendelsene)"""
+    from models import (db, rebuild_domain_reputation, rebuild_indicator_index, rebuild_url_clusters)
+
+    functions = {
+        'domains': rebuild_domain_reputation,
+        'indicators': rebuild_indicator_index,
+        'clusters': rebuild_url_clusters
+    }
+    timings = {}
+    for target in targets:
+        started = time.perf_counter()
+        functions[target]()
+        db.session.commit()
+        timings[target] = round(time.perf_counter() - started, 1)
+    return timings
+
+
+def check_database(database_url):
+    """
+    Databasen seeding og lasttest skal bruke: database_url, ellers DATABASE_URL. Uten
+    noen av dem ville appen brukt sin egen database, så da kastes ValueError, også
+    når den er oppgitt eksplisitt.
+    """
+    database_url = database_url or os.environ.get('DATABASE_URL')
+    if not database_url:
+        raise ValueError('Angi databasen med --database eller DATABASE_URL')
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite' and url.database and \
+            os.path.abspath(url.database) == os.path.abspath(INSTANCE_DATABASE):
+        raise ValueError(f'{INSTANCE_DATABASE} er appens egen database - bruk en egen fil')
+    return database_url
+
+
+def load_app(database_url=None, workdir=None):
+    """Flask-appen mot en gitt database (ellers DATABASE_URL), uten planlegger og uten nett"""
+    database_url = check_database(database_url)
+    workdir = workdir or tempfile.mkdtemp(prefix='soc_load_')
+    os.environ.setdefault('MITRE_OFFLINE', '1')
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import create_app
+        return create_app({
+            'SQLALCHEMY_DATABASE_URI': database_url,
+            'URL_LISTS_DIR': os.path.join(workdir, 'lists'),
+            'MITRE_STORE_PATH': os.path.join(workdir, 'attack_techniques.db'),
+            'VT_QUOTA_LEDGER': os.path.join(workdir, 'vt_quota.db'),
+            'ARCHIVE_DIR': os.path.join(workdir, 'archive'),
+            'SINGLE_FLIGHT_PATH': os.path.join(workdir, 'inflight.db'),
+            'SCHEDULER_ENABLED': False
+        })
+
+
+def parse_rebuild(value):
+    targets = [target.strip() for target in value.split(',') if target.strip()]
+    unknown = [target for target in targets if target not in REBUILD_CHOICES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Ukjent: {', '.join(unknown)} (gyldige: {', '.join(REBUILD_CHOICES)})")
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fyller databasen med syntetiske analyser')
+    parser.add_argument('--database', help='SQLAlchemy-URL, f.eks. sqlite:////tmp/load.db (ellers DATABASE_URL)')
+    parser.add_argument('--rows', type=int, default=1000000, help='Antall rader tabellen skal ha')
+    parser.add_argument('--days', type=int, default=365 * 3, help='Tidsrom for en tom tabell')
+    parser.add_argument('--batch-size', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rebuild', type=parse_rebuild, default=[],
+                        help='Bygg domains,indicators,clusters etterpå (clusters er tregt for store tabeller)')
+    args = parser.parse_args()
+
+    try:
+        app = load_app(args.database)
+    except ValueError as e:
+        parser.error(str(e))
+    started = time.perf_counter()
+    with app.app_context():
+        inserted = seed_database(args.rows, seed=args.seed, days=args.days, batch_size=args.batch_size,
+                                 progress=lambda done, total: print(f"{done}/{total} rader", flush=True))
+        print(f"La til {inserted} rader på {time.perf_counter() - started:.1f} s")
+        if args.rebuild:
+            for target, seconds in rebuild(args.rebuild).items():
+                print(f"Bygde {target} på nytt på {seconds} s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
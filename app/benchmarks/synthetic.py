@@ -0,0 +1,149 @@
+"""Syntetiske, men realistiske data for benchmarks og lasttester"""
+import random
+from datetime import datetime, timedelta
+
+# Omtrentlig fordeling av verdikter slik vi ser dem i produksjon
+RISK_DISTRIBUTION = [
+    ('LAV', 0.68), ('MEDIUM', 0.14), ('HØY', 0.08), ('KRITISK', 0.05), ('UKJENT', 0.02), ('FEIL', 0.03)
+]
+
+# Positive deteksjoner per kategori (av 90 motorer)
+POSITIVES_RANGE = {'LAV': (0, 2), 'MEDIUM': (3, 8), 'HØY': (9, 17), 'KRITISK': (18, 60)}
+
+ACTIONS = {
+    'LAV': 'Ingen umiddelbar handling nødvendig',
+    'MEDIUM': 'Undersøk nærmere - mulig falsk positiv',
+    'HØY': 'Umiddelbar handling påkrevd!',
+    'KRITISK': 'KRITISK: Umiddelbar isolasjon og handling påkrevd!',
+    'UKJENT': 'Kunne ikke bestemme risiko - manuell vurdering nødvendig',
+    'FEIL': 'Analyse feilet - Kunne ikke hente rapport. Status: 500'
+}
+
+TECHNIQUES = {
+    'download': ['T1105', 'T1129'],
+    'phishing': ['T1566', 'T1204.001'],
+    'HØY': ['T1190', 'T1133'],
+    'MEDIUM': ['T1071.001', 'T1102'],
+    'capabilities': ['T1587', 'T1588'],
+    'crypto': ['T1496', 'T1071.001']
+}
+TACTICS = {
+    'T1105': ['command-and-control'], 'T1129': ['execution'], 'T1566': ['initial-access'],
+    'T1204.001': ['execution'], 'T1190': ['initial-access'], 'T1133': ['persistence', 'initial-access'],
+    'T1071.001': ['command-and-control'], 'T1102': ['command-and-control'],
+    'T1587': ['resource-development'], 'T1588': ['resource-development'], 'T1496': ['impact']
+}
+
+BENIGN_HOSTS = ['vg.no', 'nrk.no', 'example.com', 'wikipedia.org', 'github.com', 'intranet.local',
+                'microsoft.com', 'office.com', 'dropbox.com', 'docs.google.com']
+MALICIOUS_HOSTS = ['login-paypal-secure.xyz', 'signin-microsoft.top', 'crypto-miner.ru', 'evil-kit.co.uk',
+                   'update-flash.info', 'bank-verify.click', '185.23.44.10', 'secure-dnb-login.com']
+PATH_WORDS = ['index', 'account', 'verify', 'download', 'update', 'docs', 'news', 'login', 'signin',
+              'setup.exe', 'invoice.pdf', 'wp-admin', 'crypto', 'miner.js', 'phish']
+
+
+def pick_category(rng):
+    roll = rng.random()
+    cumulative = 0.0
+    for category, share in RISK_DISTRIBUTION:
+        cumulative += share
+        if roll < cumulative:
+            return category
+    return 'LAV'
+
+
+def synthetic_url(rng, malicious):
+    host = rng.choice(MALICIOUS_HOSTS if malicious else BENIGN_HOSTS)
+    if rng.random() < 0.3:
+        host = f"{rng.choice(['www', 'cdn', 'mail', 'portal'])}.{host}"
+    path = '/'.join(rng.choice(PATH_WORDS) for _ in range(rng.randint(1, 4)))
+    token = '%08x' % rng.getrandbits(32)
+    return f"http://{host}/{path}?id={token}"
+
+
+def synthetic_mitre(url, category, positives):
+    """Etterligner MitreAttackAnalyzer._identify_techniques for en syntetisk rad"""
+    techniques = []
+    lowered = url.lower()
+    if any(p in lowered for p in ['download', 'exe', 'bin', 'dll']):
+        techniques += TECHNIQUES['download']
+    if any(p in lowered for p in ['phish', 'login', 'signin']):
+        techniques += TECHNIQUES['phishing']
+    if category in ('HØY', 'MEDIUM'):
+        techniques += TECHNIQUES[category]
+    if positives > 10:
+        techniques += TECHNIQUES['capabilities']
+    if 'crypto' in lowered or 'miner' in lowered:
+        techniques += TECHNIQUES['crypto']
+    techniques = sorted(set(techniques))
+    tactics = sorted({t for tech in techniques for t in TACTICS.get(tech, [])})
+    risk_score = min(100, 20 + 10 * len(techniques)) if techniques else 0
+    return {'techniques': techniques, 'tactics': tactics, 'risk_score': risk_score}
+
+
+def synthetic_analysis(rng, timestamp):
+    """Én analyse på samme form som Analysis.to_dict()"""
+    category = pick_category(rng)
+    malicious = category in ('HØY', 'KRITISK') or (category == 'MEDIUM' and rng.random() < 0.5)
+    url = synthetic_url(rng, malicious)
+    return dict(synthetic_verdict(rng, url, category), url=url, timestamp=timestamp)
+
+
+def synthetic_verdict(rng, url, category):
+    """Verdiktfeltene for en URL i en gitt kategori"""
+    if category in POSITIVES_RANGE:
+        positives = rng.randint(*POSITIVES_RANGE[category])
+        risk_score = f"{positives}/90"
+    else:
+        positives = 0
+        risk_score = 'N/A' if category == 'UKJENT' else 'ukjent'
+
+    return {
+        'risk_category': category,
+        'risk_score': risk_score,
+        'action_required': ACTIONS[category],
+        'mitre_analysis': synthetic_mitre(url, category, positives)
+    }
+
+
+def synthetic_analyses(count, seed=42, days=365 * 3, end=None):
+    """Genererer `count` analyser med tidsstempler spredt over `days` dager"""
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    span = days * 24 * 3600
+    for _ in range(count):
+        timestamp = end - timedelta(seconds=rng.random() * span)
+        yield synthetic_analysis(rng, timestamp)
+
+
+def synthetic_stix_bundle(technique_count=700, seed=42):
+    """STIX-bundle med omtrent samme form og størrelse som enterprise-attack.json"""
+    rng = random.Random(seed)
+    phases = ['initial-access', 'execution', 'persistence', 'privilege-escalation', 'defense-evasion',
+              'credential-access', 'discovery', 'lateral-movement', 'collection', 'command-and-control',
+              'exfiltration', 'impact']
+    platforms = ['Windows', 'macOS', 'Linux', 'Network', 'Containers', 'IaaS', 'SaaS', 'Office 365']
+    words = ('adversaries may abuse legitimate services protocols credentials tokens execution '
+             'persistence network traffic detection monitor process command line').split()
+
+    objects = []
+    for i in range(technique_count):
+        base = 1000 + i // 3
+        technique_id = f"T{base}" if i % 3 == 0 else f"T{base}.{i % 3:03d}"
+        objects.append({
+            'type': 'attack-pattern',
+            'id': f'attack-pattern--{i:08d}',
+            'name': ' '.join(rng.choice(words).title() for _ in range(3)),
+            'description': ' '.join(rng.choice(words) for _ in range(rng.randint(80, 400))),
+            'external_references': [{'source_name': 'mitre-attack', 'external_id': technique_id}],
+            'kill_chain_phases': [{'kill_chain_name': 'mitre-attack', 'phase_name': p}
+                                  for p in rng.sample(phases, rng.randint(1, 3))],
+            'x_mitre_platforms': rng.sample(platforms, rng.randint(1, 6)),
+            'x_mitre_detection': ' '.join(rng.choice(words) for _ in range(rng.randint(0, 60))),
+            'x_mitre_data_sources': rng.sample(words, rng.randint(0, 4))
+        })
+        # Relasjoner og andre objekttyper utgjør størstedelen av en ekte bundle
+        for j in range(3):
+            objects.append({'type': 'relationship', 'id': f'relationship--{i:08d}-{j}',
+                            'relationship_type': 'uses', 'description': ' '.join(rng.sample(words, 10))})
+    return {'type': 'bundle', 'objects': objects}
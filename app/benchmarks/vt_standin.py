@@ -0,0 +1,278 @@
+"""
+Lokal erstatning for VirusTotal v2 sine url/report- og url/scan-endepunkter.
+
+Brukes til benchmarks og lasttesting uten å bruke ekte kvote:
+
+    python -m benchmarks.vt_standin --port 8765 --latency lognormal:-2.5,0.6 --rate-limit 4
+    VIRUSTOTAL_BASE_URL=http://127.0.0.1:8765/vtapi/v2/ python app.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+MALICIOUS_KEYWORDS = ('phish', 'login', 'signin', 'malware', 'exe', 'crypto', 'miner', 'evil')
+TOTAL_ENGINES = 90
+
+
+def parse_latency(spec):
+    """
+    Lager en latensfunksjon (sekunder) fra en spesifikasjon:
+    'fixed:0.05', 'uniform:0.02,0.2', 'lognormal:mu,sigma' eller 'exp:middel'
+    """
+    if not spec:
+        return lambda: 0.0
+
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v]
+
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(values[0], values[1])
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / values[0])
+    raise ValueError(f"Ukjent latensfordeling: {spec}")
+
+
+class StandInState:
+    """Delt tilstand for serveren: kvoter, ventende skann og tellere"""
+
+    def __init__(self, latency='fixed:0.0', rate_limit=4, window_seconds=60.0,
+                 unknown_rate=0.1, scan_delay=0.0, error_rate=0.0, seed=None, max_resources=4):
+        self.latency = parse_latency(latency)
+        self.rate_limit = rate_limit
+        self.window_seconds = window_seconds
+        self.unknown_rate = unknown_rate
+        self.scan_delay = scan_delay
+        self.error_rate = error_rate
+        # Maks antall linjeskilte ressurser per url/report-kall (4 på offentlige nøkler)
+        self.max_resources = max_resources
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.requests_by_key = defaultdict(deque)
+        self.pending_scans = {}
+        self.scanned = set()
+        self.counters = defaultdict(int)
+
+    def _verdict(self, url):
+        """Deterministisk verdikt basert på URL-en, slik at kjøringer kan sammenlignes"""
+        digest = int(hashlib.sha256(url.encode('utf-8')).hexdigest(), 16)
+        if any(keyword in url.lower() for keyword in MALICIOUS_KEYWORDS):
+            positives = 10 + digest % 40
+        else:
+            positives = digest % 4
+        return positives
+
+    def _is_unknown(self, url):
+        digest = int(hashlib.md5(url.encode('utf-8')).hexdigest(), 16)
+        return (digest % 1000) / 1000 < self.unknown_rate
+
+    def consume_quota(self, api_key):
+        """Registrerer et kall, False hvis nøkkelen har nådd grensen (204)"""
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            window = self.requests_by_key[api_key]
+            while window and now - window[0] >= self.window_seconds:
+                window.popleft()
+            if len(window) >= self.rate_limit:
+                self.counters['rate_limited'] += 1
+                return False
+            window.append(now)
+            return True
+
+    def report(self, url):
+        with self.lock:
+            self.counters['report'] += 1
+            pending_since = self.pending_scans.get(url)
+            if pending_since is not None:
+                if time.monotonic() - pending_since < self.scan_delay:
+                    self.counters['pending'] += 1
+                    return {'response_code': -2, 'resource': url,
+                            'verbose_msg': 'Scan request successfully queued, come back later for the report'}
+                del self.pending_scans[url]
+                self.scanned.add(url)
+            known = url in self.scanned or not self._is_unknown(url)
+
+        if not known:
+            return {'response_code': 0, 'resource': url,
+                    'verbose_msg': 'The requested resource is not among the finished, queued or pending scans'}
+
+        positives = self._verdict(url)
+        scan_id = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return {
+            'response_code': 1,
+            'resource': url,
+            'url': url,
+            'scan_id': scan_id,
+            'scan_date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'positives': positives,
+            'total': TOTAL_ENGINES,
+            'permalink': f'https://www.virustotal.com/gui/url/{scan_id}/detection'
+        }
+
+    def scan(self, url):
+        with self.lock:
+            self.counters['scan'] += 1
+            if url not in self.scanned:
+                self.pending_scans.setdefault(url, time.monotonic())
+        return {'response_code': 1, 'resource': url, 'url': url,
+                'verbose_msg': 'Scan request successfully queued, come back later for the report'}
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        # 'report' teller ressurser; et kall med flere ressurser teller én gang mot kvoten
+        stats['quota_requests'] = stats.get('report_requests', 0) + stats.get('scan', 0)
+        return stats
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server_version = 'VTStandIn/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _handle(self, endpoint, params):
+        state = self.server.state
+        time.sleep(max(0.0, state.latency()))
+
+        if endpoint == '_stats':
+            return self._send_json(200, state.stats())
+
+        if endpoint not in ('url/report', 'url/scan'):
+            return self._send_json(404, {'error': 'not found'})
+
+        api_key = params.get('apikey', [''])[0]
+        if not api_key:
+            return self._send_json(403)
+
+        if state.random.random() < state.error_rate:
+            with state.lock:
+                state.counters['errors'] += 1
+            return self._send_json(500, {'error': 'simulated failure'})
+
+        if not state.consume_quota(api_key):
+            return self._send_json(204)
+
+        if endpoint == 'url/report':
+            resources = [r.strip() for r in params.get('resource', [''])[0].split('\n') if r.strip()]
+            if len(resources) > state.max_resources:
+                return self._send_json(400, {'error': f'for mange ressurser (maks {state.max_resources})'})
+            with state.lock:
+                state.counters['report_requests'] += 1
+            if len(resources) > 1:
+                return self._send_json(200, [state.report(resource) for resource in resources])
+            return self._send_json(200, state.report(resources[0] if resources else ''))
+        return self._send_json(200, state.scan(params.get('url', [''])[0]))
+
+    def _endpoint(self):
+        path = urlparse(self.path).path
+        prefix = '/vtapi/v2/'
+        return path[len(prefix):] if path.startswith(prefix) else path.strip('/')
+
+    def do_GET(self):
+        self._handle(self._endpoint(), parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        params = parse_qs(urlparse(self.path).query)
+        params.update(parse_qs(body))
+        self._handle(self._endpoint(), params)
+
+
+class VirusTotalStandIn:
+    """Starter stand-in serveren i en bakgrunnstråd"""
+
+    def __init__(self, host='127.0.0.1', port=0, **state_options):
+        self.state = StandInState(**state_options)
+        self.server = ThreadingHTTPServer((host, port), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.state = self.state
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/vtapi/v2/'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_standin_arguments(parser):
+    """Felles kommandolinjevalg for stand-in serveren"""
+    parser.add_argument('--latency', default='lognormal:-3.0,0.5',
+                        help="Latensfordeling, f.eks. fixed:0.05, uniform:0.02,0.2, lognormal:mu,sigma, exp:0.1")
+    parser.add_argument('--rate-limit', type=int, default=4,
+                        help='Kall per vindu per API-nøkkel før 204 (0 = ubegrenset)')
+    parser.add_argument('--window', type=float, default=60.0, help='Lengde på kvotevinduet i sekunder')
+    parser.add_argument('--unknown-rate', type=float, default=0.1,
+                        help='Andel URLer uten eksisterende rapport (utløser scan)')
+    parser.add_argument('--scan-delay', type=float, default=0.0,
+                        help='Sekunder et skann forblir ventende (response_code -2)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Andel kall som gir HTTP 500')
+    parser.add_argument('--max-resources', type=int, default=4,
+                        help='Maks ressurser per url/report-kall (linjeskilt)')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+
+def standin_options(args):
+    return {
+        'latency': args.latency,
+        'rate_limit': args.rate_limit,
+        'window_seconds': args.window,
+        'unknown_rate': args.unknown_rate,
+        'scan_delay': args.scan_delay,
+        'error_rate': args.error_rate,
+        'seed': args.seed,
+        'max_resources': args.max_resources
+    }
+
+
+if __name__ == '__main__':
+    parser = add_standin_arguments(argparse.ArgumentParser(description='Lokal VirusTotal-erstatning'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    standin = VirusTotalStandIn(args.host, args.port, **standin_options(args))
+    print(f"VirusTotal stand-in lytter på {standin.base_url}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        standin.server.server_close()
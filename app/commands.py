@@ -0,0 +1,110 @@
+"""
+Vedlikeholdskommandoer (Flask-CLI). Kjøres fra app-mappen:
+
+    python commands.py migrate-snapshots
+    python commands.py rebuild indicators clusters
+"""
+from datetime import datetime
+import os
+import sqlite3
+
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import (db, drop_legacy_verdict_columns, legacy_verdict_columns, migrate_analysis_snapshots,
+                    rebuild_indicator_index, rebuild_url_clusters, verify_legacy_verdicts)
+from retention import AnalysisArchive
+
+# Avledede tabeller som kan bygges på nytt fra analysene og arkivet
+REBUILDS = {
+    'indicators': rebuild_indicator_index,
+    'clusters': rebuild_url_clusters
+}
+
+
+def backup_database(destination=None):
+    """
+    Kopierer SQLite-databasen med backup-APIet (konsistent også mens andre prosesser
+    skriver). Returnerer stien til kopien.
+    """
+    if db.engine.dialect.name != 'sqlite' or not db.engine.url.database:
+        raise click.ClickException('Backup støttes bare for SQLite-filer - ta backup selv og bruk --no-backup')
+    source = os.path.abspath(db.engine.url.database)
+    destination = destination or f"{source}.{datetime.now().strftime('%Y%m%d_%H%M%S')}.bak"
+    raw = db.engine.raw_connection()
+    try:
+        target = sqlite3.connect(destination)
+        try:
+            raw.connection.backup(target)
+        finally:
+            target.close()
+    finally:
+        raw.close()
+    return destination
+
+
+@click.command('migrate-snapshots')
+@click.option('--backup', 'backup_path', help='Fil backupen skrives til (standard: <database>.<tid>.bak)')
+@click.option('--no-backup', is_flag=True, help='Ikke ta backup (bare når backup er tatt på annen måte)')
+@click.option('--keep-columns', is_flag=True, help='Koble til snapshots og verifiser, men behold de gamle kolonnene')
+@with_appcontext
+def migrate_snapshots_command(backup_path, no_backup, keep_columns):
+    """
+    Flytter verdiktene i analyser fra før snapshots til AnalysisSnapshot. Tar backup
+    først, og de gamle kolonnene fjernes bare når alle snapshots stemmer med dem.
+    """
+    legacy = legacy_verdict_columns()
+    if not legacy:
+        click.echo('Ingen gamle verdiktkolonner - databasen er allerede migrert')
+        return
+    if not no_backup:
+        click.echo(f'Backup: {backup_database(backup_path)}')
+
+    migrated = migrate_analysis_snapshots()
+    click.echo(f'Koblet {migrated} analyser til snapshots')
+    report = verify_legacy_verdicts()
+    click.echo(f"Kontrollert {report['checked']} analyser mot kolonnene {', '.join(legacy)}")
+    if report['permalinks_only_in_legacy']:
+        click.echo(f"{report['permalinks_only_in_legacy']} senere permalenker for uendrede verdikter "
+                   f"finnes bare i de gamle kolonnene og backupen")
+    if report['unmigrated'] or report['mismatches']:
+        raise click.ClickException(
+            f"{report['unmigrated']} analyser uten snapshot og {report['mismatches']} avvik "
+            f"(f.eks. ID {', '.join(map(str, report['mismatch_ids'])) or '-'}) - de gamle kolonnene er beholdt"
+        )
+    if keep_columns:
+        click.echo('Alle snapshots stemmer - de gamle kolonnene er beholdt (--keep-columns)')
+        return
+    dropped = drop_legacy_verdict_columns()
+    click.echo(f"Alle snapshots stemmer - fjernet {', '.join(dropped)}. Kjør VACUUM for å frigjøre plass")
+
+
+@click.command('rebuild')
+@click.argument('targets', nargs=-1, required=True, type=click.Choice(list(REBUILDS)))
+@with_appcontext
+def rebuild_command(targets):
+    """
+    Bygger avledede tabeller på nytt fra alle lagrede og arkiverte analyser, f.eks.
+    første gang etter en oppgradering. Kjøres utenfor arbeidsprosessene, så oppstarten
+    ikke venter på en full gjennomgang av tabellen.
+    """
+    archive = AnalysisArchive(current_app.config['ARCHIVE_DIR'])
+    for target in targets:
+        started = time.perf_counter()
+        count = REBUILDS[target](archive.iter_records())
+        click.echo(f'Bygde {target} på nytt ({count}) på {time.perf_counter() - started:.1f} s')
+
+
+def register_commands(app):
+    app.cli.add_command(migrate_snapshots_command)
+    app.cli.add_command(rebuild_command)
+
+
+if __name__ == '__main__':
+    from flask.cli import FlaskGroup
+    from app import create_app
+
+    FlaskGroup(create_app=lambda: create_app(), add_default_commands=False)()
@@ -1,18 +1,112 @@
 from datetime import datetime
+from itertools import chain
+import hashlib
+import json
+from types import SimpleNamespace
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.orm import object_session
 from sqlalchemy.dialects.sqlite import JSON
+from analyzers.domain_reputation import registered_domain, empty_aggregate, accumulate
+from analyzers.indicators import (POSTING_BLOCK_SIZE, decode_postings, encode_postings, encode_varint,
+                                  indicator_keys, split_blocks)
+from analyzers.url_similarity import band_keys, best_cluster, pack_signature, url_signature
 
 db = SQLAlchemy()
 
+# Feltene som utgjør et verdikt; like verdikter for samme URL lagres én gang i AnalysisSnapshot
+VERDICT_FIELDS = ('risk_category', 'risk_score', 'action_required', 'mitre_analysis', 'source')
+# Feltene som flyttet fra Analysis til AnalysisSnapshot (risk_category ligger begge steder)
+SNAPSHOT_FIELDS = ('risk_score', 'action_required', 'mitre_analysis', 'source', 'permalink')
+# Funn i et analyseresultat som lagres per observasjon og indekseres (se analyzers/indicators.py);
+# historic_ips kommer fra passiv DNS i berikelsen
+INDICATOR_FIELDS = ('ip_addresses', 'historic_ips', 'downloaded_files')
+
+def verdict_hash(url, content):
+    """
+    Innholdshash for et verdikt om en URL. URLen er med fordi permalenken gjelder
+    én URL; permalenken selv er ikke med, siden VirusTotal gir en ny lenke for hver
+    skanning selv om verdiktet er likt.
+    """
+    canonical = json.dumps([url] + [content.get(field) for field in VERDICT_FIELDS],
+                           sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+class AnalysisSnapshot(db.Model):
+    """Unikt verdikt for en URL, lagret én gang; hver analyse (observasjon) peker på sitt snapshot"""
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(40), nullable=False, unique=True)
+    risk_category = db.Column(db.String(50))
+    risk_score = db.Column(db.String(50))
+    action_required = db.Column(db.Text)
+    mitre_analysis = db.Column(JSON)
+    # Hvor verdiktet kommer fra: 'virustotal', 'domain_reputation', ...
+    source = db.Column(db.String(50))
+    # Lenken fra første observasjon med dette verdiktet
+    permalink = db.Column(db.String(500))
+    # Kategoriseringspolicyen kategori og tiltak er beregnet etter (se analyzers/categorization.py)
+    policy_version = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'risk_category': self.risk_category,
+            'risk_score': self.risk_score,
+            'action_required': self.action_required,
+            'mitre_analysis': self.mitre_analysis,
+            'source': self.source,
+            'permalink': self.permalink,
+            'policy_version': self.policy_version
+        }
+
+def _snapshot_field(name):
+    """
+    Leses fra snapshotet; før lagring fra verdiene analysen ble opprettet med. Et
+    lagret verdikt endres ikke - en ny vurdering er en ny observasjon (ny Analysis).
+    """
+    def get(self):
+        pending = getattr(self, '_pending_verdict', None)
+        if pending is not None and name in pending:
+            return pending[name]
+        return getattr(self.snapshot, name) if self.snapshot is not None else None
+
+    def set(self, value):
+        if inspect(self).has_identity:
+            raise AttributeError(f"{name} er en del av et lagret verdikt (AnalysisSnapshot) og kan ikke endres - "
+                                 f"lagre en ny Analysis for den nye vurderingen")
+        if getattr(self, '_pending_verdict', None) is None:
+            self._pending_verdict = {}
+        self._pending_verdict[name] = value
+    return property(get, set)
+
 class Analysis(db.Model):
+    """
+    Én observasjon av en URL: tidspunkt, kategori og hvilket verdikt (AnalysisSnapshot)
+    som ble funnet. Gjentatte oppslag med samme verdikt deler snapshot, så bare den
+    lille observasjonsraden skrives.
+    """
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String(500), nullable=False, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     risk_category = db.Column(db.String(50), index=True)
-    risk_score = db.Column(db.String(50))
-    action_required = db.Column(db.Text)
-    mitre_analysis = db.Column(JSON)
-    
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('analysis_snapshot.id'), index=True)
+    # True når verdiktet skiller seg fra forrige observasjon av samme URL (eller er den første)
+    changed = db.Column(db.Boolean, index=True)
+    # Klyngen av nesten like URLer (UrlCluster) analysen havnet i
+    cluster_id = db.Column(db.Integer, index=True)
+    # Kategoriseringspolicyen risk_category er beregnet etter; None for verdikter fra lister og omdømme
+    policy_version = db.Column(db.String(20), index=True)
+    # IP-adresser og nedlastede filer fra oppslaget og berikelsen (INDICATOR_FIELDS); endres fra gang til gang
+    indicators = db.Column(JSON)
+    snapshot = db.relationship(AnalysisSnapshot, lazy='joined')
+
+    risk_score = _snapshot_field('risk_score')
+    action_required = _snapshot_field('action_required')
+    mitre_analysis = _snapshot_field('mitre_analysis')
+    source = _snapshot_field('source')
+    permalink = _snapshot_field('permalink')
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -21,6 +115,966 @@ class Analysis(db.Model):
             'risk_category': self.risk_category,
             'risk_score': self.risk_score,
             'action_required': self.action_required,
-            'mitre_analysis': self.mitre_analysis
+            'mitre_analysis': self.mitre_analysis,
+            'source': self.source,
+            'permalink': self.permalink,
+            'cluster_id': self.cluster_id,
+            'snapshot_id': self.snapshot_id,
+            'changed': self.changed,
+            'policy_version': self.policy_version,
+            'indicators': self.indicators
+        }
+
+    @classmethod
+    def from_result(cls, url, result):
+        """Lagringsklar analyse fra et SOCAnalyzer.analyze_and_categorize-resultat"""
+        return cls(
+            url=url,
+            risk_category=result.get('risk_category'),
+            risk_score=result.get('risk_score'),
+            action_required=result.get('action_required'),
+            mitre_analysis=result.get('mitre_analysis'),
+            source=result.get('source', 'virustotal'),
+            permalink=result.get('permalink'),
+            policy_version=result.get('policy_version'),
+            indicators=result_indicators(result)
+        )
+
+def result_indicators(result):
+    """INDICATOR_FIELDS med innhold i et analyseresultat, None hvis ingen"""
+    indicators = {field: result[field] for field in INDICATOR_FIELDS if result.get(field)}
+    return indicators or None
+
+def _indicator_keys_for(url, indicators):
+    """Indeksnøklene for en observasjon: URLen og de lagrede IP-ene og filene"""
+    return indicator_keys(dict(indicators or {}, url=url))
+
+class VerdictChange(db.Model):
+    """Endret verdikt for en URL funnet ved planlagt re-skanning"""
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False, index=True)
+    previous_analysis_id = db.Column(db.Integer)
+    analysis_id = db.Column(db.Integer)
+    old_category = db.Column(db.String(50))
+    new_category = db.Column(db.String(50))
+    old_score = db.Column(db.String(50))
+    new_score = db.Column(db.String(50))
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'url': self.url,
+            'previous_analysis_id': self.previous_analysis_id,
+            'analysis_id': self.analysis_id,
+            'old_category': self.old_category,
+            'new_category': self.new_category,
+            'old_score': self.old_score,
+            'new_score': self.new_score,
+            'changed_at': self.changed_at.strftime("%Y-%m-%d %H:%M:%S") if self.changed_at else None
+        }
+
+class DomainReputation(db.Model):
+    """Aggregert omdømme per registrert domene (eTLD+1)"""
+    domain = db.Column(db.String(255), primary_key=True)
+    total_analyses = db.Column(db.Integer, default=0)
+    positives_sum = db.Column(db.Integer, default=0)
+    total_scans_sum = db.Column(db.Integer, default=0)
+    max_positives = db.Column(db.Integer, default=0)
+    category_counts = db.Column(JSON)
+    technique_counts = db.Column(JSON)
+    first_seen = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'domain': self.domain,
+            'total_analyses': self.total_analyses or 0,
+            'positives_sum': self.positives_sum or 0,
+            'total_scans_sum': self.total_scans_sum or 0,
+            'max_positives': self.max_positives or 0,
+            'category_counts': self.category_counts or {},
+            'technique_counts': self.technique_counts or {},
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen
+        }
+
+class DeferredURL(db.Model):
+    """URL med lav forhåndsscore som venter på analyse i lavtrafikkvinduet"""
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+    lexical_score = db.Column(db.Integer, index=True)
+    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'url': self.url,
+            'lexical_score': self.lexical_score,
+            'requested_at': self.requested_at.strftime("%Y-%m-%d %H:%M:%S") if self.requested_at else None
+        }
+
+class PendingAnalysis(db.Model):
+    """Analyse som ikke ble ferdig innen /analyze-fristen og fullføres i bakgrunnen"""
+    handle = db.Column(db.String(32), primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+    # 'pending', 'completed' eller 'error'
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    analysis_id = db.Column(db.Integer)
+    # Fullt analyseresultat slik /analyze ville returnert det
+    result = db.Column(JSON)
+    error_message = db.Column(db.Text)
+    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, index=True)
+
+    def to_dict(self):
+        return {
+            'handle': self.handle,
+            'url': self.url,
+            'status': self.status,
+            'analysis_id': self.analysis_id,
+            'error_message': self.error_message,
+            'requested_at': self.requested_at.strftime("%Y-%m-%d %H:%M:%S") if self.requested_at else None,
+            'completed_at': self.completed_at.strftime("%Y-%m-%d %H:%M:%S") if self.completed_at else None
+        }
+
+class RecategorizationRun(db.Model):
+    """Omkategorisering startet fra /policies/recategorize, kjøres i bakgrunnen (se recategorize.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    policy_version = db.Column(db.String(20), nullable=False)
+    # Om domeneomdømme, indikatorindeks og klyngetellinger bygges på nytt etterpå
+    rebuild = db.Column(db.Boolean, default=True)
+    # 'running', 'completed' eller 'error'
+    status = db.Column(db.String(20), nullable=False, default='running', index=True)
+    # Statistikken fra recategorize_analyses (og ombyggingen)
+    result = db.Column(JSON)
+    error_message = db.Column(db.Text)
+    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'policy_version': self.policy_version,
+            'rebuild': self.rebuild,
+            'status': self.status,
+            'result': self.result,
+            'error_message': self.error_message,
+            'requested_at': self.requested_at.strftime("%Y-%m-%d %H:%M:%S") if self.requested_at else None,
+            'completed_at': self.completed_at.strftime("%Y-%m-%d %H:%M:%S") if self.completed_at else None
+        }
+
+class Indicator(db.Model):
+    """Indikator (URL, vert, domene, IP, fil) med oppsummerte verdikter fra alle analyser"""
+    # 'type:verdi', f.eks. 'domain:example.com'
+    key = db.Column(db.String(600), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    category_counts = db.Column(JSON)
+    last_category = db.Column(db.String(50))
+    last_analysis_id = db.Column(db.Integer)
+    first_seen = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+
+    def to_dict(self):
+        kind, _, value = self.key.partition(':')
+        return {
+            'indicator': self.key,
+            'type': kind,
+            'value': value,
+            'count': self.count or 0,
+            'verdicts': self.category_counts or {},
+            'last_category': self.last_category,
+            'first_seen': self.first_seen.strftime("%Y-%m-%d %H:%M:%S") if self.first_seen else None,
+            'last_seen': self.last_seen.strftime("%Y-%m-%d %H:%M:%S") if self.last_seen else None
+        }
+
+class IndicatorPostingBlock(db.Model):
+    """
+    Invertert indeks: analyse-IDene for en indikator, varint-kodede differanser
+    i blokker på inntil POSTING_BLOCK_SIZE IDer. Nye IDer legges til i siste blokk.
+    """
+    indicator = db.Column(db.String(600), primary_key=True)
+    block = db.Column(db.Integer, primary_key=True)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    postings = db.Column(db.LargeBinary, nullable=False)
+
+class UrlCluster(db.Model):
+    """Klynge av nesten like URLer (MinHash), f.eks. fra samme phishing-kit"""
+    id = db.Column(db.Integer, primary_key=True)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    # Verdikter fra egne VirusTotal-analyser i klyngen
+    category_counts = db.Column(JSON)
+    representative_url = db.Column(db.String(500))
+    # MinHash-signaturen til første URL; nye URLer sammenlignes mot den
+    signature = db.Column(db.LargeBinary, nullable=False)
+    first_seen = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'size': self.size or 0,
+            'category_counts': self.category_counts or {},
+            'representative_url': self.representative_url,
+            'first_seen': self.first_seen.strftime("%Y-%m-%d %H:%M:%S") if self.first_seen else None,
+            'last_seen': self.last_seen.strftime("%Y-%m-%d %H:%M:%S") if self.last_seen else None
+        }
+
+class UrlLshBucket(db.Model):
+    """LSH-bøtte (bånd av en MinHash-signatur) -> klyngen som først havnet i den"""
+    band_key = db.Column(db.String(40), primary_key=True)
+    cluster_id = db.Column(db.Integer, nullable=False, index=True)
+
+class ArchivedClusterAssignment(db.Model):
+    """
+    Klyngen en arkivert analyse havnet i da klyngene sist ble bygget på nytt.
+    Arkivfilene endres aldri, så klynge-IDen der blir utdatert når klyngene får nye
+    IDer; AnalysisArchive bruker denne i stedet.
+    """
+    analysis_id = db.Column(db.Integer, primary_key=True)
+    cluster_id = db.Column(db.Integer)
+
+class AnalysisDailyAggregate(db.Model):
+    """Dagsaggregater for arkiverte analyser, slik at statistikk ikke trenger arkivfilene"""
+    day = db.Column(db.Date, primary_key=True)
+    # '' for analyser uten kategori (primærnøkkel kan ikke være NULL)
+    risk_category = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    mitre_score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    mitre_score_count = db.Column(db.Integer, nullable=False, default=0)
+    technique_counts = db.Column(JSON)
+
+    def to_dict(self):
+        return {
+            'day': self.day,
+            'risk_category': self.risk_category or None,
+            'count': self.count or 0,
+            'mitre_score_sum': self.mitre_score_sum or 0.0,
+            'mitre_score_count': self.mitre_score_count or 0,
+            'technique_counts': self.technique_counts or {}
+        }
+
+class ArchivePartition(db.Model):
+    """
+    Uforanderlig, komprimert arkivfil med analyser fra én måned. Filen regnes bare
+    som en del av arkivet når raden er committet sammen med slettingen fra Analysis.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False, unique=True)
+    first_id = db.Column(db.Integer)
+    last_id = db.Column(db.Integer)
+    row_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'month': self.month,
+            'filename': self.filename,
+            'row_count': self.row_count,
+            'created_at': self.created_at.strftime("%Y-%m-%d %H:%M:%S") if self.created_at else None
         }
-  
\ No newline at end of file
+
+class DataGeneration(db.Model):
+    """Teller som økes i hver transaksjon som endrer data; nøkkel for svarcachen"""
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+def _bump_data_generation(connection):
+    table = DataGeneration.__table__
+    updated = connection.execute(
+        table.update().where(table.c.id == 1).values(value=table.c.value + 1)
+    ).rowcount
+    if not updated:
+        connection.execute(table.insert().values(id=1, value=1))
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_on_flush(session, flush_context):
+    """Samme transaksjon som endringen, så generasjonen og dataen committes sammen"""
+    if session.new or session.dirty or session.deleted:
+        _bump_data_generation(session.connection())
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _bump_on_bulk_change(orm_execute_state):
+    """query.update()/delete() går utenom flush og må telles for seg"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        _bump_data_generation(orm_execute_state.session.connection())
+
+def data_generation():
+    """Gjeldende datagenerasjon, lik for alle arbeidsprosesser som deler databasen"""
+    value = db.session.query(DataGeneration.value).filter(DataGeneration.id == 1).scalar()
+    return value or 0
+
+def _counts_toward_reputation(analysis):
+    """Kun egne VirusTotal-verdikter teller, ellers forsterker omdømmet seg selv"""
+    return (analysis.source or 'virustotal') == 'virustotal'
+
+def _snapshot_content(values):
+    content = {field: values.get(field) for field in ('risk_category', 'policy_version') + SNAPSHOT_FIELDS}
+    content['source'] = content['source'] or 'virustotal'
+    return content
+
+def _snapshot_id(connection, url, content, known=None):
+    """ID for snapshotet med dette verdiktet; opprettes hvis det ikke finnes (known: hash -> ID)"""
+    digest = verdict_hash(url, content)
+    if known is not None and digest in known:
+        return known[digest]
+    table = AnalysisSnapshot.__table__
+    snapshot_id = connection.execute(
+        select(table.c.id).where(table.c.content_hash == digest)
+    ).scalar()
+    if snapshot_id is None:
+        # OR IGNORE: en annen arbeidsprosess kan ha lagret samme verdikt i mellomtiden
+        connection.execute(table.insert().prefix_with('OR IGNORE', dialect='sqlite').values(
+            content_hash=digest, created_at=datetime.utcnow(), **content
+        ))
+        snapshot_id = connection.execute(
+            select(table.c.id).where(table.c.content_hash == digest)
+        ).scalar()
+    if known is not None:
+        known[digest] = snapshot_id
+    return snapshot_id
+
+@event.listens_for(db.session, 'before_flush')
+def _reset_flush_snapshots(session, flush_context, instances):
+    # URL -> snapshot for observasjonene i denne flushen (se _store_snapshot)
+    session.info['flush_snapshots'] = {}
+
+@event.listens_for(Analysis, 'before_insert')
+def _store_snapshot(mapper, connection, target):
+    """
+    Kobler observasjonen til snapshotet for verdiktet og merker om verdiktet er endret.
+    before_insert kjører for alle radene i en flush før noen settes inn, så forrige
+    observasjon av en URL i samme flush (f.eks. /analyze med samme URL flere ganger)
+    hentes fra flushen og ikke fra databasen.
+    """
+    values = dict(getattr(target, '_pending_verdict', None) or {}, risk_category=target.risk_category,
+                  policy_version=target.policy_version)
+    target.snapshot_id = _snapshot_id(connection, target.url, _snapshot_content(values))
+    flushed = object_session(target).info.setdefault('flush_snapshots', {})
+    if target.url in flushed:
+        previous = flushed[target.url]
+    else:
+        table = Analysis.__table__
+        previous = connection.execute(
+            select(table.c.snapshot_id).where(table.c.url == target.url).order_by(table.c.id.desc()).limit(1)
+        ).scalar()
+    target.changed = previous != target.snapshot_id
+    flushed[target.url] = target.snapshot_id
+
+@event.listens_for(Analysis, 'after_insert')
+def _update_domain_reputation(mapper, connection, target):
+    """Oppdaterer domeneomdømmet inkrementelt for hver ny analyse"""
+    if not _counts_toward_reputation(target):
+        return
+
+    domain = registered_domain(target.url)
+    if not domain:
+        return
+
+    table = DomainReputation.__table__
+    row = connection.execute(
+        table.select().where(table.c.domain == domain)
+    ).mappings().first()
+    aggregate = dict(row) if row else empty_aggregate(domain)
+
+    techniques = (target.mitre_analysis or {}).get('techniques', [])
+    if not accumulate(aggregate, target.risk_category, target.risk_score,
+                      techniques, target.timestamp or datetime.utcnow()):
+        return
+
+    if row:
+        connection.execute(
+            table.update().where(table.c.domain == domain).values(**aggregate)
+        )
+    else:
+        connection.execute(table.insert().values(**aggregate))
+
+@event.listens_for(Analysis, 'before_insert')
+def _assign_url_cluster(mapper, connection, target):
+    """Plasserer analysen i klyngen av nesten like URLer, eller starter en ny klynge"""
+    signature = url_signature(target.url)
+    if signature is None:
+        return
+    keys = band_keys(signature)
+    clusters = UrlCluster.__table__
+    buckets = UrlLshBucket.__table__
+
+    bucket_rows = connection.execute(
+        buckets.select().where(buckets.c.band_key.in_(keys))
+    ).all()
+    candidate_ids = {row.cluster_id for row in bucket_rows}
+    candidates = connection.execute(
+        clusters.select().where(clusters.c.id.in_(candidate_ids))
+    ).mappings().all() if candidate_ids else []
+    match = best_cluster(signature, ((row['id'], row['signature']) for row in candidates))
+
+    seen = target.timestamp or datetime.utcnow()
+    category = target.risk_category or 'UKJENT'
+    counts = _counts_toward_reputation(target)
+    if match:
+        row = next(row for row in candidates if row['id'] == match[0])
+        category_counts = dict(row['category_counts'] or {})
+        if counts:
+            category_counts[category] = category_counts.get(category, 0) + 1
+        connection.execute(clusters.update().where(clusters.c.id == row['id']).values(
+            size=row['size'] + 1, category_counts=category_counts,
+            last_seen=max(seen, row['last_seen'] or seen)
+        ))
+        cluster_id = row['id']
+    else:
+        cluster_id = connection.execute(clusters.insert().values(
+            size=1, category_counts={category: 1} if counts else {}, representative_url=target.url,
+            signature=pack_signature(signature), first_seen=seen, last_seen=seen
+        )).inserted_primary_key[0]
+
+    existing = {row.band_key for row in bucket_rows}
+    missing = [{'band_key': key, 'cluster_id': cluster_id} for key in keys if key not in existing]
+    if missing:
+        connection.execute(buckets.insert().prefix_with('OR IGNORE', dialect='sqlite'), missing)
+    target.cluster_id = cluster_id
+
+def rebuild_url_clusters(archived_records=()):
+    """
+    Bygger URL-klyngene på nytt i ID-rekkefølge, som om analysene ble lagret én og én.
+    Arkiverte analyser (dict fra Analysis.to_dict) teller med i klyngene.
+    """
+    clusters, buckets, assignments = [], {}, []
+    archived = (
+        SimpleNamespace(id=record['id'], url=record['url'], risk_category=record['risk_category'],
+                        source=record.get('source'), archived=True, cluster_id=record.get('cluster_id'),
+                        timestamp=datetime.strptime(record['timestamp'], "%Y-%m-%d %H:%M:%S"))
+        for record in sorted(archived_records, key=lambda record: record['id'])
+    )
+    archived_moves = []
+    hot = Analysis.query.with_entities(
+        Analysis.id, Analysis.url, Analysis.risk_category, AnalysisSnapshot.source, Analysis.timestamp
+    ).outerjoin(AnalysisSnapshot, Analysis.snapshot_id == AnalysisSnapshot.id).order_by(Analysis.id)
+    for analysis in chain(archived, hot.yield_per(1000)):
+        signature = url_signature(analysis.url)
+        if signature is None:
+            continue
+        keys = band_keys(signature)
+        candidate_ids = {buckets[key] for key in keys if key in buckets}
+        match = best_cluster(signature, ((i, clusters[i - 1]['signature']) for i in candidate_ids))
+        if match:
+            cluster = clusters[match[0] - 1]
+        else:
+            cluster = {
+                'id': len(clusters) + 1, 'size': 0, 'category_counts': {}, 'representative_url': analysis.url,
+                'signature': pack_signature(signature), 'first_seen': analysis.timestamp,
+                'last_seen': analysis.timestamp
+            }
+            clusters.append(cluster)
+        cluster['size'] += 1
+        if _counts_toward_reputation(analysis):
+            category = analysis.risk_category or 'UKJENT'
+            cluster['category_counts'][category] = cluster['category_counts'].get(category, 0) + 1
+        cluster['last_seen'] = max(cluster['last_seen'], analysis.timestamp)
+        for key in keys:
+            buckets.setdefault(key, cluster['id'])
+        if not getattr(analysis, 'archived', False):
+            assignments.append({'id': analysis.id, 'cluster_id': cluster['id']})
+        elif analysis.cluster_id != cluster['id']:
+            archived_moves.append({'analysis_id': analysis.id, 'cluster_id': cluster['id']})
+
+    UrlLshBucket.query.delete()
+    UrlCluster.query.delete()
+    db.session.bulk_insert_mappings(UrlCluster, clusters)
+    db.session.bulk_insert_mappings(
+        UrlLshBucket, [{'band_key': key, 'cluster_id': cluster_id} for key, cluster_id in buckets.items()]
+    )
+    db.session.bulk_update_mappings(Analysis, assignments)
+    # archived_records har klyngen fra ArchivedClusterAssignment der den finnes, så bare
+    # arkiverte analyser som har byttet klynge skrives
+    if archived_moves:
+        db.session.execute(
+            ArchivedClusterAssignment.__table__.insert().prefix_with('OR REPLACE', dialect='sqlite'),
+            archived_moves
+        )
+    db.session.commit()
+    return len(clusters)
+
+def archived_cluster_ids(first_id, last_id):
+    """Analyse-ID -> klynge for arkiverte analyser med IDer i intervallet som har byttet klynge"""
+    return dict(db.session.query(ArchivedClusterAssignment.analysis_id, ArchivedClusterAssignment.cluster_id)
+                .filter(ArchivedClusterAssignment.analysis_id.between(first_id, last_id)))
+
+def recount_url_clusters(archived_records=()):
+    """
+    Teller verdiktene i hver klynge på nytt uten å klynge URLene om igjen, f.eks.
+    etter en omkategorisering der bare kategoriene er endret.
+    """
+    counts = {}
+    for record in archived_records:
+        if record.get('cluster_id') and (record.get('source') or 'virustotal') == 'virustotal':
+            cluster = counts.setdefault(record['cluster_id'], {})
+            category = record['risk_category'] or 'UKJENT'
+            cluster[category] = cluster.get(category, 0) + 1
+    hot = db.session.query(Analysis.cluster_id, Analysis.risk_category, db.func.count(Analysis.id)).outerjoin(
+        AnalysisSnapshot, Analysis.snapshot_id == AnalysisSnapshot.id
+    ).filter(
+        Analysis.cluster_id.isnot(None),
+        db.or_(AnalysisSnapshot.source.is_(None), AnalysisSnapshot.source == 'virustotal')
+    ).group_by(Analysis.cluster_id, Analysis.risk_category)
+    for cluster_id, category, count in hot:
+        cluster = counts.setdefault(cluster_id, {})
+        category = category or 'UKJENT'
+        cluster[category] = cluster.get(category, 0) + count
+    cluster_ids = [cluster_id for cluster_id, in db.session.query(UrlCluster.id)]
+    db.session.bulk_update_mappings(UrlCluster, [
+        {'id': cluster_id, 'category_counts': counts.get(cluster_id, {})} for cluster_id in cluster_ids
+    ])
+    db.session.commit()
+    return len(cluster_ids)
+
+def _snapshot_ids_for(connection, digests):
+    """hash -> snapshot-ID for de av hashene som finnes, 500 per spørring"""
+    table = AnalysisSnapshot.__table__
+    digests = list(digests)
+    ids = {}
+    for i in range(0, len(digests), 500):
+        ids.update(connection.execute(
+            select(table.c.content_hash, table.c.id).where(table.c.content_hash.in_(digests[i:i + 500]))
+        ).all())
+    return ids
+
+def _latest_snapshot_ids(connection, urls):
+    """URL -> snapshotet til siste observasjon av URLen, 500 URLer per spørring"""
+    table = Analysis.__table__
+    urls = list(urls)
+    latest = {}
+    for i in range(0, len(urls), 500):
+        newest = select(func.max(table.c.id)).where(table.c.url.in_(urls[i:i + 500])).group_by(table.c.url)
+        latest.update(connection.execute(
+            select(table.c.url, table.c.snapshot_id).where(table.c.id.in_(newest))
+        ).all())
+    return latest
+
+def bulk_insert_analyses(rows):
+    """
+    Masseinnsetting av analyser (dicts med Analysis.to_dict-feltene) med verdiktene
+    lagret som snapshots. Snapshots og forrige observasjon slås opp for hele
+    batchen samlet, ikke per rad. Som andre bulk-innsettinger går den utenom
+    hendelsene, så domeneomdømme, indikatorindeks og klynger må bygges på nytt etterpå.
+    """
+    connection = db.session.connection()
+    rows = list(rows)
+    contents = [_snapshot_content(row) for row in rows]
+    digests = [verdict_hash(row['url'], content) for row, content in zip(rows, contents)]
+    known = _snapshot_ids_for(connection, set(digests))
+    missing = {}
+    for digest, content in zip(digests, contents):
+        if digest not in known and digest not in missing:
+            missing[digest] = dict(content, content_hash=digest, created_at=datetime.utcnow())
+    if missing:
+        # OR IGNORE: en annen arbeidsprosess kan ha lagret samme verdikt i mellomtiden
+        connection.execute(
+            AnalysisSnapshot.__table__.insert().prefix_with('OR IGNORE', dialect='sqlite'), list(missing.values())
+        )
+        known.update(_snapshot_ids_for(connection, missing))
+
+    previous = _latest_snapshot_ids(connection, {row['url'] for row in rows})
+    mappings = []
+    for row, digest in zip(rows, digests):
+        url = row['url']
+        snapshot_id = known[digest]
+        mapping = {key: row[key] for key in ('id', 'url', 'timestamp', 'risk_category', 'cluster_id', 'policy_version',
+                                             'indicators')
+                   if key in row}
+        mapping.update(snapshot_id=snapshot_id, changed=previous.get(url) != snapshot_id)
+        previous[url] = snapshot_id
+        mappings.append(mapping)
+    db.session.bulk_insert_mappings(Analysis, mappings)
+    # bulk_insert_mappings går utenom flush-hendelsen, så svarcachen må ugyldiggjøres her
+    if mappings:
+        _bump_data_generation(connection)
+    return len(mappings)
+
+def legacy_verdict_columns():
+    """Verdiktkolonnene fra før snapshots som fortsatt finnes i analysis-tabellen"""
+    existing = {column['name'] for column in inspect(db.engine).get_columns('analysis')}
+    return [field for field in SNAPSHOT_FIELDS if field in existing]
+
+def unmigrated_analyses():
+    """Antall analyser lagret før snapshots som ennå ikke peker på et snapshot"""
+    if not legacy_verdict_columns():
+        return 0
+    return Analysis.query.filter(Analysis.snapshot_id.is_(None)).count()
+
+def migrate_analysis_snapshots(batch_size=5000):
+    """
+    Kobler analyser lagret før snapshots (verdiktkolonnene lå i selve raden) til et
+    AnalysisSnapshot med verdiktet fra de gamle kolonnene. Kolonnene røres ikke; de
+    fjernes først av drop_legacy_verdict_columns etter verify_legacy_verdicts.
+    """
+    legacy = legacy_verdict_columns()
+    if not legacy:
+        return 0
+    connection = db.session.connection()
+    known, previous, migrated = {}, {}, 0
+    while True:
+        rows = connection.execute(text(
+            f"SELECT id, url, risk_category, {', '.join(legacy)} FROM analysis "
+            f"WHERE snapshot_id IS NULL ORDER BY id LIMIT :limit"
+        ), {'limit': batch_size}).mappings().all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            values = dict(row)
+            if isinstance(values.get('mitre_analysis'), str):
+                values['mitre_analysis'] = json.loads(values['mitre_analysis'])
+            snapshot_id = _snapshot_id(connection, row['url'], _snapshot_content(values), known)
+            updates.append({
+                'id': row['id'], 'snapshot_id': snapshot_id,
+                'changed': previous.get(row['url']) != snapshot_id
+            })
+            previous[row['url']] = snapshot_id
+        connection.execute(text(
+            "UPDATE analysis SET snapshot_id = :snapshot_id, changed = :changed WHERE id = :id"
+        ), updates)
+        db.session.commit()
+        connection = db.session.connection()
+        migrated += len(rows)
+    return migrated
+
+def _legacy_value(field, value):
+    if field == 'mitre_analysis' and isinstance(value, str):
+        return json.loads(value)
+    if field == 'source':
+        return value or 'virustotal'
+    return value
+
+def verify_legacy_verdicts(batch_size=5000, sample=20):
+    """
+    Sammenligner verdiktet i de gamle kolonnene med snapshotet hver analyse peker på.
+    Permalenken regnes ikke som avvik: snapshotet har lenken fra første observasjon
+    av verdiktet, så senere lenker finnes bare i de gamle kolonnene (og backupen).
+    """
+    legacy = legacy_verdict_columns()
+    report = {'checked': 0, 'unmigrated': 0, 'mismatches': 0, 'mismatch_ids': [], 'permalinks_only_in_legacy': 0}
+    if not legacy:
+        return report
+    verdict = [field for field in legacy if field != 'permalink']
+    columns = ', '.join([f'a.{field} AS legacy_{field}' for field in legacy] +
+                        [f's.{field} AS snapshot_{field}' for field in legacy])
+    connection = db.session.connection()
+    after = 0
+    while True:
+        rows = connection.execute(text(
+            f"SELECT a.id, a.snapshot_id, {columns} FROM analysis a "
+            f"LEFT JOIN analysis_snapshot s ON s.id = a.snapshot_id "
+            f"WHERE a.id > :after ORDER BY a.id LIMIT :limit"
+        ), {'after': after, 'limit': batch_size}).mappings().all()
+        if not rows:
+            break
+        after = rows[-1]['id']
+        for row in rows:
+            if all(row[f'legacy_{field}'] is None for field in legacy):
+                continue
+            report['checked'] += 1
+            if row['snapshot_id'] is None:
+                report['unmigrated'] += 1
+                continue
+            if any(_legacy_value(field, row[f'legacy_{field}']) != _legacy_value(field, row[f'snapshot_{field}'])
+                   for field in verdict):
+                report['mismatches'] += 1
+                if len(report['mismatch_ids']) < sample:
+                    report['mismatch_ids'].append(row['id'])
+            elif 'permalink' in legacy and row['legacy_permalink'] and \
+                    row['legacy_permalink'] != row['snapshot_permalink']:
+                report['permalinks_only_in_legacy'] += 1
+    return report
+
+def drop_legacy_verdict_columns():
+    """
+    Fjerner de gamle verdiktkolonnene fra analysis (SQLite 3.35+; eldre versjoner
+    får kolonnene tømt i stedet). VACUUM etterpå gir plassen tilbake.
+    """
+    legacy = legacy_verdict_columns()
+    if not legacy:
+        return []
+    if db.engine.dialect.name != 'sqlite' or db.engine.dialect.dbapi.sqlite_version_info >= (3, 35):
+        for field in legacy:
+            db.session.execute(text(f'ALTER TABLE analysis DROP COLUMN {field}'))
+    else:
+        db.session.execute(text(f"UPDATE analysis SET {', '.join(f'{field} = NULL' for field in legacy)}"))
+    db.session.commit()
+    return legacy
+
+def prune_snapshots():
+    """Sletter snapshots ingen analyse peker på lenger (f.eks. etter arkivering)"""
+    used = db.session.query(Analysis.snapshot_id).filter(Analysis.snapshot_id.isnot(None))
+    return AnalysisSnapshot.query.filter(AnalysisSnapshot.id.notin_(used)).delete(synchronize_session=False)
+
+def analysis_timeline(url, limit=1000):
+    """
+    Verdiktene for en URL over tid: én periode per sammenhengende rekke observasjoner
+    med samme snapshot, nyeste først.
+    """
+    rows = Analysis.query.with_entities(Analysis.id, Analysis.timestamp, Analysis.snapshot_id) \
+        .filter(Analysis.url == url).order_by(Analysis.id.desc()).limit(limit).all()
+    snapshots = {
+        snapshot.id: snapshot.to_dict()
+        for snapshot in AnalysisSnapshot.query.filter(AnalysisSnapshot.id.in_({row.snapshot_id for row in rows}))
+    }
+    periods = []
+    for row in rows:
+        if periods and periods[-1]['snapshot_id'] == row.snapshot_id:
+            period = periods[-1]
+            period['first_seen'] = row.timestamp
+            period['first_analysis_id'] = row.id
+            period['observations'] += 1
+            continue
+        periods.append({
+            'snapshot_id': row.snapshot_id,
+            'verdict': snapshots.get(row.snapshot_id),
+            'first_seen': row.timestamp,
+            'last_seen': row.timestamp,
+            'first_analysis_id': row.id,
+            'last_analysis_id': row.id,
+            'observations': 1
+        })
+    for period in periods:
+        for field in ('first_seen', 'last_seen'):
+            period[field] = period[field].strftime("%Y-%m-%d %H:%M:%S") if period[field] else None
+    return periods
+
+def url_clusters_for(keys):
+    """Klynger som deler minst én LSH-bøtte med nøklene (for UrlClusterPolicy)"""
+    cluster_ids = db.session.query(UrlLshBucket.cluster_id).filter(UrlLshBucket.band_key.in_(keys))
+    return [
+        {'id': cluster.id, 'size': cluster.size, 'category_counts': cluster.category_counts,
+         'signature': cluster.signature}
+        for cluster in UrlCluster.query.filter(UrlCluster.id.in_(cluster_ids))
+    ]
+
+def url_cluster_sizes(cluster_ids):
+    """Klynge-ID -> antall URLer, for historikkvisningen"""
+    cluster_ids = {cluster_id for cluster_id in cluster_ids if cluster_id}
+    if not cluster_ids:
+        return {}
+    return dict(db.session.query(UrlCluster.id, UrlCluster.size).filter(UrlCluster.id.in_(cluster_ids)))
+
+@event.listens_for(Analysis, 'after_insert')
+def _index_indicators(mapper, connection, target):
+    """Legger analysen inn i indikatorindeksen i samme transaksjon"""
+    indicators = Indicator.__table__
+    blocks = IndicatorPostingBlock.__table__
+    seen = target.timestamp or datetime.utcnow()
+    category = target.risk_category or 'UKJENT'
+
+    for key in _indicator_keys_for(target.url, target.indicators):
+        row = connection.execute(
+            indicators.select().where(indicators.c.key == key)
+        ).mappings().first()
+        if row:
+            category_counts = dict(row['category_counts'] or {})
+            category_counts[category] = category_counts.get(category, 0) + 1
+            connection.execute(indicators.update().where(indicators.c.key == key).values(
+                count=row['count'] + 1, category_counts=category_counts, last_category=target.risk_category,
+                last_analysis_id=target.id, last_seen=max(seen, row['last_seen'] or seen)
+            ))
+        else:
+            connection.execute(indicators.insert().values(
+                key=key, count=1, category_counts={category: 1}, last_category=target.risk_category,
+                last_analysis_id=target.id, first_seen=seen, last_seen=seen
+            ))
+
+        block = connection.execute(
+            blocks.select().where(blocks.c.indicator == key).order_by(blocks.c.block.desc()).limit(1)
+        ).mappings().first()
+        # IDene må være stigende innen en blokk; ellers (og når blokken er full) startes en ny
+        if block and block['count'] < POSTING_BLOCK_SIZE and target.id > block['last_id']:
+            connection.execute(blocks.update().where(
+                (blocks.c.indicator == key) & (blocks.c.block == block['block'])
+            ).values(
+                last_id=target.id, count=block['count'] + 1,
+                postings=block['postings'] + encode_varint(target.id - block['last_id'])
+            ))
+        else:
+            connection.execute(blocks.insert().values(
+                indicator=key, block=block['block'] + 1 if block else 0, first_id=target.id,
+                last_id=target.id, count=1, postings=encode_postings([target.id])
+            ))
+
+def rebuild_indicator_index(archived_records=()):
+    """
+    Bygger indikatorindeksen fra bunnen av fra alle lagrede og arkiverte analyser
+    (archived_records er dict fra Analysis.to_dict).
+    """
+    entries = {}
+    query = Analysis.query.with_entities(
+        Analysis.id, Analysis.url, Analysis.risk_category, Analysis.timestamp, Analysis.indicators
+    )
+    archived = (
+        SimpleNamespace(id=record['id'], url=record['url'], risk_category=record['risk_category'],
+                        timestamp=datetime.strptime(record['timestamp'], "%Y-%m-%d %H:%M:%S"),
+                        indicators=record.get('indicators'))
+        for record in archived_records
+    )
+    for analysis in chain(query.yield_per(1000), archived):
+        category = analysis.risk_category or 'UKJENT'
+        for key in _indicator_keys_for(analysis.url, analysis.indicators):
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = {'ids': [], 'category_counts': {}, 'last': None,
+                                        'first_seen': analysis.timestamp}
+            entry['ids'].append(analysis.id)
+            entry['category_counts'][category] = entry['category_counts'].get(category, 0) + 1
+            entry['first_seen'] = min(entry['first_seen'], analysis.timestamp)
+            if entry['last'] is None or analysis.id > entry['last'].id:
+                entry['last'] = analysis
+
+    IndicatorPostingBlock.query.delete()
+    Indicator.query.delete()
+    indicators, blocks = [], []
+    for key, entry in entries.items():
+        last = entry['last']
+        indicators.append({
+            'key': key, 'count': len(entry['ids']), 'category_counts': entry['category_counts'],
+            'last_category': last.risk_category, 'last_analysis_id': last.id,
+            'first_seen': entry['first_seen'], 'last_seen': last.timestamp
+        })
+        for block, ids in split_blocks(sorted(entry['ids'])):
+            blocks.append({
+                'indicator': key, 'block': block, 'first_id': ids[0], 'last_id': ids[-1],
+                'count': len(ids), 'postings': encode_postings(ids)
+            })
+    db.session.bulk_insert_mappings(Indicator, indicators)
+    db.session.bulk_insert_mappings(IndicatorPostingBlock, blocks)
+    db.session.commit()
+    return len(indicators)
+
+def indicator_sightings(keys, limit=20):
+    """
+    Tidligere observasjoner av indikatorene: oppsummerte verdikter og de siste
+    `limit` analysene. Analyser som er flyttet til arkivet telles som archived.
+    """
+    matches = []
+    for indicator in Indicator.query.filter(Indicator.key.in_(keys)):
+        ids = []
+        for block in IndicatorPostingBlock.query.filter_by(indicator=indicator.key) \
+                .order_by(IndicatorPostingBlock.block.desc()):
+            ids.extend(reversed(list(decode_postings(block.postings))))
+            if len(ids) >= limit:
+                break
+        ids = ids[:limit]
+        rows = {
+            row.id: row for row in Analysis.query.with_entities(
+                Analysis.id, Analysis.url, Analysis.timestamp, Analysis.risk_category,
+                AnalysisSnapshot.risk_score, AnalysisSnapshot.source
+            ).outerjoin(AnalysisSnapshot, Analysis.snapshot_id == AnalysisSnapshot.id).filter(Analysis.id.in_(ids))
+        } if ids else {}
+        match = indicator.to_dict()
+        match['sightings'] = [
+            {
+                'analysis_id': row.id,
+                'url': row.url,
+                'timestamp': row.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                'risk_category': row.risk_category,
+                'risk_score': row.risk_score,
+                'source': row.source
+            }
+            for row in (rows[analysis_id] for analysis_id in ids if analysis_id in rows)
+        ]
+        match['archived_sightings'] = len(ids) - len(match['sightings'])
+        matches.append(match)
+    matches.sort(key=lambda match: keys.index(match['indicator']))
+    return matches
+
+def rebuild_domain_reputation(archived_records=()):
+    """
+    Bygger domeneomdømmet fra bunnen av basert på alle lagrede analyser.
+    archived_records er arkiverte analyser (dict fra Analysis.to_dict).
+    """
+    aggregates = {}
+    query = Analysis.query.with_entities(
+        Analysis.url, Analysis.risk_category, AnalysisSnapshot.risk_score,
+        AnalysisSnapshot.mitre_analysis, Analysis.timestamp, AnalysisSnapshot.source
+    ).outerjoin(AnalysisSnapshot, Analysis.snapshot_id == AnalysisSnapshot.id)
+    archived = (
+        SimpleNamespace(**dict(record, timestamp=datetime.strptime(record['timestamp'], "%Y-%m-%d %H:%M:%S")))
+        for record in archived_records
+    )
+    for analysis in chain(query.yield_per(1000), archived):
+        if not _counts_toward_reputation(analysis):
+            continue
+        domain = registered_domain(analysis.url)
+        if not domain:
+            continue
+        aggregate = aggregates.setdefault(domain, empty_aggregate(domain))
+        accumulate(aggregate, analysis.risk_category, analysis.risk_score,
+                   (analysis.mitre_analysis or {}).get('techniques', []), analysis.timestamp)
+
+    DomainReputation.query.delete()
+    db.session.bulk_insert_mappings(
+        DomainReputation,
+        [aggregate for aggregate in aggregates.values() if aggregate['total_analyses']]
+    )
+    db.session.commit()
+    return len(aggregates)
+
+def analysis_summary(urls_per_category=10):
+    """
+    Oppsummering av alle lagrede analyser i samme format som
+    SOCAnalyzer.generate_summary, slik at alle arbeidsprosesser gir samme svar.
+    Arkiverte analyser telles med via dagsaggregatene.
+    """
+    rows = db.session.query(
+        Analysis.risk_category, func.count(Analysis.id), func.max(Analysis.timestamp)
+    ).group_by(Analysis.risk_category).all()
+    archived = db.session.query(
+        AnalysisDailyAggregate.risk_category, func.sum(AnalysisDailyAggregate.count),
+        func.max(AnalysisDailyAggregate.day)
+    ).group_by(AnalysisDailyAggregate.risk_category).all()
+    if not rows and not archived:
+        return "Ingen analyser å oppsummere"
+
+    distribution = {category: {'antall': 0, 'urls': []} for category in ('HØY', 'MEDIUM', 'LAV', 'UKJENT')}
+    for category, count, _ in archived:
+        distribution.setdefault(category or 'UKJENT', {'antall': 0, 'urls': []})['antall'] += count
+    for category, count, _ in rows:
+        condition = Analysis.risk_category == category if category else Analysis.risk_category.is_(None)
+        entry = distribution.setdefault(category or 'UKJENT', {'antall': 0, 'urls': []})
+        entry['antall'] += count
+        # Bare de nyeste URLene per kategori, så svaret ikke vokser med databasen
+        recent = Analysis.query.with_entities(Analysis.url, AnalysisSnapshot.risk_score) \
+            .outerjoin(AnalysisSnapshot, Analysis.snapshot_id == AnalysisSnapshot.id) \
+            .filter(condition).order_by(Analysis.timestamp.desc()).limit(urls_per_category)
+        entry['urls'].extend({'url': url, 'score': score or 'N/A'} for url, score in recent)
+
+    timestamps = [timestamp for _, _, timestamp in rows if timestamp]
+    if not timestamps:
+        timestamps = [datetime.combine(day, datetime.min.time()) for _, _, day in archived if day]
+    latest = max(timestamps) if timestamps else None
+    return {
+        'total_analyzed': sum(count for _, count, _ in rows) + sum(count for _, count, _ in archived),
+        'risk_distribution': distribution,
+        'latest_analysis': latest.strftime("%Y-%m-%d %H:%M:%S") if latest else 'N/A'
+    }
+
+def upgrade_schema():
+    """Legger til kolonner som mangler i eksisterende tabeller (create_all endrer ikke tabeller)"""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(
+                f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            ))
+            if column.index:
+                db.session.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS ix_{table.name}_{column.name} ON {table.name} ({column.name})'
+                ))
+            print(f"La til kolonne {table.name}.{column.name}")
+    db.session.commit()
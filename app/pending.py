@@ -0,0 +1,125 @@
+from typing import Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+import uuid
+
+from analyzers.deadline import DeadlineExceeded
+from models import db, Analysis, PendingAnalysis
+
+# Fullførte håndtak hentes av nettleseren innen sekunder; de slettes etter et døgn
+PENDING_KEEP = timedelta(days=1)
+# Et håndtak som fortsatt er 'pending' etter dette, tilhørte en arbeidsprosess som døde
+# (eller ble startet på nytt) før analysen var ferdig
+PENDING_TIMEOUT = timedelta(minutes=15)
+
+
+def new_handle() -> str:
+    return uuid.uuid4().hex
+
+
+def pending_result(url: str, handle: str) -> Dict:
+    """Svaret /analyze gir for en URL som ikke ble ferdig innen fristen"""
+    return {
+        'url': url,
+        'status': 'pending',
+        'handle': handle,
+        'risk_category': 'UKJENT',
+        'risk_score': 'N/A',
+        'action_required': 'Analysen fullføres i bakgrunnen - hentes fra /analyze/pending/<handle>'
+    }
+
+
+def expire_stale_pending(now: datetime = None) -> int:
+    """
+    Markerer håndtak som har stått som 'pending' lenger enn PENDING_TIMEOUT som feilet,
+    så nettleseren slutter å vente. Blir analysen likevel ferdig, overskrives statusen.
+    """
+    now = now or datetime.utcnow()
+    return PendingAnalysis.query.filter(
+        PendingAnalysis.status == 'pending', PendingAnalysis.requested_at < now - PENDING_TIMEOUT
+    ).update({
+        'status': 'error',
+        'error_message': 'Bakgrunnsanalysen ble avbrutt - analyser URLen på nytt',
+        'completed_at': now
+    }, synchronize_session=False)
+
+
+class PendingAnalyses:
+    """
+    Fullfører analyser som ikke rakk fristen i /analyze. Oppslaget som allerede
+    pågår gjøres ferdig; gikk det tom for tid underveis, kjøres analysen på nytt
+    uten frist. Resultatet lagres i Analysis og under håndtaket i PendingAnalysis,
+    så hvilken som helst arbeidsprosess kan svare på /analyze/pending/<handle>.
+    """
+
+    def __init__(self, app, analyze, finish=None, workers: int = 4):
+        self.app = app
+        # analyze(url) -> resultat uten frist (SOCAnalyzer.analyze_and_categorize)
+        self.analyze = analyze
+        # finish(url, result) fullfører et resultat som bare mangler ATT&CK-steget (SOCAnalyzer.finish_analysis)
+        self.finish = finish
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pending-analysis')
+        self.stats = {'tracked': 0, 'completed': 0, 'restarted': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def track(self, handle: str, url: str, future: Future):
+        """
+        Lagrer resultatet av future under handle når det er klart. PendingAnalysis-raden
+        må være committet før kallet, slik at bakgrunnstråden finner den.
+        """
+        self._count('tracked')
+        future.add_done_callback(lambda done: self.executor.submit(self._complete, handle, url, done))
+
+    def _complete(self, handle: str, url: str, future: Future):
+        with self.app.app_context():
+            pending = PendingAnalysis.query.get(handle)
+            if pending is None:
+                return
+            try:
+                # analyze_urls returnerer unntak som verdier
+                outcome = future.result()
+                if isinstance(outcome, DeadlineExceeded):
+                    self._count('restarted')
+                    partial = getattr(outcome, 'partial', None)
+                    # Gikk fristen ut i ATT&CK-steget, brukes VirusTotal-svaret som allerede finnes
+                    outcome = self.finish(url, partial) if partial is not None and self.finish else self.analyze(url)
+                elif isinstance(outcome, Exception):
+                    raise outcome
+
+                # Et degradert resultat (før ATT&CK-data var lastet) vises, men lagres ikke som analyse
+                if not outcome.get('degraded'):
+                    analysis = Analysis.from_result(url, outcome)
+                    db.session.add(analysis)
+                    db.session.flush()
+                    pending.analysis_id = analysis.id
+                pending.result = outcome
+                pending.status = 'completed'
+                self._count('completed')
+            except Exception as e:
+                print(f"Bakgrunnsanalyse av {url} feilet: {str(e)}")
+                pending.status = 'error'
+                pending.error_message = str(e)
+                self._count('failed')
+            pending.completed_at = datetime.utcnow()
+            try:
+                PendingAnalysis.query.filter(
+                    PendingAnalysis.completed_at < datetime.utcnow() - PENDING_KEEP
+                ).delete(synchronize_session=False)
+                expire_stale_pending()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Kunne ikke lagre bakgrunnsanalyse av {url}: {str(e)}")
+
+    def status(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
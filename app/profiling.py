@@ -0,0 +1,268 @@
+from typing import Dict, List, Optional
+from collections import Counter
+from datetime import datetime
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+from flask import g, request
+
+# Forespørsler profileres bare med denne headeren ('sample' eller 'cprofile'), eller når
+# en administrator har bestilt profilering av de neste forespørslene mot en sti
+PROFILE_HEADER = 'X-Profile'
+TOKEN_HEADER = 'X-Profile-Token'
+PROFILE_MODES = ('sample', 'cprofile')
+SAMPLE_INTERVAL = 0.005
+# Eldste profiler slettes når katalogen har flere filer enn dette
+PROFILE_KEEP = 200
+_UNSAFE = re.compile(r'[^\w.-]+')
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = '/'.join(code.co_filename.replace('\\', '/').split('/')[-2:])
+    # ';' skiller rammer i flamegraph-formatet og kan ikke stå i et navn
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+def collapse_stack(frame) -> str:
+    """Stakken fra ytterste til innerste ramme, i formatet flamegraph.pl og speedscope leser"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def write_folded(path: str, stacks: Counter):
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, weight in stacks.most_common():
+            f.write(f'{stack} {weight}\n')
+
+
+class StackSampler:
+    """
+    Samplingsprofilering av én tråd: en hjelpetråd leser trådens stakk hvert
+    intervall og teller like stakker. Forespørselen selv kjører uendret.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class RequestProfiler:
+    """
+    Profilering av enkeltforespørsler på ekte trafikk, f.eks. en treg /generate_report
+    eller /history. Krokene registreres bare når PROFILING_ENABLED er satt, så uten
+    profilering koster det ingenting. Resultatene lagres i directory:
+
+    - sample: foldede stakker (.folded) for flamegraph.pl, speedscope eller inferno
+    - cprofile: deterministisk profil (.prof) for pstats, snakeviz eller flameprof
+    - minne: tracemalloc-øyeblikksbilder (.tracemalloc) og foldede allokeringsstakker
+    """
+
+    def __init__(self, directory: str, token: str = None, interval: float = SAMPLE_INTERVAL,
+                 keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.token = token or None
+        self.interval = interval
+        self.keep = keep
+        # Bestillinger fra /profiling/arm: [{'path', 'mode', 'remaining'}]
+        self.armed = []
+        self._previous_snapshot = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def install(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def authorized(self, token: Optional[str]) -> bool:
+        # Uten token er ingen autorisert; create_app slår ikke på profilering uten PROFILE_TOKEN
+        return self.token is not None and hmac.compare_digest(token or '', self.token)
+
+    def arm(self, path: str, count: int = 1, mode: str = 'sample') -> Dict:
+        """Profilerer de neste count forespørslene der stien starter med path"""
+        order = {'path': path, 'mode': mode, 'remaining': count}
+        with self._lock:
+            self.armed.append(order)
+        return dict(order)
+
+    def _requested_mode(self) -> Optional[str]:
+        mode = request.headers.get(PROFILE_HEADER)
+        if mode:
+            if not self.authorized(request.headers.get(TOKEN_HEADER)):
+                return None
+            return 'sample' if mode not in PROFILE_MODES else mode
+        if not self.armed:
+            return None
+        with self._lock:
+            for order in self.armed:
+                if request.path.startswith(order['path']):
+                    order['remaining'] -= 1
+                    if order['remaining'] <= 0:
+                        self.armed.remove(order)
+                    return order['mode']
+        return None
+
+    def _before_request(self):
+        if request.path.startswith('/profiling'):
+            return
+        mode = self._requested_mode()
+        if mode is None:
+            return
+        if mode == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+            g.soc_profile = (mode, profile, time.perf_counter())
+        else:
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+            g.soc_profile = (mode, sampler, time.perf_counter())
+
+    def _finish(self) -> Optional[str]:
+        session = g.pop('soc_profile', None)
+        if session is None:
+            return None
+        mode, profiler, started = session
+        elapsed = time.perf_counter() - started
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        endpoint = _UNSAFE.sub('_', request.endpoint or request.path.strip('/') or 'index')
+        name = f'{stamp}-{endpoint}-{int(elapsed * 1000)}ms'
+        try:
+            if mode == 'cprofile':
+                profiler.disable()
+                name += '.prof'
+                profiler.dump_stats(os.path.join(self.directory, name))
+            else:
+                name += '.folded'
+                write_folded(os.path.join(self.directory, name), profiler.stop())
+            self._prune()
+            print(f"Profil for {request.method} {request.path} lagret: {name}")
+            return name
+        except Exception as e:
+            print(f"Kunne ikke lagre profil for {request.path}: {str(e)}")
+            return None
+
+    def _after_request(self, response):
+        name = self._finish()
+        if name:
+            response.headers['X-Profile-File'] = name
+        return response
+
+    def _teardown_request(self, exc=None):
+        # Forespørsler som feilet før after_request skal også stoppe profileringen
+        self._finish()
+
+    def _prune(self):
+        files = self.files()
+        for item in files[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, item['name']))
+            except OSError:
+                pass
+
+    def files(self) -> List[Dict]:
+        """Lagrede profiler, nyeste først"""
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files.append({
+                    'name': name,
+                    'bytes': stat.st_size,
+                    'modified': datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+                })
+        return sorted(files, key=lambda item: item['name'], reverse=True)
+
+    def path(self, name: str) -> Optional[str]:
+        path = os.path.join(self.directory, os.path.basename(name))
+        return path if os.path.isfile(path) else None
+
+    def start_memory(self, frames: int = 25) -> Dict:
+        """Starter tracemalloc; allokeringer før start er ikke med i øyeblikksbildene"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._previous_snapshot = None
+        return self.memory_status()
+
+    def stop_memory(self) -> Dict:
+        tracemalloc.stop()
+        self._previous_snapshot = None
+        return self.memory_status()
+
+    def memory_status(self) -> Dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            'tracing': tracing,
+            'frames': tracemalloc.get_traceback_limit() if tracing else 0,
+            'current_bytes': current,
+            'peak_bytes': peak
+        }
+
+    def snapshot_memory(self, limit: int = 20) -> Dict:
+        """
+        Tar et tracemalloc-øyeblikksbilde og lagrer det (.tracemalloc) sammen med
+        allokeringsstakkene vektet med byte (.folded). Svaret viser de største
+        allokeringsstedene og endringen siden forrige øyeblikksbilde.
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError('tracemalloc er ikke startet (POST /profiling/memory action=start)')
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        name = f'{stamp}-memory'
+        snapshot.dump(os.path.join(self.directory, name + '.tracemalloc'))
+
+        stacks = Counter()
+        for statistic in snapshot.statistics('traceback'):
+            # tracemalloc lagrer innerste ramme først
+            stack = ';'.join(
+                f'{os.path.basename(frame.filename)}:{frame.lineno}'.replace(';', ',')
+                for frame in reversed(statistic.traceback)
+            )
+            stacks[stack] += statistic.size
+        write_folded(os.path.join(self.directory, name + '.folded'), stacks)
+        self._prune()
+
+        result = dict(self.memory_status(), files=[name + '.tracemalloc', name + '.folded'])
+        result['top'] = [
+            {'location': str(statistic.traceback[0]), 'bytes': statistic.size, 'count': statistic.count}
+            for statistic in snapshot.statistics('lineno')[:limit]
+        ]
+        if self._previous_snapshot is not None:
+            result['growth'] = [
+                {'location': str(statistic.traceback[0]), 'bytes_diff': statistic.size_diff,
+                 'count_diff': statistic.count_diff}
+                for statistic in snapshot.compare_to(self._previous_snapshot, 'lineno')[:limit]
+            ]
+        self._previous_snapshot = snapshot
+        return result
@@ -0,0 +1,333 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+import json
+import time
+
+from sqlalchemy import Float, Integer, and_, bindparam, case, cast, func, not_, or_, select
+
+from analyzers.categorization import CategorizationPolicy
+from models import (db, Analysis, AnalysisSnapshot, RecategorizationRun, prune_snapshots, rebuild_domain_reputation,
+                    rebuild_indicator_index, recount_url_clusters, verdict_hash)
+
+# Snapshots per transaksjon i første fase, analyser per UPDATE i andre
+SNAPSHOT_CHUNK = 5000
+ANALYSIS_CHUNK = 50000
+# En kjøring som fortsatt står som 'running' etter dette, tilhørte en arbeidsprosess som døde
+RECATEGORIZE_TIMEOUT = timedelta(hours=6)
+# Så lenge en kjøring venter på ATT&CK-data (f.eks. rett etter oppstart)
+MITRE_READY_WAIT = 300
+
+
+def score_parts(risk_score):
+    """
+    Positive, totalt og gyldighet for VirusTotal-scoren 'p/t' som SQL-uttrykk.
+    Gyldig betyr to heltall med bare sifre (det parse_risk_score godtar fra VirusTotal).
+    """
+    risk_score = func.coalesce(risk_score, '')
+    slash = func.instr(risk_score, '/')
+    positives = func.substr(risk_score, 1, slash - 1)
+    total = func.substr(risk_score, slash + 1)
+    valid = and_(slash > 1, total != '', not_(positives.op('GLOB')('*[^0-9]*')),
+                 not_(total.op('GLOB')('*[^0-9]*')))
+    return cast(positives, Integer), cast(total, Integer), valid
+
+
+def category_case(policy: CategorizationPolicy, positives, total):
+    """CategorizationPolicy.category_for som SQL CASE, så kategorien beregnes i databasen"""
+    if policy.basis == 'count':
+        value = positives
+    else:
+        # Samme rekkefølge som i Python ((p / t) * 100), så grensetilfellene blir like
+        value = case((total > 0, cast(positives, Float) / total * 100), else_=0)
+    return case(*[(value >= minimum, category) for minimum, category in policy.thresholds],
+                else_=policy.thresholds[-1][1])
+
+
+class _MitreScores:
+    """ATT&CK-score etter policyens vekter; hvert ulike teknikksett beregnes én gang"""
+
+    def __init__(self, policy: CategorizationPolicy, mitre_analyzer):
+        self.policy = policy
+        self.mitre_analyzer = mitre_analyzer
+        self.scores = {}
+
+    def score(self, techniques) -> int:
+        techniques = tuple(techniques)
+        score = self.scores.get(techniques)
+        if score is None:
+            score = self.scores[techniques] = self.mitre_analyzer._calculate_risk_score(
+                list(techniques), self.policy.mitre_weights
+            )
+        return score
+
+    def mitre_analysis(self, mitre_analysis):
+        if not mitre_analysis or not mitre_analysis.get('techniques'):
+            return mitre_analysis
+        score = self.score(mitre_analysis['techniques'])
+        if mitre_analysis.get('risk_score') == score:
+            return mitre_analysis
+        return dict(mitre_analysis, risk_score=score)
+
+    def score_case(self, mitre_column, where):
+        """
+        Ny ATT&CK-score som SQL CASE over teknikklisten (JSON-teksten fra SQLite), for
+        de ulike teknikksettene i radene som oppfyller where. Rader uten teknikker
+        beholder scoren.
+        """
+        techniques = func.json_extract(mitre_column, '$.techniques')
+        current = func.json_extract(mitre_column, '$.risk_score')
+        keys = [key for key, in db.session.execute(select(techniques).where(where).distinct())
+                if key and json.loads(key)]
+        if not keys:
+            return current
+        return case({key: self.score(json.loads(key)) for key in keys}, value=techniques, else_=current)
+
+
+def _snapshot_urls(snapshot_ids: List[int]) -> Dict[int, str]:
+    """URLen hvert snapshot gjelder (nøkkelen i innholdshashen)"""
+    return dict(
+        db.session.query(Analysis.snapshot_id, func.min(Analysis.url))
+        .filter(Analysis.snapshot_id.in_(snapshot_ids)).group_by(Analysis.snapshot_id)
+    )
+
+
+def _existing_hashes(digests: List[str]) -> Dict[str, int]:
+    existing = {}
+    for i in range(0, len(digests), 500):
+        existing.update(
+            db.session.query(AnalysisSnapshot.content_hash, AnalysisSnapshot.id)
+            .filter(AnalysisSnapshot.content_hash.in_(digests[i:i + 500]))
+        )
+    return existing
+
+
+def _snapshot_expressions(policy: CategorizationPolicy, scores: _MitreScores) -> Dict:
+    """
+    SQL-uttrykk for policyens verdikt per snapshot: hvilke som følger policyen
+    (VirusTotal-verdikter; lister, omdømme og klynger har egne regler), hvilke som har
+    gyldig score, og ny kategori og nytt tiltak. changed er sant der kategori, tiltak
+    eller ATT&CK-score endres, så innholdshashen må beregnes på nytt.
+    """
+    snapshots = AnalysisSnapshot.__table__
+    positives, total, valid = score_parts(snapshots.c.risk_score)
+    virustotal = func.coalesce(snapshots.c.source, 'virustotal') == 'virustotal'
+    new_category = category_case(policy, positives, total)
+    new_action = case(policy.actions, value=new_category)
+    new_mitre_score = scores.score_case(snapshots.c.mitre_analysis, and_(virustotal, valid))
+    changed = and_(valid, or_(
+        snapshots.c.risk_category.is_distinct_from(new_category),
+        snapshots.c.action_required.is_distinct_from(new_action),
+        func.json_extract(snapshots.c.mitre_analysis, '$.risk_score').is_distinct_from(new_mitre_score)
+    ))
+    return {'virustotal': virustotal, 'category': new_category, 'action': new_action, 'changed': changed}
+
+
+def _recategorize_snapshots(scores: _MitreScores, expressions: Dict, stats: Dict, chunk_size: int):
+    """
+    Snapshots der verdiktet endres. Databasen finner dem med CASE-uttrykkene, og bare
+    de leses inn for å beregne innholdshashen og slå sammen like verdikter.
+    """
+    policy = scores.policy
+    snapshots = AnalysisSnapshot.__table__
+    analyses = Analysis.__table__
+    update_snapshot = snapshots.update().where(snapshots.c.id == bindparam('snapshot_id')).values(
+        content_hash=bindparam('content_hash'), risk_category=bindparam('risk_category'),
+        action_required=bindparam('action_required'), mitre_analysis=bindparam('mitre_analysis'),
+        policy_version=bindparam('policy_version')
+    )
+    repoint = analyses.update().where(analyses.c.snapshot_id == bindparam('old_id')).values(
+        snapshot_id=bindparam('new_id')
+    )
+
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(snapshots, expressions['category'].label('new_category'),
+                   expressions['action'].label('new_action'))
+            .where(snapshots.c.id > last_id, expressions['virustotal'], expressions['changed'])
+            .order_by(snapshots.c.id).limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        stats['snapshots'] += len(rows)
+        urls = _snapshot_urls([row['id'] for row in rows])
+
+        changes = []
+        for row in rows:
+            if row['id'] not in urls:
+                continue
+            content = dict(
+                row, risk_category=row['new_category'], action_required=row['new_action'],
+                mitre_analysis=scores.mitre_analysis(row['mitre_analysis']), policy_version=policy.version
+            )
+            content['content_hash'] = verdict_hash(urls[row['id']], content)
+            content['snapshot_id'] = row['id']
+            changes.append(content)
+        if not changes:
+            continue
+
+        # Blir to verdikter for samme URL like etter omkategoriseringen, slås de sammen
+        existing = _existing_hashes([change['content_hash'] for change in changes])
+        updates, merges = [], []
+        for change in changes:
+            keep = existing.setdefault(change['content_hash'], change['snapshot_id'])
+            if keep == change['snapshot_id']:
+                updates.append(change)
+            else:
+                merges.append({'old_id': change['snapshot_id'], 'new_id': keep})
+        if merges:
+            db.session.execute(repoint, merges)
+            db.session.execute(
+                snapshots.delete().where(snapshots.c.id.in_([merge['old_id'] for merge in merges]))
+            )
+        if updates:
+            db.session.execute(update_snapshot, [
+                {key: update[key] for key in ('snapshot_id', 'content_hash', 'risk_category', 'action_required',
+                                              'mitre_analysis', 'policy_version')}
+                for update in updates
+            ])
+        db.session.commit()
+        stats['changed_snapshots'] += len(updates)
+        stats['merged_snapshots'] += len(merges)
+
+
+def _restamp_snapshots(version: str, expressions: Dict, stats: Dict, chunk_size: int):
+    """
+    Setter policyversjonen på resten av VirusTotal-snapshotene: de der verdiktet ikke
+    endres, og de uten gyldig score (FEIL og UKJENT). Versjonen er ikke med i
+    innholdshashen, så dette er én UPDATE per ID-intervall.
+    """
+    snapshots = AnalysisSnapshot.__table__
+    max_id = db.session.query(func.max(AnalysisSnapshot.id)).scalar() or 0
+    for start in range(0, max_id + 1, chunk_size):
+        result = db.session.execute(
+            snapshots.update()
+            .where(snapshots.c.id.between(start, start + chunk_size - 1))
+            .where(expressions['virustotal'], not_(expressions['changed']))
+            .where(snapshots.c.policy_version.is_distinct_from(version))
+            .values(policy_version=version)
+        )
+        db.session.commit()
+        stats['restamped_snapshots'] += result.rowcount
+
+
+def _recategorize_analyses(version: str, stats: Dict, chunk_size: int):
+    """Kopierer kategori og policyversjon fra snapshotene til analysene, i ID-intervaller"""
+    snapshots = AnalysisSnapshot.__table__
+    analyses = Analysis.__table__
+    category = select(snapshots.c.risk_category).where(snapshots.c.id == analyses.c.snapshot_id).scalar_subquery()
+    max_id = db.session.query(func.max(Analysis.id)).scalar() or 0
+    for start in range(0, max_id + 1, chunk_size):
+        result = db.session.execute(
+            analyses.update()
+            .where(analyses.c.id.between(start, start + chunk_size - 1))
+            .where(analyses.c.snapshot_id.in_(select(snapshots.c.id).where(snapshots.c.policy_version == version)))
+            .where((analyses.c.policy_version.is_distinct_from(version))
+                   | (analyses.c.risk_category.is_distinct_from(category)))
+            .values(risk_category=category, policy_version=version)
+        )
+        db.session.commit()
+        stats['analyses'] += result.rowcount
+
+
+def recategorize_analyses(policy: CategorizationPolicy, mitre_analyzer, snapshot_chunk: int = SNAPSHOT_CHUNK,
+                          analysis_chunk: int = ANALYSIS_CHUNK) -> Dict:
+    """
+    Omkategoriserer alle lagrede VirusTotal-verdikter etter policy fra den lagrede
+    scoren (positive/totalt) og teknikkene, uten nye VirusTotal-oppslag. Kategori,
+    tiltak og ATT&CK-score beregnes som CASE-uttrykk i databasen; bare snapshots der
+    verdiktet endres leses inn, resten får ny versjon med én UPDATE per ID-intervall,
+    og til slutt analysene. Arkiverte analyser endres ikke.
+    """
+    started = time.perf_counter()
+    stats = {'policy_version': policy.version, 'snapshots': 0, 'changed_snapshots': 0, 'merged_snapshots': 0,
+             'restamped_snapshots': 0, 'analyses': 0}
+    # Snapshots uten analyser har ingen URL å hashe med
+    prune_snapshots()
+    db.session.commit()
+
+    scores = _MitreScores(policy, mitre_analyzer)
+    expressions = _snapshot_expressions(policy, scores)
+    _recategorize_snapshots(scores, expressions, stats, snapshot_chunk)
+    _restamp_snapshots(policy.version, expressions, stats, analysis_chunk)
+    stats['snapshot_seconds'] = round(time.perf_counter() - started, 2)
+    _recategorize_analyses(policy.version, stats, analysis_chunk)
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    print(f"Omkategoriserte {stats['analyses']} analyser etter policy {policy.version} på {stats['seconds']}s")
+    return stats
+
+
+def expire_stale_runs(now: datetime = None) -> int:
+    """Markerer kjøringer som har stått som 'running' lenger enn RECATEGORIZE_TIMEOUT som feilet"""
+    now = now or datetime.utcnow()
+    return RecategorizationRun.query.filter(
+        RecategorizationRun.status == 'running', RecategorizationRun.requested_at < now - RECATEGORIZE_TIMEOUT
+    ).update({
+        'status': 'error',
+        'error_message': 'Omkategoriseringen ble avbrutt - start den på nytt',
+        'completed_at': now
+    }, synchronize_session=False)
+
+
+class RecategorizationJobs:
+    """
+    Kjører omkategorisering og ombygging av avledede tabeller i en bakgrunnstråd, så
+    POST /policies/recategorize svarer med en gang. Statusen ligger i
+    RecategorizationRun, så hvilken som helst arbeidsprosess kan svare på
+    /policies/recategorize/<id>, og en ny kjøring startes ikke mens en annen pågår.
+    """
+
+    def __init__(self, app, mitre_analyzer, records):
+        self.app = app
+        self.mitre_analyzer = mitre_analyzer
+        # records() -> arkiverte analyser for ombyggingen (AnalysisArchive.iter_records)
+        self.records = records
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recategorize')
+
+    def start(self, policy: CategorizationPolicy, rebuild: bool = True):
+        """Starter en kjøring; gir (kjøringen, True), eller (den som pågår, False)"""
+        expire_stale_runs()
+        running = RecategorizationRun.query.filter_by(status='running').first()
+        if running is not None:
+            db.session.commit()
+            return running, False
+        run = RecategorizationRun(policy_version=policy.version, rebuild=rebuild)
+        db.session.add(run)
+        db.session.commit()
+        self.executor.submit(self._run, run.id, policy, rebuild)
+        return run, True
+
+    def _run(self, run_id: int, policy: CategorizationPolicy, rebuild: bool):
+        with self.app.app_context():
+            try:
+                if not self.mitre_analyzer.wait_ready(timeout=MITRE_READY_WAIT):
+                    raise RuntimeError('ATT&CK-data ble ikke lastet - prøv igjen')
+                result = recategorize_analyses(policy, self.mitre_analyzer)
+                if rebuild:
+                    started = time.perf_counter()
+                    result['rebuilt'] = {
+                        'domains': rebuild_domain_reputation(self.records()),
+                        'indicators': rebuild_indicator_index(self.records()),
+                        'url_clusters': recount_url_clusters(self.records())
+                    }
+                    result['rebuild_seconds'] = round(time.perf_counter() - started, 2)
+                status, error = 'completed', None
+            except Exception as e:
+                db.session.rollback()
+                print(f"Omkategorisering etter policy {policy.version} feilet: {str(e)}")
+                result, status, error = None, 'error', str(e)
+            try:
+                run = RecategorizationRun.query.get(run_id)
+                run.status = status
+                run.result = result
+                run.error_message = error
+                run.completed_at = datetime.utcnow()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Kunne ikke lagre status for omkategorisering {run_id}: {str(e)}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
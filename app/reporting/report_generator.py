@@ -10,12 +10,31 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT
 import matplotlib.pyplot as plt
 import pandas as pd
 from io import BytesIO
+import functools
 import os
+import logging
+import threading
 from datetime import datetime
 
+from analyzers.structured_log import get_logger, log_event
+
+logger = get_logger('report')
+
+# pyplot har global tilstand (gjeldende figur, stil, close('all')), så samtidige
+# rapporter må lage diagrammene ett om gangen
+_PYPLOT_LOCK = threading.Lock()
+
+def _with_pyplot_lock(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with _PYPLOT_LOCK:
+            return method(*args, **kwargs)
+    return wrapper
+
 class ReportGenerator:
     def __init__(self):
-        plt.style.use('default')
+        with _PYPLOT_LOCK:
+            plt.style.use('default')
         self.styles = getSampleStyleSheet()
         
         # Profesjonell fargepalett
@@ -146,6 +165,7 @@ class ReportGenerator:
         
         return summary
 
+    @_with_pyplot_lock
     def create_risk_distribution_chart(self, analyses):
         """Lager et kakediagram over risikofordeling"""
         risk_distribution = {
@@ -215,6 +235,7 @@ class ReportGenerator:
         
         return img_buffer
         
+    @_with_pyplot_lock
     def create_mitre_techniques_chart(self, analyses):
         """Lager et stolpediagram over mest brukte MITRE-teknikker"""
         technique_counts = {}
@@ -344,5 +365,6 @@ class ReportGenerator:
             return output_path
             
         except Exception as e:
-            print(f"Error in generate_pdf_report: {str(e)}")
+            log_event(logger, logging.ERROR, 'report.pdf_failed', {'analyses': len(analyses), 'error': str(e)},
+                      f"Error in generate_pdf_report: {str(e)}")
             raise
\ No newline at end of file
@@ -0,0 +1,49 @@
+def calculate_period_stats(analyses, aggregates=()):
+    """
+    Beregner statistikk for en gitt periode. aggregates er dagsaggregater
+    (AnalysisDailyAggregate.to_dict) for arkiverte analyser i perioden.
+    """
+    stats = {
+        'total_analyses': len(analyses),
+        'critical_risk': sum(1 for a in analyses if a.risk_category == 'KRITISK'),
+        'high_risk': sum(1 for a in analyses if a.risk_category == 'HØY'),
+        'avg_mitre_score': 0,
+        'most_common_technique': 'Ingen data'
+    }
+
+    # Beregn gjennomsnittlig MITRE-score
+    mitre_scores = [
+        a.mitre_analysis.get('risk_score', 0)
+        for a in analyses
+        if a.mitre_analysis
+    ]
+    mitre_score_sum = sum(mitre_scores)
+    mitre_score_count = len(mitre_scores)
+
+    # Finn mest brukte MITRE-teknikk
+    technique_count = {}
+    for analysis in analyses:
+        if analysis.mitre_analysis and 'techniques' in analysis.mitre_analysis:
+            for tech in analysis.mitre_analysis['techniques']:
+                technique_count[tech] = technique_count.get(tech, 0) + 1
+
+    # Arkiverte analyser telles fra aggregatene
+    for aggregate in aggregates:
+        stats['total_analyses'] += aggregate['count']
+        if aggregate['risk_category'] == 'KRITISK':
+            stats['critical_risk'] += aggregate['count']
+        elif aggregate['risk_category'] == 'HØY':
+            stats['high_risk'] += aggregate['count']
+        mitre_score_sum += aggregate['mitre_score_sum']
+        mitre_score_count += aggregate['mitre_score_count']
+        for tech, count in aggregate['technique_counts'].items():
+            technique_count[tech] = technique_count.get(tech, 0) + count
+
+    if mitre_score_count:
+        stats['avg_mitre_score'] = mitre_score_sum / mitre_score_count
+
+    if technique_count:
+        most_common = max(technique_count.items(), key=lambda x: x[1])
+        stats['most_common_technique'] = most_common[0]
+
+    return stats
@@ -0,0 +1,238 @@
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+import os
+
+from sqlalchemy import and_, case, func, or_
+from models import db, Analysis, AnalysisSnapshot, DeferredURL, VerdictChange
+
+# Hvor mange dager et verdikt gjelder før det skannes på nytt, per risikokategori
+DEFAULT_MAX_AGE_DAYS = {
+    'KRITISK': 14,
+    'HØY': 14,
+    'MEDIUM': 7,
+    'LAV': 30,
+    'UKJENT': 1,
+    'FEIL': 1
+}
+# Ved likt forfall skannes høy risiko først
+RISK_RANK = {'KRITISK': 0, 'HØY': 1, 'MEDIUM': 2, 'UKJENT': 3, 'FEIL': 4, 'LAV': 5}
+# Lavere enn alle interaktive analyser (leksikalsk score 0-100)
+RESCAN_PRIORITY = -1
+# Listeverdikter kommer fra listene og endres ikke av VirusTotal
+LIST_SOURCES = ('blocklist:', 'allowlist:')
+
+
+def parse_max_age(value: Optional[str]) -> Dict[str, int]:
+    """Parser f.eks. 'LAV=30,MEDIUM=7' oppå standardverdiene"""
+    max_age = dict(DEFAULT_MAX_AGE_DAYS)
+    for part in (value or '').split(','):
+        category, _, days = part.partition('=')
+        if category.strip() and days.strip():
+            max_age[category.strip().upper()] = int(days)
+    return max_age
+
+
+def select_stale_verdicts(max_age_days: Dict[str, int], limit: int, now: datetime = None) -> List[Dict]:
+    """
+    Siste verdikt per URL som er eldre enn kategoriens maksalder, mest forfalt først.
+    Forfall er alder delt på maksalder, så en LAV på 90 dager (3.0) går foran en
+    MEDIUM på 14 dager (2.0). Aldersgrensene, sorteringen og grensen på antall
+    gjøres i SQL, så bare de `limit` URLene som skal skannes leses.
+    """
+    now = now or datetime.utcnow()
+    fallback = max_age_days['UKJENT']
+    category = func.coalesce(Analysis.risk_category, 'UKJENT')
+    stale = [
+        and_(category == name, Analysis.timestamp <= now - timedelta(days=days))
+        for name, days in max_age_days.items()
+    ] + [and_(category.notin_(list(max_age_days)), Analysis.timestamp <= now - timedelta(days=fallback))]
+    # Alder i dager (julianday i SQLite) ganget med 1/maksalder per kategori
+    age_days = func.julianday(now.strftime('%Y-%m-%d %H:%M:%S.%f')) - func.julianday(Analysis.timestamp)
+    overdue = age_days * case(
+        {name: 1 / max(days, 1e-9) for name, days in max_age_days.items()},
+        value=category, else_=1 / max(fallback, 1e-9)
+    )
+    rank = case(RISK_RANK, value=category, else_=3)
+
+    latest = db.session.query(func.max(Analysis.id).label('id')).group_by(Analysis.url).subquery()
+    rows = db.session.query(
+        Analysis.id, Analysis.url, Analysis.risk_category, AnalysisSnapshot.risk_score, Analysis.timestamp
+    ).join(latest, Analysis.id == latest.c.id) \
+        .outerjoin(AnalysisSnapshot, Analysis.snapshot_id == AnalysisSnapshot.id) \
+        .filter(Analysis.timestamp <= now - timedelta(days=min(max_age_days.values())), or_(*stale)) \
+        .filter(or_(AnalysisSnapshot.source.is_(None),
+                    and_(*[AnalysisSnapshot.source.notlike(f'{prefix}%') for prefix in LIST_SOURCES]))) \
+        .order_by(overdue.desc(), rank, Analysis.id).limit(limit)
+
+    candidates = []
+    for row in rows:
+        max_age = max_age_days.get(row.risk_category or 'UKJENT', fallback)
+        age_days = (now - row.timestamp).total_seconds() / 86400
+        candidates.append({
+            'analysis_id': row.id,
+            'url': row.url,
+            'risk_category': row.risk_category,
+            'risk_score': row.risk_score,
+            'age_days': round(age_days, 1),
+            'overdue': round(age_days / max(max_age, 1e-9), 2)
+        })
+    return candidates
+
+
+def rescan_budget(key_pool, max_urls: int, quota_share: float) -> int:
+    """Antall URLer kjøringen kan bruke: høyst quota_share av dagens gjenstående kvote"""
+    remaining_today = key_pool.remaining_today()
+    if remaining_today is None:
+        return max_urls
+    return max(0, min(max_urls, int(remaining_today * quota_share)))
+
+
+def rescan_stale_verdicts(analyzer, scheduler, max_age_days: Dict[str, int], max_urls: int = 100,
+                          quota_share: float = 0.5, force: bool = False) -> Dict:
+    """
+    Skanner gamle verdikter på nytt i lavtrafikkvinduet. URLene tas i vinduer på
+    størrelse med ledig minuttkvote, hvert vindu committes for seg, og endrede
+    verdikter lagres som VerdictChange.
+    """
+    if not force and not scheduler.is_off_peak():
+        return {'skipped': 'Utenfor lavtrafikkvinduet', 'processed': 0, 'changed': 0}
+
+    key_pool = analyzer.analyzer.key_pool
+    budget = rescan_budget(key_pool, max_urls, quota_share)
+    candidates = select_stale_verdicts(max_age_days, budget) if budget else []
+    processed, failed, changes = 0, 0, []
+
+    while candidates:
+        if not force and not scheduler.is_off_peak():
+            break
+        window_size = int(min(len(candidates), max(1, key_pool.remaining_capacity())))
+        window, candidates = candidates[:window_size], candidates[window_size:]
+        for candidate in window:
+            result = analyzer.analyze_and_categorize(
+                candidate['url'], use_domain_policy=False, priority=RESCAN_PRIORITY
+            )
+            if result.get('status') == 'error' or result.get('degraded'):
+                # Kvote eller nettverk svikter, eller ATT&CK-data er ikke lastet; de resterende tas ved neste kjøring
+                print(f"Re-skanning av {candidate['url']} feilet: "
+                      f"{result.get('error_message') or 'ATT&CK-data er ikke lastet'}")
+                failed += 1
+                candidates = []
+                break
+
+            analysis = Analysis.from_result(candidate['url'], result)
+            db.session.add(analysis)
+            processed += 1
+            if result.get('risk_category') != candidate['risk_category']:
+                db.session.flush()
+                change = VerdictChange(
+                    url=candidate['url'],
+                    previous_analysis_id=candidate['analysis_id'],
+                    analysis_id=analysis.id,
+                    old_category=candidate['risk_category'],
+                    new_category=result.get('risk_category'),
+                    old_score=candidate['risk_score'],
+                    new_score=result.get('risk_score')
+                )
+                db.session.add(change)
+                changes.append(change)
+        db.session.commit()
+
+    if processed or failed:
+        print(f"Re-skanning: {processed} verdikter fornyet, {len(changes)} endret, {failed} feilet")
+    return {
+        'processed': processed,
+        'changed': len(changes),
+        'failed': failed,
+        'budget': budget,
+        'changes': [change.to_dict() for change in changes]
+    }
+
+
+def process_deferred_urls(analyze, scheduler, limit: int, force: bool = False) -> Dict:
+    """Analyserer utsatte URLer i prioritert rekkefølge i lavtrafikkvinduet"""
+    if not force and not scheduler.is_off_peak():
+        return {'skipped': 'Utenfor lavtrafikkvinduet', 'processed': 0, 'results': []}
+    pending = DeferredURL.query.filter(DeferredURL.processed_at.is_(None)) \
+        .order_by(DeferredURL.lexical_score.desc(), DeferredURL.requested_at).limit(limit).all()
+
+    results = []
+    for item in pending:
+        result = analyze(item.url)
+        results.append(result)
+        # Degraderte resultater lagres ikke, så URLen blir stående til neste kjøring
+        if not result.get('degraded'):
+            item.processed_at = datetime.utcnow()
+    db.session.commit()
+    return {'processed': len(results), 'results': results}
+
+
+class BackgroundJobs:
+    """
+    Planlagte jobber (APScheduler) for re-skanning og utsatte URLer. Med flere
+    arbeidsprosesser kjører jobbene bare i prosessen som får fillåsen.
+    """
+
+    def __init__(self, app, lock_path: str, analyze):
+        self.app = app
+        self.lock_path = lock_path
+        # analyze(url) analyserer og lagrer én URL (app.analyze_url)
+        self.analyze = analyze
+        self.scheduler = None
+        self._lock_file = None
+
+    def _acquire_lock(self) -> bool:
+        try:
+            import fcntl
+        except ImportError:  # Windows: ingen fillås, hver prosess kjører jobbene
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        self._lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+        return True
+
+    def start(self, interval_minutes: float) -> bool:
+        if not self._acquire_lock():
+            print("Planlagte jobber kjører i en annen prosess")
+            return False
+        from apscheduler.schedulers.background import BackgroundScheduler
+        self.scheduler = BackgroundScheduler(daemon=True)
+        for job in (self.run_rescan, self.run_deferred):
+            self.scheduler.add_job(job, 'interval', minutes=interval_minutes,
+                                   max_instances=1, coalesce=True)
+        self.scheduler.start()
+        print(f"Planlagte jobber startet (hvert {interval_minutes:g}. minutt i lavtrafikkvinduet)")
+        return True
+
+    def run_rescan(self):
+        with self.app.app_context():
+            services = self.app.extensions['soc']
+            config = self.app.config
+            try:
+                rescan_stale_verdicts(
+                    services['analyzer'], services['scheduler'], config['RESCAN_MAX_AGE'],
+                    config['RESCAN_MAX_URLS'], config['RESCAN_QUOTA_SHARE']
+                )
+            except Exception as e:
+                db.session.rollback()
+                print(f"Planlagt re-skanning feilet: {str(e)}")
+
+    def run_deferred(self):
+        with self.app.app_context():
+            services = self.app.extensions['soc']
+            try:
+                capacity = services['analyzer'].analyzer.key_pool.remaining_capacity()
+                limit = int(min(max(1, capacity), self.app.config['RESCAN_MAX_URLS']))
+                process_deferred_urls(self.analyze, services['scheduler'], limit)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Planlagt behandling av utsatte URLer feilet: {str(e)}")
+
+    def shutdown(self):
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+class ResponseCache:
+    """
+    LRU-cache for ferdige svar og spørringsresultater, nøklet på normaliserte
+    parametere. Alle oppføringer tilhører én datagenerasjon (se models.data_generation);
+    når generasjonen øker tømmes cachen, så et svar er aldri eldre enn siste commit.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.generation = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def etag(key, generation) -> str:
+        return hashlib.sha1(repr((key, generation)).encode('utf-8')).hexdigest()[:20]
+
+    def _check_generation(self, generation) -> bool:
+        """Bytter til ny generasjon; False hvis forespørselen leste en eldre generasjon"""
+        if self.generation is not None and generation < self.generation:
+            return False
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+        return True
+
+    def get(self, key, generation):
+        with self._lock:
+            value = self._entries.get(key) if self._check_generation(generation) else None
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, generation, value):
+        with self._lock:
+            if not self._check_generation(generation):
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, generation, build):
+        value = self.get(key, generation)
+        if value is None:
+            value = build()
+            self.put(key, generation, value)
+        return value
+
+    def clear(self):
+        """Tømmer cachen uten å bytte generasjon (lasttester som måler kalde svar)"""
+        with self._lock:
+            self._entries.clear()
+
+    def status(self):
+        with self._lock:
+            return {
+                'generation': self.generation,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,289 @@
+from typing import Dict, Iterator, List, Optional
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from itertools import islice
+import gzip
+import json
+import os
+import threading
+
+from flask_sqlalchemy import Pagination
+from sqlalchemy import func, text
+from models import db, Analysis, AnalysisDailyAggregate, ArchivePartition, archived_cluster_ids, prune_snapshots
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _record_day(record: Dict) -> date:
+    return datetime.strptime(record['timestamp'][:10], '%Y-%m-%d').date()
+
+
+def aggregate_records(records) -> List[Dict]:
+    """Dagsaggregater per (dag, risikokategori) i samme format som AnalysisDailyAggregate.to_dict"""
+    aggregates = {}
+    for record in records:
+        key = (_record_day(record), record['risk_category'] or None)
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = {
+                'day': key[0], 'risk_category': key[1], 'count': 0,
+                'mitre_score_sum': 0.0, 'mitre_score_count': 0, 'technique_counts': {}
+            }
+        aggregate['count'] += 1
+        mitre_analysis = record.get('mitre_analysis')
+        if mitre_analysis:
+            aggregate['mitre_score_sum'] += mitre_analysis.get('risk_score', 0)
+            aggregate['mitre_score_count'] += 1
+            for tech in mitre_analysis.get('techniques', []):
+                aggregate['technique_counts'][tech] = aggregate['technique_counts'].get(tech, 0) + 1
+    return list(aggregates.values())
+
+
+def matches_filters(record: Dict, filters: Dict) -> bool:
+    """Samme filter som /history bruker mot Analysis-tabellen, for arkiverte analyser"""
+    if filters.get('search') and filters['search'].lower() not in record['url'].lower():
+        return False
+    if filters.get('risk_category') and record['risk_category'] != filters['risk_category']:
+        return False
+    if filters.get('date_from') and record['timestamp'] < filters['date_from']:
+        return False
+    if filters.get('date_to') and record['timestamp'] > f"{filters['date_to']} 00:00:00":
+        return False
+    if filters.get('cluster') and str(record.get('cluster_id')) != filters['cluster']:
+        return False
+    # Arkiverte analyser fra før snapshots mangler 'changed' og regnes som endret
+    if filters.get('changed') and record.get('changed') is False:
+        return False
+    return True
+
+
+class AnalysisArchive:
+    """
+    Kalde analyser i komprimerte, uforanderlige månedsfiler (gzip JSON Lines).
+    Hver arkivering skriver nye delfiler; eksisterende filer endres aldri, og bare
+    filer registrert i ArchivePartition leses.
+    """
+
+    def __init__(self, archive_dir: str, cache_months: int = 4):
+        self.archive_dir = archive_dir
+        self.cache_months = cache_months
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def partitions(self) -> Dict[str, List[str]]:
+        """Måned -> filnavn for alle committede arkivfiler"""
+        months = {}
+        for month, filename in db.session.query(ArchivePartition.month, ArchivePartition.filename) \
+                .order_by(ArchivePartition.month, ArchivePartition.first_id):
+            months.setdefault(month, []).append(filename)
+        return months
+
+    def write_partition(self, month: str, records: List[Dict]) -> str:
+        """Skriver en ny delfil for måneden og returnerer filnavnet"""
+        filename = f"analysis-{month}.{records[0]['id']}-{records[-1]['id']}.jsonl.gz"
+        path = os.path.join(self.archive_dir, filename)
+        tmp_path = f'{path}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write('\n')
+        os.replace(tmp_path, path)
+        return filename
+
+    def remove(self, filename: str):
+        path = os.path.join(self.archive_dir, filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def read_month(self, filenames: List[str]) -> List[Dict]:
+        """Alle analyser i månedens filer, nyeste først (de sist brukte månedene caches)"""
+        key = tuple(filenames)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        records = []
+        for filename in filenames:
+            with gzip.open(os.path.join(self.archive_dir, filename), 'rt', encoding='utf-8') as f:
+                records.extend(json.loads(line) for line in f)
+        records.sort(key=lambda record: (record['timestamp'], record['id']), reverse=True)
+
+        with self._lock:
+            self._cache[key] = records
+            while len(self._cache) > self.cache_months:
+                self._cache.popitem(last=False)
+        return records
+
+    def iter_records(self, filters: Optional[Dict] = None) -> Iterator[Dict]:
+        """Arkiverte analyser som matcher filteret, nyeste først; leser bare aktuelle måneder"""
+        filters = filters or {}
+        for month, filenames in sorted(self.partitions().items(), reverse=True):
+            if filters.get('date_from') and month < filters['date_from'][:7]:
+                break
+            if filters.get('date_to') and month > filters['date_to'][:7]:
+                continue
+            records = self.read_month(filenames)
+            # Klynge-IDene i filene kan være utdatert etter at klyngene er bygget på nytt
+            moved = archived_cluster_ids(min(record['id'] for record in records),
+                                         max(record['id'] for record in records)) if records else {}
+            for record in records:
+                if record['id'] in moved:
+                    record = dict(record, cluster_id=moved[record['id']])
+                if matches_filters(record, filters):
+                    yield record
+
+
+def archive_horizon() -> Optional[date]:
+    """Siste dag med arkiverte analyser; alt nyere ligger i Analysis-tabellen"""
+    return db.session.query(func.max(AnalysisDailyAggregate.day)).scalar()
+
+
+def archive_needed(filters: Dict) -> bool:
+    """Om datointervallet kan inneholde arkiverte analyser"""
+    horizon = archive_horizon()
+    if horizon is None:
+        return False
+    return not filters.get('date_from') or filters['date_from'] <= horizon.isoformat()
+
+
+def archived_aggregates(archive: AnalysisArchive, filters: Dict) -> List[Dict]:
+    """Dagsaggregater for arkiverte analyser som matcher filteret"""
+    if not archive_needed(filters):
+        return []
+    if filters.get('search') or filters.get('cluster') or filters.get('changed'):
+        # Fritekstsøk, klynge- og endringsfilter kan ikke besvares fra aggregatene
+        return aggregate_records(archive.iter_records(filters))
+    query = AnalysisDailyAggregate.query
+    if filters.get('risk_category'):
+        query = query.filter(AnalysisDailyAggregate.risk_category == filters['risk_category'])
+    if filters.get('date_from'):
+        query = query.filter(AnalysisDailyAggregate.day >= datetime.strptime(filters['date_from'], '%Y-%m-%d').date())
+    if filters.get('date_to'):
+        query = query.filter(AnalysisDailyAggregate.day < datetime.strptime(filters['date_to'], '%Y-%m-%d').date())
+    return [aggregate.to_dict() for aggregate in query]
+
+
+def paginate_analyses(archive: AnalysisArchive, hot_query, filters: Dict, page: int, per_page: int,
+                      archived: List[Dict]) -> Pagination:
+    """
+    Sider over Analysis-tabellen etterfulgt av arkivet. Arkiverte analyser er alltid eldre
+    enn de i tabellen, så nyeste-først-rekkefølgen blir den samme som i én tabell.
+    """
+    hot_total = hot_query.order_by(None).count()
+    archived_total = sum(aggregate['count'] for aggregate in archived)
+    start = (page - 1) * per_page
+    items = []
+    if start < hot_total:
+        items = [a.to_dict() for a in hot_query.order_by(Analysis.timestamp.desc())
+                 .offset(start).limit(per_page)]
+    if len(items) < per_page and archived_total:
+        skip = max(0, start - hot_total)
+        items.extend(islice(archive.iter_records(filters), skip, skip + per_page - len(items)))
+    return Pagination(None, page, per_page, hot_total + archived_total, items)
+
+
+def all_analyses(archive: AnalysisArchive, hot_query, filters: Dict) -> List[Dict]:
+    """Alle analyser som matcher filteret, nyeste først, inkludert arkivet når intervallet krever det"""
+    analyses = [a.to_dict() for a in hot_query.order_by(Analysis.timestamp.desc())]
+    if archive_needed(filters):
+        analyses.extend(archive.iter_records(filters))
+    return analyses
+
+
+def archive_old_analyses(archive: AnalysisArchive, max_age_days: int, batch_size: int = 50000) -> Dict:
+    """
+    Flytter analyser eldre enn max_age_days (hele dager) til månedsarkivet. Filene skrives
+    først; registreringen, dagsaggregatene og slettingen committes i én transaksjon.
+    """
+    cutoff = datetime.combine(datetime.utcnow().date() - timedelta(days=max_age_days), datetime.min.time())
+    archived_rows = 0
+    files = []
+    while True:
+        rows = Analysis.query.filter(Analysis.timestamp < cutoff) \
+            .order_by(Analysis.timestamp, Analysis.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row.timestamp.strftime('%Y-%m'), []).append(row.to_dict())
+
+        written = []
+        try:
+            for month, records in by_month.items():
+                records.sort(key=lambda record: record['id'])
+                filename = archive.write_partition(month, records)
+                written.append(filename)
+                db.session.add(ArchivePartition(
+                    month=month, filename=filename, first_id=records[0]['id'],
+                    last_id=records[-1]['id'], row_count=len(records)
+                ))
+
+            _merge_daily_aggregates(aggregate_records(
+                record for records in by_month.values() for record in records
+            ))
+
+            ids = [row.id for row in rows]
+            for i in range(0, len(ids), 500):
+                Analysis.query.filter(Analysis.id.in_(ids[i:i + 500])).delete(synchronize_session=False)
+            # Verdiktene ligger i arkivfilene; snapshots uten gjenværende analyser slettes
+            prune_snapshots()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for filename in written:
+                archive.remove(filename)
+            raise
+
+        # Slipp de arkiverte radene så minnebruken holder seg til én batch
+        db.session.expunge_all()
+        archived_rows += len(rows)
+        files.extend(written)
+        print(f"Arkiverte {len(rows)} analyser til {', '.join(written)}")
+
+    return {
+        'archived': archived_rows,
+        'files': files,
+        'cutoff': cutoff.strftime(TIMESTAMP_FORMAT)
+    }
+
+
+def _merge_daily_aggregates(aggregates: List[Dict]):
+    for aggregate in aggregates:
+        row = AnalysisDailyAggregate.query.get((aggregate['day'], aggregate['risk_category'] or ''))
+        if row is None:
+            row = AnalysisDailyAggregate(
+                day=aggregate['day'], risk_category=aggregate['risk_category'] or '',
+                count=0, mitre_score_sum=0.0, mitre_score_count=0, technique_counts={}
+            )
+            db.session.add(row)
+        row.count += aggregate['count']
+        row.mitre_score_sum += aggregate['mitre_score_sum']
+        row.mitre_score_count += aggregate['mitre_score_count']
+        # Ny dict slik at JSON-kolonnen oppdages som endret
+        technique_counts = dict(row.technique_counts or {})
+        for tech, count in aggregate['technique_counts'].items():
+            technique_counts[tech] = technique_counts.get(tech, 0) + count
+        row.technique_counts = technique_counts
+
+
+def retention_status() -> Dict:
+    horizon = archive_horizon()
+    partitions = ArchivePartition.query.order_by(ArchivePartition.month).all()
+    return {
+        'horizon': horizon.isoformat() if horizon else None,
+        'hot_rows': Analysis.query.count(),
+        'archived_rows': sum(partition.row_count for partition in partitions),
+        'partitions': [partition.to_dict() for partition in partitions]
+    }
+
+
+def vacuum_database():
+    """Gir plassen fra slettede rader tilbake til filsystemet (bare SQLite)"""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('VACUUM'))
+    return True
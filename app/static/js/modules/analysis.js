@@ -1,4 +1,5 @@
-import { renderResults, renderSummary } from './ui.js';
+import { renderResults, renderSummary, replacePendingCard } from './ui.js';
+import { loadTechniques } from './mitre.js';
 import { showError } from './utils.js';
 
 export const handleAnalysis = async (urls) => {
@@ -8,7 +9,9 @@ export const handleAnalysis = async (urls) => {
             headers: {
                 'Content-Type': 'application/x-www-form-urlencoded',
             },
-            body: `urls=${encodeURIComponent(urls)}`
+            // Kompakt svar: bare teknikk-IDer, ordboken hentes separat og caches.
+            // Det som ikke er ferdig etter ANALYZE_DEADLINE_SECONDS kommer som 'pending'.
+            body: `urls=${encodeURIComponent(urls)}&compact=1&deadline=${ANALYZE_DEADLINE_SECONDS}`
         });
         
         if (!response.ok) {
@@ -19,11 +22,52 @@ export const handleAnalysis = async (urls) => {
         const data = await response.json();
         console.log('Full response data:', data);
         
+        await loadTechniques(data.techniques_version);
         renderResults(data);
         renderSummary(data.summary);
         
+        data.results
+            .filter(result => result.status === 'pending')
+            .forEach(result => pollPending(result.handle));
+        
     } catch (error) {
         console.error('Error:', error);
         showError(error.message);
     }
+};
+
+const ANALYZE_DEADLINE_SECONDS = 15;
+const PENDING_POLL_MS = 3000;
+// Etter så mange forsøk (5 minutter) slutter vi å spørre; resultatet havner i historikken
+const PENDING_MAX_POLLS = 100;
+
+// Henter resultatet for en analyse som fullføres i bakgrunnen til den er ferdig
+const pollPending = async (handle, attempt = 1) => {
+    try {
+        const response = await fetch(`/analyze/pending/${encodeURIComponent(handle)}?compact=1`);
+        if (!response.ok) return;
+        const pending = await response.json();
+        
+        if (pending.status === 'pending' && attempt < PENDING_MAX_POLLS) {
+            setTimeout(() => pollPending(handle, attempt + 1), PENDING_POLL_MS);
+        } else if (pending.status === 'pending') {
+            replacePendingCard(handle, {
+                url: pending.url,
+                risk_category: 'UKJENT',
+                risk_score: 'N/A',
+                action_required: 'Analysen tar lang tid - se historikken senere'
+            });
+        } else if (pending.status === 'completed') {
+            replacePendingCard(handle, pending.result);
+        } else {
+            replacePendingCard(handle, {
+                url: pending.url,
+                risk_category: 'FEIL',
+                risk_score: 'N/A',
+                action_required: `Analyse feilet - ${pending.error_message}`
+            });
+        }
+    } catch (error) {
+        console.error('Error:', error);
+    }
 }; 
\ No newline at end of file
@@ -1,13 +1,65 @@
+const TECHNIQUES_STORAGE_KEY = 'mitre-techniques';
+
+// Teknikkordboken lastes én gang per versjon og gjenbrukes for alle resultater
+let techniqueDictionary = { version: null, techniques: {} };
+
+const readStoredTechniques = () => {
+    try {
+        return JSON.parse(localStorage.getItem(TECHNIQUES_STORAGE_KEY));
+    } catch (error) {
+        return null;
+    }
+};
+
+export const loadTechniques = async (version) => {
+    if (!version || techniqueDictionary.version === version) return;
+    
+    const stored = readStoredTechniques();
+    if (stored && stored.version === version) {
+        techniqueDictionary = stored;
+        return;
+    }
+    
+    // Versjonert URL caches også av nettleseren (immutable)
+    const response = await fetch(`/api/mitre/techniques/${encodeURIComponent(version)}`);
+    if (!response.ok) return;
+    techniqueDictionary = await response.json();
+    try {
+        localStorage.setItem(TECHNIQUES_STORAGE_KEY, JSON.stringify(techniqueDictionary));
+    } catch (error) {
+        // Fullt localStorage: ordboken holdes bare i minnet
+    }
+};
+
+// Kompakte resultater har bare teknikk-IDer; navn og beskrivelse slås opp i ordboken
+const resolveMitreDetails = (result) => {
+    if (result.mitre_details) return result.mitre_details;
+    if (!result.mitre_analysis) return null;
+    
+    return {
+        techniques: result.mitre_analysis.techniques.map(id => ({
+            id,
+            name: 'Unknown name',
+            description: 'Unknown description',
+            tactics: [],
+            ...techniqueDictionary.techniques[id]
+        })),
+        tactics: result.mitre_analysis.tactics,
+        risk_score: result.mitre_analysis.risk_score
+    };
+};
+
 export const generateMitreAnalysis = (result) => {
-    if (!result.mitre_details) return '<p class="text-muted">Ingen MITRE ATT&CK analyse tilgjengelig</p>';
+    const mitreDetails = resolveMitreDetails(result);
+    if (!mitreDetails) return '<p class="text-muted">Ingen MITRE ATT&CK analyse tilgjengelig</p>';
     
     return `
         <div class="mitre-analysis mt-3">
             <h4 class="text-primary">MITRE ATT&CK Analyse</h4>
             
-            ${generateTechniquesSection(result.mitre_details)}
-            ${generateTacticsSection(result.mitre_details)}
-            ${generateRiskScore(result.mitre_details)}
+            ${generateTechniquesSection(mitreDetails)}
+            ${generateTacticsSection(mitreDetails)}
+            ${generateRiskScore(mitreDetails)}
         </div>
     `;
 };
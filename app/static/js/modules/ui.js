@@ -24,14 +24,21 @@ export const renderSummary = (summary) => {
     `;
 };
 
+// Erstatter kortet for en analyse som ble fullført i bakgrunnen
+export const replacePendingCard = (handle, result) => {
+    const card = document.getElementById(`pending-${handle}`);
+    if (card) card.outerHTML = generateResultCard(result);
+};
+
 const generateResultCard = (result) => {
     return `
-        <div class="card result-card risk-${result.risk_category}">
+        <div class="card result-card risk-${result.risk_category}"${result.handle ? ` id="pending-${result.handle}"` : ''}>
             <div class="card-body">
                 <h5 class="card-title">${result.url}</h5>
                 <p>Risk Category: ${result.risk_category}</p>
                 <p>Risk Score: ${result.risk_score}</p>
                 <p>Action Required: ${result.action_required}</p>
+                ${result.lexical_score !== undefined ? `<p>Forhåndsscore: ${result.lexical_score}</p>` : ''}
                 ${result.permalink ? `<a href="${result.permalink}" target="_blank">View on VirusTotal</a>` : ''}
                 
                 ${generateMitreAnalysis(result)}
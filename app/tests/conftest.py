@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modulene importeres som fra app-mappen (analyzers.*, models, ...), slik appen selv kjøres
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
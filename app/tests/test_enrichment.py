@@ -0,0 +1,46 @@
+import threading
+import time
+
+from analyzers.enrichment import EnrichmentPipeline, EnrichmentStage
+
+
+class HangingStage(EnrichmentStage):
+    name = 'hanging'
+    inputs = ('host',)
+    outputs = ('ip_addresses',)
+
+    def __init__(self, release, **options):
+        super().__init__(**options)
+        self.release = release
+
+    def run(self, values):
+        self.release.wait(5)
+        return {'ip_addresses': ['192.0.2.1']}
+
+
+class DependentStage(EnrichmentStage):
+    name = 'dependent'
+    inputs = ('ip_addresses',)
+    outputs = ('historic_ips',)
+
+    def run(self, values):
+        return {'historic_ips': values['ip_addresses']}
+
+
+def test_timed_out_stage_returns_within_its_timeout():
+    release = threading.Event()
+    pipeline = EnrichmentPipeline([HangingStage(release, timeout=0.1, cache_ttl=0), DependentStage(cache_ttl=0)])
+    try:
+        started = time.perf_counter()
+        result = pipeline.enrich('http://example.com/')
+        wall = time.perf_counter() - started
+    finally:
+        release.set()
+        pipeline.executor.shutdown(wait=True)
+
+    assert wall < 0.5
+    stages = result['enrichment']['stages']
+    assert stages['hanging']['status'] == 'timeout'
+    assert stages['dependent']['status'] == 'skipped'
+    assert 'ip_addresses' not in result
+    assert result['enrichment']['elapsed_ms'] <= wall * 1000